@@ -1,49 +1,247 @@
 import re
-from collections import defaultdict
+import json
+import os
+from collections import defaultdict, deque
+from itertools import chain
+from typing import NamedTuple
 import argparse
 
+from chat_shards import iter_shard_events
+from metrics import METRICS_HELP, METRICS_USAGE, add_metrics_arguments, stage_metrics
+
 class CustomArgumentParser(argparse.ArgumentParser):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
     def print_help(self, file=None):
         # 自訂顯示的幫助訊息
-        help_message = f"""使用方法: {self.prog} [-h] -I 輸入檔案 -O 輸出檔案
+        help_message = f"""使用方法: {self.prog} [-h] -I 輸入檔案 [輸入檔案 ...] -O 輸出檔案 [-T 事件分類檔] [-J 行程數 [--shard-mb 每段大小]] {METRICS_USAGE}
 
 從聊天記錄中提取並格式化事件資訊
 
 選項:
   -h, --help            顯示此幫助訊息並退出
-  -I INPUT, --input INPUT
-                        包含聊天記錄的輸入檔案。
+  -I INPUT [INPUT ...], --input INPUT [INPUT ...]
+                        包含聊天記錄的輸入檔案，可提供多個檔案，依序合併為一份摘要。
   -O OUTPUT, --output OUTPUT
                         儲存格式化事件摘要的輸出檔案。
+  -T TAXONOMY, --taxonomy TAXONOMY
+                        事件分類檔 (JSON 格式)，定義每種事件類型的同義詞。
+  -J JOBS, --jobs JOBS  解析聊天記錄使用的行程數 (預設 1，依序解析；0 為 CPU 核心數)，
+                        大於 1 時在日期行將檔案切段，交給多個行程同時解析，摘要與依序解析完全相同
+  --shard-mb SHARD_MB   切段時每段的大小 (MB，預設 16)
+{METRICS_HELP}
         """
         print(help_message, file=file)
 
-def parse_events(chat_content):
+# 預先編譯的正規表達式，避免每一行都重新查詢快取
+# 日期行 (例如：2024/11/08, Fri) 或訊息開頭 (例如：11:34 AM<TAB>阿旭<TAB>訊息內容，系統訊息的發送者為空白)，
+# 合併成單一表達式讓每一行只需比對一次
+LINE_PATTERN = re.compile(
+    r'^(?:(\d{4}/\d{2}/\d{2}),|(\d{2}:\d{2} (?:AM|PM))\t(.*?)\t(.*))')
+
+# 未提供事件分類檔時使用的預設分類：事件類型 -> 同義詞
+DEFAULT_TAXONOMY = {
+    '落石': ['落石'],
+    '停電': ['停電'],
+}
+
+
+class ChatMessage(NamedTuple):
+    """一則完整的聊天訊息，跨越多個實體行的引號訊息會合併為一筆。"""
+    date: str
+    time: str
+    sender: str
+    text: str
+
+
+class KeywordMatcher:
     """
-    解析聊天內容，提取特定事件的日期和描述。
-    回傳以日期和事件類型為索引的事件字典。
+    多關鍵字比對器 (Aho–Corasick)：將所有關鍵字建成一棵字首樹 (trie)，並加上失敗連結與輸出集合，
+    逐字掃描一次文字即可找出所有出現的關鍵字 (包含重疊與互相包含的關鍵字，例如「大停電」與「停電」)，
+    每個字元的成本只與狀態轉移有關，不隨關鍵字數量增加。
+    絕大多數的字元不是任何關鍵字的第一個字，位於根狀態時以所有關鍵字首字組成的字元集合 (正規表達式)
+    直接跳到下一個可能的起點，查詢字元集合的成本同樣不隨關鍵字數量增加。
+    """
+
+    def __init__(self, keywords):
+        self.keywords = [keyword for keyword in dict.fromkeys(keywords) if keyword]
+        self._order = {keyword: index for index, keyword in enumerate(self.keywords)}
+
+        # 字首樹：每個狀態的轉移 (字元 -> 狀態) 與在此結束的關鍵字，狀態 0 為根
+        self._goto = [{}]
+        self._outputs = [set()]
+        for keyword in self.keywords:
+            state = 0
+            for character in keyword:
+                next_state = self._goto[state].get(character)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][character] = next_state
+                    self._goto.append({})
+                    self._outputs.append(set())
+                state = next_state
+            self._outputs[state].add(keyword)
+        self._start = re.compile('[' + ''.join(re.escape(character) for character in self._goto[0]) + ']')
+
+        # 依廣度優先建立失敗連結 (最長的真後綴所在的狀態)，並將失敗狀態的輸出併入，
+        # 因此到達一個狀態時，以該位置結尾的所有關鍵字都已在輸出集合中
+        self._fail = [0] * len(self._goto)
+        pending = deque(self._goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for character, next_state in self._goto[state].items():
+                pending.append(next_state)
+                fallback = self._fail[state]
+                while fallback and character not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(character, 0)
+                self._outputs[next_state] |= self._outputs[self._fail[next_state]]
+
+    def find_all(self, text):
+        """回傳文字中出現的關鍵字，依建立時的關鍵字順序排列。"""
+        if not self.keywords:
+            return []
+        goto, fail, outputs, start = self._goto, self._fail, self._outputs, self._start
+        found = set()
+        state = 0
+        position, length = 0, len(text)
+        while position < length:
+            if not state:
+                match = start.search(text, position)
+                if match is None:
+                    break
+                position = match.start()
+            character = text[position]
+            while state and character not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(character, 0)
+            if outputs[state]:
+                found |= outputs[state]
+            position += 1
+        return sorted(found, key=self._order.__getitem__)
+
+
+class EventClassifier:
+    """依事件分類檔將文字歸類為一或多個事件類型，事件類型本身也視為同義詞。"""
+
+    def __init__(self, taxonomy=DEFAULT_TAXONOMY):
+        self.event_types = list(taxonomy)
+        self._event_types_by_keyword = defaultdict(list)
+        for event_type, synonyms in taxonomy.items():
+            for keyword in [event_type, *synonyms]:
+                if event_type not in self._event_types_by_keyword[keyword]:
+                    self._event_types_by_keyword[keyword].append(event_type)
+        self._matcher = KeywordMatcher(self._event_types_by_keyword)
+        self._order = {event_type: index for index, event_type in enumerate(self.event_types)}
+
+    def classify(self, text):
+        """回傳文字所屬的事件類型，依分類檔中的順序排列。"""
+        keywords = self._matcher.find_all(text)
+        if not keywords:
+            return []
+        event_types = {
+            event_type
+            for keyword in keywords
+            for event_type in self._event_types_by_keyword[keyword]
+        }
+        return sorted(event_types, key=self._order.__getitem__)
+
+
+def load_taxonomy(filepath):
+    """讀取事件分類檔 (JSON 格式)，格式為 {事件類型: [同義詞, ...]}。"""
+    with open(filepath, 'r', encoding='utf-8') as file:
+        taxonomy = json.load(file)
+    if not isinstance(taxonomy, dict) or not all(
+            isinstance(synonyms, list) for synonyms in taxonomy.values()):
+        raise ValueError(f"事件分類檔格式錯誤：{filepath}")
+    return taxonomy
+
+
+def iter_messages(lines):
+    """
+    逐行組合聊天訊息的產生器，每完成一則訊息即產出 ChatMessage。
+    不屬於日期行或訊息開頭的行視為上一則訊息的延續，因此多行的引號訊息會保留發送者與時間。
     """
-    events_by_date = defaultdict(lambda: defaultdict(list))
     current_date = None
-    target_event_types = ['落石', '停電']
-    
-    # 逐行處理聊天內容
-    for line in chat_content.splitlines():
-        # 檢查是否為日期行，例如：2024/11/08
-        date_match = re.match(r'^(\d{4}/\d{2}/\d{2}),', line)
-        if date_match:
-            current_date = date_match.group(1)
-        elif current_date:
-            # 根據事件類型提取事件描述
-            for event_type in target_event_types:
-                if event_type in line:
-                    event_details = re.sub(r'\d{2}:\d{2} (AM|PM)\t.*?\t', '', line).strip()
-                    events_by_date[current_date][event_type].append(event_details)
+    pending = None  # [時間, 發送者, 各行文字]
+
+    for line in lines:
+        line = line.rstrip('\r\n')
+        line_match = LINE_PATTERN.match(line)
+        if line_match is None:
+            # 不是日期行也不是訊息開頭，視為上一則訊息的延續
+            if pending:
+                pending[2].append(line)
+            continue
+
+        if pending:
+            yield ChatMessage(current_date, pending[0], pending[1], '\n'.join(pending[2]))
+            pending = None
+        date, time, sender, text = line_match.groups()
+        if date:
+            current_date = date
+        elif current_date is not None:
+            # 日期行之前的內容為檔案標題資訊，不屬於任何日期
+            pending = [time, sender, [text]]
+
+    if pending:
+        yield ChatMessage(current_date, pending[0], pending[1], '\n'.join(pending[2]))
+
+
+def iter_events(lines, taxonomy=DEFAULT_TAXONOMY):
+    """
+    以訊息為單位處理聊天內容的產生器，每找到一筆事件即產出 (日期, 事件類型, 事件描述)。
+    lines 可以是任何可迭代的字串來源，例如開啟中的檔案，因此不需要將整個檔案讀入記憶體。
+    """
+    classifier = EventClassifier(taxonomy)
+
+    for message in iter_messages(lines):
+        event_types = classifier.classify(message.text)
+        if event_types:
+            # 合併多行訊息為單行，讓摘要維持每個日期、事件類型一行的格式
+            event_details = ' '.join(
+                part for part in (segment.strip() for segment in message.text.splitlines()) if part)
+            for event_type in event_types:
+                yield message.date, event_type, event_details
+
+
+def collect_events(events):
+    """將 (日期, 事件類型, 事件描述) 序列整理成以日期和事件類型為索引的事件字典。"""
+    events_by_date = defaultdict(lambda: defaultdict(list))
+    for date, event_type, event_details in events:
+        events_by_date[date][event_type].append(event_details)
     return events_by_date
 
+
+def merge_shard_events(shard_results, metrics=None):
+    """
+    依順序合併各段的 (事件字典, 行數)，日期、事件類型與事件描述的順序都與依序解析整個檔案相同；
+    同一日期出現在多段時 (例如多個檔案)，事件描述依段的順序接在後面。提供 metrics 時累計讀取的行數。
+    """
+    events_by_date = defaultdict(lambda: defaultdict(list))
+    for shard_events, line_count in shard_results:
+        for date, event_types in shard_events.items():
+            for event_type, details in event_types.items():
+                events_by_date[date][event_type].extend(details)
+        if metrics is not None:
+            metrics.add_rows(rows_in=line_count)
+    return events_by_date
+
+
+def parse_events(chat_content, taxonomy=DEFAULT_TAXONOMY):
+    """
+    解析聊天內容，提取特定事件的日期和描述。
+    回傳以日期和事件類型為索引的事件字典。
+    """
+    return collect_events(iter_events(chat_content.splitlines(), taxonomy))
+
+
+def stream_file_events(filepath, taxonomy=DEFAULT_TAXONOMY, metrics=None):
+    """以串流方式逐行讀取聊天記錄檔案，並產出其中的事件；提供 metrics 時累計讀取的行數。"""
+    with open(filepath, 'r', encoding='utf-8') as file:
+        yield from iter_events(metrics.counted(file) if metrics is not None else file, taxonomy)
+
 def format_event_summary(events_by_date):
     """
     格式化事件字典，生成指定格式的事件摘要。
@@ -64,21 +262,36 @@ def write_file(filepath, content):
     with open(filepath, 'w', encoding='utf-8') as file:
         file.write(content)
 
-def main():
+def main(argv=None):
     # 使用自訂的 ArgumentParser 類別
     parser = CustomArgumentParser(description="從聊天記錄中提取並格式化事件資訊。")
-    parser.add_argument('-I', '--input', required=True, help='包含聊天記錄的輸入檔案。')
+    parser.add_argument('-I', '--input', required=True, nargs='+',
+                        help='包含聊天記錄的輸入檔案，可提供多個檔案，依序合併為一份摘要。')
     parser.add_argument('-O', '--output', required=True, help='儲存格式化事件摘要的輸出檔案。')
-    
-    args = parser.parse_args()
+    parser.add_argument('-T', '--taxonomy', help='事件分類檔 (JSON 格式)，定義每種事件類型的同義詞。')
+    parser.add_argument('-J', '--jobs', type=int, default=1, help='解析聊天記錄使用的行程數 (0 為 CPU 核心數)。')
+    parser.add_argument('--shard-mb', type=float, default=16, help='切段時每段的大小 (MB)。')
+    add_metrics_arguments(parser)
+
+    args = parser.parse_args(argv)
+    if args.jobs < 0 or args.shard_mb <= 0:
+        parser.error("--jobs 不能小於 0，--shard-mb 必須大於 0")
+    jobs = args.jobs or os.cpu_count() or 1
 
-    # 執行事件提取和格式化
-    chat_content = read_file(args.input)
-    events_by_date = parse_events(chat_content)
-    formatted_event_summary = format_event_summary(events_by_date)
+    with stage_metrics('01', args) as metrics:
+        # 執行事件提取和格式化
+        taxonomy = load_taxonomy(args.taxonomy) if args.taxonomy else DEFAULT_TAXONOMY
+        if jobs == 1:
+            events_by_date = collect_events(chain.from_iterable(
+                stream_file_events(path, taxonomy, metrics) for path in args.input))
+        else:
+            events_by_date = merge_shard_events(
+                iter_shard_events(args.input, taxonomy, jobs, int(args.shard_mb * 1024 * 1024)), metrics)
+        formatted_event_summary = format_event_summary(events_by_date)
 
-    # 將事件摘要寫入輸出檔案
-    write_file(args.output, formatted_event_summary)
+        # 將事件摘要寫入輸出檔案
+        write_file(args.output, formatted_event_summary)
+        metrics.add_rows(rows_out=sum(len(event_types) for event_types in events_by_date.values()))
     print(f'事件摘要已儲存到 {args.output}')
 
 if __name__ == "__main__":
@@ -1,8 +1,29 @@
 import argparse
+import csv
+import hashlib
+import io
 import os
+import queue
+import re
 import json
-import google.generativeai as genai
-import openai
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from event_schema import (STRUCTURED_INSTRUCTION, csv_fields, parse_json_events, rows_to_json,
+                          structured_output_enabled, validate_event)
+from event_store import event_frame, is_event_store, store_available, write_event_store
+from llm_batch import OpenAIBatchBackend, build_batch_lines, run_batch
+from llm_cache import ResponseCache, with_cache, with_cache_refresh, with_cache_stream
+from llm_providers import create_provider
+from metrics import METRICS_HELP, METRICS_USAGE, add_metrics_arguments, stage_metrics
+from prompt_builder import CSV_HEADER, PromptBuilder, estimate_tokens, normalize_date, summary_event_types
+from rule_extractor import Gazetteer, RuleExtractor, bypass_report, load_taxonomy, merge_rows
+
+
+# 模型有時會將表格包在 Markdown 程式碼區塊中，例如 ```csv ... ```
+CODE_FENCE_PATTERN = re.compile(r'^\s*```')
+# 串流模式未指定 -C 時每批輸入的 token 上限：每批收完後才驗證、寫入並記錄進度，不分批時要等到全部完成才會寫入
+STREAM_CHUNK_TOKENS = 2000
 
 
 class CustomArgumentParser(argparse.ArgumentParser):
@@ -11,7 +32,7 @@ class CustomArgumentParser(argparse.ArgumentParser):
 
     def print_help(self, file=None):
         # 自訂顯示的幫助訊息
-        help_message = f"""使用方法: {self.prog} [-h] -K 金鑰 -L 大語言模型 -S 系統設定檔 -H 對話記錄檔案 -I 輸入檔案 -O 輸出檔案 -P API供應商{{google或openai}}
+        help_message = f"""使用方法: {self.prog} [-h] -K 金鑰 -L 大語言模型 -S 系統設定檔 -H 對話記錄檔案 -I 輸入檔案 -O 輸出檔案 -P API供應商{{google或openai}} [-C 分批token上限] [-J 同時請求數] [--cache 快取檔案 | --no-cache] [-F 範例數] [--compact-instruction] [--stream [--resume] | --batch] [--max-attempts 次數] [--no-structured] [--rules [--place-db 地名數據庫] [--taxonomy 事件分類檔]] [--event-store 儲存檔.parquet] {METRICS_USAGE}
 
 使用大語言模型處理對話記錄
 
@@ -29,11 +50,386 @@ class CustomArgumentParser(argparse.ArgumentParser):
                         輸出檔案
   -P {{google,openai}}, --provider {{google,openai}}
                         選擇使用的 API 供應商 ('google' 或 'openai')
+  -C CHUNK_TOKENS, --chunk-tokens CHUNK_TOKENS
+                        依日期分批送出，每批輸入的 token 上限 (預設 0 表示不分批，串流模式為 {STREAM_CHUNK_TOKENS})
+  -J CONCURRENCY, --concurrency CONCURRENCY
+                        分批模式下同時送出的請求數 (預設 4)
+  --cache CACHE         回應快取檔案 (SQLite，預設 llm_cache.sqlite)
+  --no-cache            不使用回應快取，所有請求都呼叫 API
+  --cache-max-mb CACHE_MAX_MB
+                        快取大小上限 (MB，預設 256)
+  --cache-max-age-days CACHE_MAX_AGE_DAYS
+                        快取保存天數 (預設 30)
+  -F FEW_SHOT, --few-shot FEW_SHOT
+                        每個請求只挑選最相關的單日範例數量 (預設 0 表示送出完整對話歷史)
+  --compact-instruction
+                        移除系統指令中與對話歷史重複的完整範例
+  --stream              以串流方式接收回應，每批收完後驗證並寫入輸出檔案，驗證失敗的批次會重新請求
+                        (一定會分批，未指定 -C 時每批 {STREAM_CHUNK_TOKENS} tokens)
+  --resume              串流模式下從上次中斷時最後完成的日期繼續
+  --batch               以 Batch API 送出所有批次並等待完成 (目前僅支援 openai)
+  --max-attempts MAX_ATTEMPTS
+                        每批回應驗證失敗時，單獨重新請求該批次，最多共請求的次數 (預設 3)
+  --no-structured       不使用供應商的結構化輸出 (JSON schema)，改為要求 CSV 表格
+                        (與系統設定檔中 "structured_output": false 相同)
+  --rules               先以規則處理格式固定的摘要行 (例如「楓墅停電了」「台7線37.7K落石已排除」)，
+                        只將其他摘要行送給大語言模型 (不能與 --stream 同時使用)
+  --place-db PLACE_DB   規則辨識地點使用的地名數據庫 (預設 place_db.csv)
+  --taxonomy TAXONOMY   規則辨識關鍵字使用的事件分類檔 (預設 event_taxonomy.json)
+  --event-store EVENT_STORE
+                        寫入事件日誌後，另外寫入事件儲存檔 (.parquet，需要 pyarrow)，
+                        03、04、06 階段以此檔案作為輸入時不需要再解析 CSV
+{METRICS_HELP}
         """
         print(help_message, file=file)
 
 
-def main():
+def split_summary_by_day(summary):
+    """
+    將事件摘要依日期切分，回傳 [(日期, 該日期的摘要文字), ...]，順序與原檔相同。
+    摘要每行的格式為「日期，事件類型，事件描述」，同一日期的多行會歸在同一組。
+    """
+    days = []
+    for line in summary.splitlines():
+        if not line.strip():
+            continue
+        date = line.split('，', 1)[0]
+        if days and days[-1][0] == date:
+            days[-1][1].append(line)
+        else:
+            days.append((date, [line]))
+    return [(date, '\n'.join(lines)) for date, lines in days]
+
+
+def build_chunks(days, max_tokens):
+    """
+    將依日期切分的摘要依序合併成多個批次，每批的估計 token 數不超過 max_tokens。
+    同一天的內容不會被拆開，單日超過上限時自成一批。
+    """
+    chunks = []
+    current, current_tokens = [], 0
+    for _, text in days:
+        tokens = estimate_tokens(text)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append('\n'.join(current))
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        chunks.append('\n'.join(current))
+    return chunks
+
+
+def extract_chunks(send, requests, concurrency=4):
+    """
+    以執行緒池同時送出多個批次，最多 concurrency 個請求同時進行。
+    requests 為 [(輸入文字, 對話歷史), ...]，回傳的回應順序與 requests 相同，不受完成先後影響。
+    """
+    if concurrency <= 1 or len(requests) <= 1:
+        return [send(message, history) for message, history in requests]
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(lambda request: send(*request), requests))
+
+
+def parse_csv_rows(generated_message):
+    """取出模型回應中的 CSV 資料列，略過程式碼區塊標記、表頭與空行。"""
+    rows = []
+    for line in generated_message.splitlines():
+        line = line.strip()
+        if not line or CODE_FENCE_PATTERN.match(line) or line == CSV_HEADER:
+            continue
+        rows.append(line)
+    return rows
+
+
+def write_log_store(log_path, store_path):
+    """
+    由寫好的事件日誌建立事件儲存檔，回傳列數。來源雜湊為事件日誌檔案內容的 SHA-256 (與管線相同)，
+    之後以管線處理同一份事件日誌時不會重複寫入。
+    """
+    with open(log_path, 'rb') as log_file:
+        content = log_file.read()
+    frame = event_frame(parse_csv_rows(content.decode('utf-8')))
+    write_event_store(store_path, frame, hashlib.sha256(content).hexdigest())
+    return len(frame)
+
+
+def merge_csv_responses(responses):
+    """將各批次的回應依批次順序 (即日期順序) 合併為單一 CSV，只保留一個表頭。"""
+    rows = [row for response in responses for row in parse_csv_rows(response)]
+    return '\n'.join([CSV_HEADER, *rows]) + '\n'
+
+
+def batch_extract(backend, provider, requests, state_path, poll_interval=60, cache=None,
+                  key_parts=None, sleep=time.sleep):
+    """
+    以 Batch API 處理所有批次，回傳與 requests 順序相同的回應。
+    已在快取中的批次不會送出；成功的回應會存入快取，因此部分失敗時重新執行只會送出失敗的批次。
+    """
+    responses = [None] * len(requests)
+    keys = [None] * len(requests)
+    pending = []
+    for index, (message, history) in enumerate(requests):
+        if cache is not None:
+            keys[index] = cache.make_key(message=message, history=history, **key_parts)
+            responses[index] = cache.get(keys[index])
+        if responses[index] is None:
+            pending.append(index)
+
+    if pending:
+        lines = build_batch_lines(provider, [requests[index] for index in pending])
+        results, errors = run_batch(backend, lines, state_path, poll_interval, sleep)
+        failed = []
+        for index, (custom_id, _) in zip(pending, lines):
+            if custom_id in results:
+                responses[index] = results[custom_id]
+                if cache is not None:
+                    cache.put(keys[index], results[custom_id])
+            else:
+                failed.append(f"{custom_id}: {errors.get(custom_id, '沒有回應')}")
+        if failed:
+            raise RuntimeError("以下批次失敗，成功的部分已存入快取，重新執行只會送出失敗的批次：\n"
+                               + "\n".join(failed))
+    return responses
+
+
+def validate_row(line):
+    """
+    驗證一列事件資料，回傳 [日期, 事件類型, 地點, 額外說明]，格式不符時回傳 None。
+    日期統一為 YYYY-MM-DD；額外說明中未加引號的逗號會併回同一欄。
+    """
+    fields = csv_fields(line)
+    return validate_event(fields)[0] if fields is not None else None
+
+
+def parse_response(response, chunk, structured):
+    """
+    解析並驗證一個批次的回應，回傳 (資料列, 錯誤訊息)。日期與事件類型必須出現在該批次的摘要中。
+    結構化輸出的回應為 JSON；否則為 CSV 表格，格式不符的資料列記為錯誤。
+    沒有回應或回應是空白 (例如模型拒絕回應) 時記為錯誤，與格式不符的回應相同會重新請求該批次。
+    """
+    if not isinstance(response, str):
+        return [], [f"沒有回應 ({type(response).__name__})"]
+    if not response.strip():
+        return [], ["回應是空白的"]
+    dates = {normalize_date(line.split('，', 1)[0]) for line in chunk.splitlines()} - {None}
+    event_types = summary_event_types(chunk)
+    if structured:
+        return parse_json_events(response, dates, event_types)
+    rows, errors = [], []
+    for line in parse_csv_rows(response):
+        fields = csv_fields(line)
+        row, error = validate_event(fields, dates, event_types) if fields is not None else (None, "欄位不足")
+        if error:
+            errors.append(f"{error}：{line}")
+        else:
+            rows.append(row)
+    return rows, errors
+
+
+def validate_chunk(resend, request, response, structured, max_attempts=3):
+    """
+    驗證一個批次的回應，有錯誤時只重新請求這個批次 (包含第一次最多共 max_attempts 次)，其他批次不受影響。
+    回傳 (資料列, 最後一次的錯誤訊息, 重新請求次數)；仍有錯誤時保留最後一次回應中通過驗證的資料列。
+    """
+    rows, errors = parse_response(response, request[0], structured)
+    attempts = 1
+    while errors and attempts < max_attempts:
+        print(f"批次回應有 {len(errors)} 個錯誤 ({errors[0]})，重新請求這個批次")
+        rows, errors = parse_response(resend(*request), request[0], structured)
+        attempts += 1
+    return rows, errors, attempts - 1
+
+
+def extract_validated(send, resend, requests, structured, concurrency=4, max_attempts=3, responses=None):
+    """
+    送出所有批次並驗證回應，驗證失敗的批次以 resend 單獨重新請求 (同時進行，最多 concurrency 個)。
+    responses 為已取得的回應 (例如 Batch API 的結果) 時不再送出，只驗證並重新請求失敗的批次。
+    回傳 (依批次順序的資料列, 重新請求次數, 仍有錯誤的批次 [(批次索引, 錯誤訊息), ...])。
+    """
+    if responses is None:
+        responses = extract_chunks(send, requests, concurrency)
+    results = extract_chunks(
+        lambda request, response: validate_chunk(resend, request, response, structured, max_attempts),
+        list(zip(requests, responses)), concurrency)
+    rows = [row for chunk_rows, _, _ in results for row in chunk_rows]
+    retries = sum(retried for _, _, retried in results)
+    failures = [(index, errors) for index, (_, errors, _) in enumerate(results) if errors]
+    return rows, retries, failures
+
+
+def report_failures(failures, max_errors=3):
+    """顯示重新請求後仍有錯誤的批次，這些批次只寫入通過驗證的資料列。"""
+    for index, errors in failures:
+        print(f"第 {index + 1} 批仍有 {len(errors)} 個錯誤，只寫入通過驗證的資料列：" + '；'.join(errors[:max_errors]))
+
+
+def format_event_log(rows):
+    """將驗證後的資料列組成事件日誌 (CSV)，包含表頭；欄位中的逗號與引號會正確加上引號。"""
+    buffer = io.StringIO()
+    buffer.write(CSV_HEADER + '\n')
+    csv.writer(buffer, lineterminator='\n').writerows(rows)
+    return buffer.getvalue()
+
+
+class EventLogWriter:
+    """
+    以附加方式寫入事件日誌，每累積 flush_rows 列或經過 flush_seconds 秒就寫入磁碟，
+    程式中斷時已寫入的資料列不會遺失。
+    """
+
+    def __init__(self, path, append=False, flush_rows=20, flush_seconds=5.0):
+        append = append and os.path.exists(path) and os.path.getsize(path) > 0
+        self._file = open(path, 'a' if append else 'w', encoding='utf-8', newline='')
+        self._writer = csv.writer(self._file, lineterminator='\n')
+        if not append:
+            self._file.write(CSV_HEADER + '\n')
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.rows_written = 0
+        self._pending = 0
+        self._flushed_at = time.monotonic()
+
+    def write_row(self, row):
+        self._writer.writerow(row)
+        self.rows_written += 1
+        self._pending += 1
+        if self._pending >= self.flush_rows or time.monotonic() - self._flushed_at >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+        self._flushed_at = time.monotonic()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+
+def progress_path(output_path):
+    """記錄串流進度 (最後完成的日期) 的檔案路徑。"""
+    return output_path + '.progress.json'
+
+
+def load_progress(output_path):
+    """讀取上次最後完成的日期 (YYYY-MM-DD)，沒有進度記錄時回傳 None。"""
+    try:
+        with open(progress_path(output_path), 'r', encoding='utf-8') as progress_file:
+            return json.load(progress_file).get('last_completed_date')
+    except FileNotFoundError:
+        return None
+
+
+def save_progress(output_path, last_completed_date):
+    """記錄最後完成的日期，先寫入暫存檔再取代，避免中斷時留下不完整的檔案。"""
+    temporary_path = progress_path(output_path) + '.tmp'
+    with open(temporary_path, 'w', encoding='utf-8') as progress_file:
+        json.dump({'last_completed_date': last_completed_date}, progress_file)
+    os.replace(temporary_path, progress_path(output_path))
+
+
+def truncate_event_log(output_path, last_completed_date):
+    """移除事件日誌中晚於最後完成日期的資料列 (中斷時只寫了一部分的批次)。"""
+    with open(output_path, 'r', encoding='utf-8') as log_file:
+        rows = [row for row in (validate_row(line) for line in parse_csv_rows(log_file.read()))
+                if row and row[0] <= last_completed_date]
+    with open(output_path, 'w', encoding='utf-8', newline='') as log_file:
+        log_file.write(CSV_HEADER + '\n')
+        csv.writer(log_file, lineterminator='\n').writerows(rows)
+    return len(rows)
+
+
+def stream_in_order(stream, requests, concurrency=4):
+    """
+    同時以串流方式送出多個批次，並依批次順序產出 (批次索引, 文字片段)，
+    每個批次結束時產出 (批次索引, None)。
+    排在最前面的批次會即時產出片段，其餘批次的片段先暫存，輪到時再依序產出。
+    """
+    queues = [queue.Queue() for _ in requests]
+    finished = object()
+
+    def worker(index):
+        message, history = requests[index]
+        try:
+            for delta in stream(message, history):
+                queues[index].put(delta)
+            queues[index].put(finished)
+        except Exception as error:
+            queues[index].put(error)
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        for index in range(len(requests)):
+            executor.submit(worker, index)
+        for index, chunk_queue in enumerate(queues):
+            while True:
+                item = chunk_queue.get()
+                if item is finished:
+                    yield index, None
+                    break
+                if isinstance(item, Exception):
+                    # 取消尚未開始的批次，已開始的批次會在背景完成
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    raise item
+                yield index, item
+
+
+def stream_event_log(stream, days, chunk_tokens, prompt_builder, output_path, concurrency=4,
+                     resume=False, structured=False, resend=None, max_attempts=3):
+    """
+    以串流模式處理事件摘要：同時接收各批次的回應，依批次順序在每個批次收完後驗證並附加寫入事件日誌，
+    並記錄最後完成的日期，中斷後可以 resume=True 從該日期之後繼續。
+    chunk_tokens 不大於 0 時以 STREAM_CHUNK_TOKENS 分批，否則整份摘要只有一批，中斷時沒有任何已完成的日期。
+    驗證與其他模式相同 (CSV 或結構化輸出的 JSON，日期與事件類型必須出現在該批次的摘要中)，
+    驗證失敗時以 resend 單獨重新請求該批次。
+    回傳 (寫入的資料列數, 重新請求後仍格式不符而略過的資料數, 重新請求次數)。
+    """
+    last_completed_date = load_progress(output_path) if resume else None
+    if last_completed_date and os.path.exists(output_path):
+        kept = truncate_event_log(output_path, last_completed_date)
+        days = [(date, text) for date, text in days if (normalize_date(date) or '') > last_completed_date]
+        print(f"從 {last_completed_date} 之後繼續，保留已完成的 {kept} 列")
+    else:
+        resume = False
+
+    chunks = [chunk for chunk in build_chunks(days, chunk_tokens if chunk_tokens > 0 else STREAM_CHUNK_TOKENS)
+              if chunk]
+    chunk_last_dates = [normalize_date(chunk.splitlines()[-1].split('，', 1)[0]) for chunk in chunks]
+    requests = [(chunk, prompt_builder.history_for(chunk)) for chunk in chunks]
+    print(f"共 {len(chunks)} 批，同時請求數 {concurrency}，以串流方式寫入 {output_path}")
+
+    writer = EventLogWriter(output_path, append=resume)
+    skipped = retries = 0
+    responses = [[] for _ in requests]
+    try:
+        for index, delta in stream_in_order(stream, requests, concurrency):
+            if delta is not None:
+                responses[index].append(delta)
+                continue
+            # 回應不完整時無法判斷批次是否有效 (例如缺少的日期)，因此整個批次收完後才驗證
+            rows, errors, retried = validate_chunk(resend, requests[index], ''.join(responses[index]),
+                                                   structured, max_attempts)
+            responses[index] = []
+            report_failures([(index, errors)] if errors else [])
+            skipped += len(errors)
+            retries += retried
+            for row in rows:
+                writer.write_row(row)
+            writer.flush()
+            if chunk_last_dates[index]:
+                save_progress(output_path, chunk_last_dates[index])
+    finally:
+        writer.close()
+
+    # 全部完成後移除進度記錄
+    if os.path.exists(progress_path(output_path)):
+        os.remove(progress_path(output_path))
+    return writer.rows_written, skipped, retries
+
+
+def main(argv=None, metrics=None):
+    """管線中直接呼叫時傳入 metrics (metrics.StageMetrics)，統計由管線寫入。"""
     # 使用 CustomArgumentParser 處理命令列參數
     parser = CustomArgumentParser(description="使用大語言模型處理對話記錄")
 
@@ -49,93 +445,179 @@ def main():
     parser.add_argument("-O", "--output", required=True, help="輸出的檔案")
     parser.add_argument("-P", "--provider", required=True,
                         choices=['google', 'openai'], help="選擇使用的 API 供應商 ('google' 或 'openai')")
+    parser.add_argument("-C", "--chunk-tokens", type=int, default=0,
+                        help=f"依日期分批送出，每批輸入的 token 上限 (預設 0 表示不分批，串流模式為 {STREAM_CHUNK_TOKENS})")
+    parser.add_argument("-J", "--concurrency", type=int, default=4,
+                        help="分批模式下同時送出的請求數")
+    parser.add_argument("--cache", default="llm_cache.sqlite",
+                        help="回應快取檔案 (SQLite)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="不使用回應快取，所有請求都呼叫 API")
+    parser.add_argument("--cache-max-mb", type=float, default=256,
+                        help="快取大小上限 (MB)")
+    parser.add_argument("--cache-max-age-days", type=float, default=30,
+                        help="快取保存天數")
+    parser.add_argument("-F", "--few-shot", type=int, default=0,
+                        help="每個請求只挑選最相關的單日範例數量 (預設 0 表示送出完整對話歷史)")
+    parser.add_argument("--compact-instruction", action="store_true",
+                        help="移除系統指令中與對話歷史重複的完整範例")
+    parser.add_argument("--stream", action="store_true",
+                        help="以串流方式接收回應，每批收完後驗證並寫入輸出檔案")
+    parser.add_argument("--resume", action="store_true",
+                        help="串流模式下從上次中斷時最後完成的日期繼續")
+    parser.add_argument("--batch", action="store_true",
+                        help="以 Batch API 送出所有批次並等待完成 (適合大量歷史資料，目前僅支援 openai)")
+    parser.add_argument("--batch-state",
+                        help="批次狀態檔，中斷後重新執行會繼續查詢同一個批次 (預設為 輸出檔案.batch.json)")
+    parser.add_argument("--batch-poll", type=float, default=60,
+                        help="查詢批次狀態的間隔秒數")
+    parser.add_argument("--max-attempts", type=int, default=3,
+                        help="每批回應驗證失敗時，單獨重新請求該批次，最多共請求的次數")
+    parser.add_argument("--no-structured", action="store_true",
+                        help="不使用供應商的結構化輸出 (JSON schema)，改為要求 CSV 表格")
+    parser.add_argument("--rules", action="store_true",
+                        help="先以規則處理格式固定的摘要行，只將其他摘要行送給大語言模型")
+    parser.add_argument("--place-db", default="place_db.csv",
+                        help="規則辨識地點使用的地名數據庫")
+    parser.add_argument("--taxonomy", default="event_taxonomy.json",
+                        help="規則辨識關鍵字使用的事件分類檔")
+    parser.add_argument("--event-store",
+                        help="寫入事件日誌後，另外寫入事件儲存檔 (.parquet)")
+    add_metrics_arguments(parser)
+
+    args = parser.parse_args(argv)
+    if args.batch and args.stream:
+        parser.error("--batch 與 --stream 不能同時使用")
+    if args.resume and not args.stream:
+        parser.error("--resume 只能與 --stream 同時使用 (其他模式會重新產生並覆寫整個輸出檔案)")
+    if args.batch and args.provider != 'openai':
+        parser.error("--batch 目前僅支援 openai 供應商")
+    if args.rules and args.stream:
+        parser.error("--rules 不能與 --stream 同時使用 (串流模式依批次順序寫入並記錄進度)")
+    if args.event_store and not is_event_store(args.event_store):
+        parser.error("--event-store 的副檔名必須是 .parquet (各階段以副檔名判斷輸入格式)")
+    if args.event_store and not store_available():
+        parser.error("--event-store 需要安裝 pyarrow")
+
+    with stage_metrics('02', args, metrics) as metrics:
+        # 讀取系統設定檔 (JSON 格式)
+        with open(args.system, "r", encoding="utf-8") as system_file:
+            system_config = json.load(system_file)
+        if args.no_structured:
+            system_config = {**system_config, "structured_output": False}
+        # 結構化輸出時系統指令加上 JSON 格式的說明，對話歷史中的範例也改為 JSON
+        structured = structured_output_enabled(system_config)
+
+        # 讀取對話歷史 (JSON 格式)
+        with open(args.history, "r", encoding="utf-8") as history_file:
+            history = json.load(history_file)  # 假設 history 是 JSON 格式
+
+        # 讀取輸入檔案 (純文字格式)
+        with open(args.input, "r", encoding="utf-8") as input_file:
+            message = input_file.read()
+        metrics.add_rows(rows_in=sum(1 for line in message.splitlines() if line.strip()))
+
+        # 格式固定的摘要行以規則處理，只有其他摘要行需要送給大語言模型
+        summary, rule_rows = message, []
+        if args.rules:
+            extractor = RuleExtractor(Gazetteer.from_place_db(args.place_db), load_taxonomy(args.taxonomy))
+            rule_rows, message, rule_stats = extractor.split(summary)
+            print(bypass_report(rule_stats))
+            metrics.add_count('rule_bypassed_lines', rule_stats['bypassed'])
+            metrics.add_count('rule_rows', len(rule_rows))
+
+        # 依批次挑選範例並統計提示詞的 token 數量
+        prompt_builder = PromptBuilder(history, args.provider,
+                                       system_instruction=system_config.get("instruction", "")
+                                       + (STRUCTURED_INSTRUCTION if structured else ""),
+                                       max_examples=args.few_shot,
+                                       compact_instruction=args.compact_instruction,
+                                       format_output=rows_to_json if structured else None)
+        system_config = {**system_config, "instruction": prompt_builder.system_instruction}
+
+        # 根據不同的 API 供應商建立對話介面，速率限制與重試設定來自系統設定檔
+        provider = create_provider(args.provider, args.key, args.llm, system_config)
+        send = resend = provider.send
+
+        # 內容未改變的批次直接使用快取的回應，只有新增或修改的日期才會呼叫 API
+        stream = provider.stream
+        cache = None
+        if not args.no_cache:
+            cache = ResponseCache(args.cache,
+                                  max_bytes=int(args.cache_max_mb * 1024 * 1024),
+                                  max_age_days=args.cache_max_age_days)
+            key_parts = dict(provider=args.provider,
+                             model=args.llm,
+                             system_instruction=prompt_builder.system_instruction,
+                             generation_config=provider.generation_config)
+            send = with_cache(send, cache, **key_parts)
+            stream = with_cache_stream(stream, cache, **key_parts)
+            # 驗證失敗的批次重新請求時不使用快取中的回應，成功後取代快取
+            resend = with_cache_refresh(resend, cache, **key_parts)
+
+        if args.batch:
+            # 大量歷史資料不需要即時回應，改用較便宜的 Batch API
+            chunks = (build_chunks(split_summary_by_day(message), args.chunk_tokens)
+                      if args.chunk_tokens > 0 else [message] if message.strip() else [])
+            requests = [(chunk, prompt_builder.history_for(chunk)) for chunk in chunks]
+            backend = OpenAIBatchBackend(provider.client)
+            responses = batch_extract(backend, provider, requests,
+                                      args.batch_state or args.output + '.batch.json',
+                                      args.batch_poll, cache, key_parts if cache is not None else None)
+            # 驗證失敗的批次不需要再送出一個批次，直接單獨重新請求
+            rows, retries, failures = extract_validated(send, resend, requests, structured, args.concurrency,
+                                                        args.max_attempts, responses=responses)
+            report_failures(failures)
+            rows = merge_rows(summary, rule_rows, rows)
+            with open(args.output, "w", encoding="utf-8", newline="") as output_file:
+                output_file.write(format_event_log(rows))
+            metrics.add_rows(rows_out=len(rows))
+            metrics.add_count('validation_retries', retries)
+            print(f"\n\r已寫入 {len(rows)} 列至 {args.output}，重新請求 {retries} 次")
+        elif args.stream:
+            # 邊接收邊寫入，中斷時已完成的日期不需要重新處理
+            rows_written, skipped, retries = stream_event_log(
+                stream, split_summary_by_day(message), args.chunk_tokens, prompt_builder,
+                args.output, args.concurrency, resume=args.resume, structured=structured, resend=resend,
+                max_attempts=args.max_attempts)
+            metrics.add_rows(rows_out=rows_written)
+            metrics.add_count('skipped_rows', skipped)
+            metrics.add_count('validation_retries', retries)
+            print(f"\n\r已寫入 {rows_written} 列至 {args.output}，重新請求 {retries} 次，略過 {skipped} 筆格式不符的資料")
+        else:
+            if args.chunk_tokens > 0:
+                # 依日期分批，同時送出後再依日期順序合併為單一表格
+                chunks = build_chunks(split_summary_by_day(message), args.chunk_tokens)
+                print(f"共 {len(chunks)} 批，同時請求數 {args.concurrency}")
+            else:
+                chunks = [message] if message.strip() else []
+            requests = [(chunk, prompt_builder.history_for(chunk)) for chunk in chunks]
+            # 每批的回應驗證後才寫入，格式不符的批次單獨重新請求，不需要重新處理全部的批次
+            rows, retries, failures = extract_validated(send, resend, requests, structured, args.concurrency,
+                                                        args.max_attempts)
+            report_failures(failures)
+            # 規則處理的資料列依摘要的順序併入
+            rows = merge_rows(summary, rule_rows, rows)
+
+            # 將驗證後的資料列保存至輸出檔案
+            with open(args.output, "w", encoding="utf-8", newline="") as output_file:
+                output_file.write(format_event_log(rows))
+
+            metrics.add_rows(rows_out=len(rows))
+            metrics.add_count('validation_retries', retries)
+            print(f"\n\r已寫入 {len(rows)} 列至 {args.output}，重新請求 {retries} 次")
+
+        if args.event_store:
+            store_rows = write_log_store(args.output, args.event_store)
+            print(f"已寫入 {store_rows} 列至 {args.event_store}")
 
-    args = parser.parse_args()
-
-    # 讀取系統設定檔 (JSON 格式)
-    with open(args.system, "r", encoding="utf-8") as system_file:
-        system_config = json.load(system_file)
-        system_instruction = system_config.get("instruction", "")
-
-
-
-    # 讀取對話歷史 (JSON 格式)
-    with open(args.history, "r", encoding="utf-8") as history_file:
-        history = json.load(history_file)  # 假設 history 是 JSON 格式
-
-    # 讀取輸入檔案 (純文字格式)
-    with open(args.input, "r", encoding="utf-8") as input_file:
-        message = input_file.read()
-
-    # 根據不同的 API 供應商進行對話
-    if args.provider == 'google':
-        # 使用 Google API 的處理方式
-        genai.configure(api_key=args.key)
-
-        # 設定模型配置
-        generation_config = {
-            "temperature": system_config.get("temperature", 1),
-            "top_p": system_config.get("top_p", 0.95),
-            "top_k": system_config.get("top_k", 64),
-            "max_output_tokens": system_config.get("max_output_tokens", 8192),
-            "response_mime_type": system_config.get("response_mime_type", "text/plain")
-        }
-
-        model = genai.GenerativeModel(
-            model_name=args.llm,
-            generation_config=generation_config,
-            system_instruction=system_instruction,
-        )
-
-        # 開始對話
-        chat_session = model.start_chat(history=history)
-
-        # 送出訊息並取得回應
-        response = chat_session.send_message({
-            "role": "user",
-            "parts": [message]
-        })
-
-        generated_message = response.text
-
-    elif args.provider == 'openai':
-        # 使用 OpenAI API 的處理方式
-        client = openai.OpenAI(api_key=args.key)
-
-        msg_list = [{"role": "system", "content": system_instruction}
-                    ] + history + [{"role": "user", "content": message}]
-        
-        # 設定模型配置
-        generation_config = {
-            "temperature": system_config.get("temperature", 1),
-            "top_p": system_config.get("top_p", 0.95),
-            "top_k": system_config.get("top_k", 64),
-            "max_output_tokens": system_config.get("max_output_tokens", 8192),
-            "response_mime_type": system_config.get("response_mime_type", "text/plain"),
-            "frequency_penalty": system_config.get("frequency_penalty", 0),
-            "presence_penalty": system_config.get("presence_penalty", 0),
-            "response_format": system_config.get("response_format", {"type": "text"})
-        }        
-
-        # 開始對話
-        response = client.chat.completions.create(
-            model=args.llm,
-            messages=msg_list,
-            temperature=generation_config["temperature"],
-            max_tokens=generation_config["max_output_tokens"],
-            top_p=generation_config["top_p"],
-            frequency_penalty=generation_config["frequency_penalty"],
-            presence_penalty=generation_config["presence_penalty"],
-            response_format=generation_config["response_format"]
-        )
-
-        generated_message = response.choices[0].message.content
-
-    # 將回應保存至輸出檔案
-    with open(args.output, "w", encoding="utf-8") as output_file:
-        output_file.write(generated_message)
-
-    print(f"\n\r回應已儲存至 {args.output}")
+        print(prompt_builder.report())
+        print(provider.report())
+        metrics.record_provider(provider)
+        if cache is not None:
+            cache.close()
+            print(cache.summary())
+            metrics.record_response_cache(cache)
 
 
 if __name__ == "__main__":
@@ -1,60 +1,245 @@
 import argparse
-import matplotlib.pyplot as plt
-import pandas as pd
-import matplotlib
-from matplotlib.dates import DateFormatter, MonthLocator
 
-# 設置中文字型以正確顯示標籤，請根據你的系統安裝的字體進行調整
-matplotlib.rc('font', family='Microsoft JhengHei')
+from event_store import is_event_store, read_event_store
+from lazy_modules import lazy_module
+from metrics import METRICS_HELP, METRICS_USAGE, add_metrics_arguments, stage_metrics
 
+# matplotlib 與 pandas 在繪圖時才載入，只顯示說明時不需要等待
+matplotlib = lazy_module('matplotlib')
+plt = lazy_module('matplotlib.pyplot')
+mdates = lazy_module('matplotlib.dates')
+np = lazy_module('numpy')
+pd = lazy_module('pandas')
 
-def plot_event_occurrences(input_file, output_file, title):
-    # 讀取數據
-    data = pd.read_csv(input_file, sep=',', encoding='utf-8')
+# 中文字型，繪圖前才設定以正確顯示標籤，請根據你的系統安裝的字體進行調整
+FONT_FAMILY = 'Microsoft JhengHei'
 
-    # 將日期字符串轉換為日期對象
-    data['日期'] = pd.to_datetime(data['日期'])
 
-    # 定義事件類型到英文的映射
-    event_type_mapping = {
-        '落石': 'Rockfall',
-        '停電': 'Power Outage'
-    }
+# 圖表類型：scatter 每個事件一個點 (原本的方式)；bar 與 heatmap 依日、週或月統計各事件類型的件數；
+# auto 在事件數超過門檻時使用 bar，否則使用 scatter
+CHART_MODES = ['auto', 'scatter', 'bar', 'heatmap']
+AUTO_BAR_THRESHOLD = 2000
 
-    # 將事件類型轉換為英文
-    data['事件類型英文'] = data['事件類型'].map(event_type_mapping)
+# 統計的時間單位 (pandas 的期間代碼)；auto 依資料的日期範圍選擇
+BIN_PERIODS = {'day': 'D', 'week': 'W', 'month': 'M'}
+BIN_LABELS = {'day': '日', 'week': '週', 'month': '月'}
+# 各期間的長度，用於長條寬度與熱度圖最後一格的右邊界
+PERIOD_OFFSETS = {'day': {'days': 1}, 'week': {'days': 7}, 'month': {'months': 1}}
+PERIOD_DAYS = {'day': 1, 'week': 7, 'month': 30}
 
-    # 為不同的事件類型分配不同的顏色
-    colors = {
-        'Rockfall': 'red',
-        'Power Outage': 'blue'
-    }
+# 期間數超過此值時不再逐一畫長條
+MAX_BARS = 200
 
-    # 繪製散點圖，不同事件類型用不同顏色表示，並將標題和圖例調整為英文
-    plt.figure(figsize=(12, 6))
-    for event_type, color in colors.items():
-        subset = data[data['事件類型英文'] == event_type]
-        y_position = 1 if event_type == 'Rockfall' else 0.5  # 設定Y軸位置
-        plt.scatter(subset['日期'], [y_position] * len(subset),
-                    c=color, label=event_type, alpha=0.6, s=50, edgecolor='k')
+# 已知事件類型的英文圖例與顏色，其他類型使用事件類型本身與預設的色彩循環
+EVENT_TYPE_LABELS = {
+    '落石': 'Rockfall',
+    '停電': 'Power Outage'
+}
+EVENT_TYPE_COLORS = {
+    '落石': 'red',
+    '停電': 'blue'
+}
+
+
+def plot_event_occurrences(input_file, output_file, title, **options):
+    # 讀取數據；事件儲存檔只讀取需要的欄位，日期已轉換為日期時間
+    if is_event_store(input_file):
+        data = read_event_store(input_file, columns=['日期值', '事件類型'])
+    else:
+        data = pd.read_csv(input_file, sep=',', encoding='utf-8')
+    plot_event_data(data, output_file, title, **options)
+
+
+def event_types_of(data):
+    """資料中的事件類型：已知的類型依原本的順序排在前面，其餘依件數由多到少排列"""
+    counts = data['事件類型'].value_counts()
+    counts = counts[counts > 0]
+    known = [event_type for event_type in EVENT_TYPE_LABELS if event_type in counts.index]
+    return known + [event_type for event_type in counts.index if event_type not in EVENT_TYPE_LABELS]
+
+
+def type_colors(event_types):
+    """為每個事件類型分配顏色，已知的類型使用固定的顏色"""
+    palette = iter(plt.rcParams['axes.prop_cycle'].by_key()['color'] * (len(event_types) // 10 + 1))
+    return {event_type: EVENT_TYPE_COLORS.get(event_type) or next(palette) for event_type in event_types}
+
+
+def choose_bin(dates):
+    """依日期範圍選擇統計單位：三個月以內按日，兩年以內按週，其餘按月"""
+    span = (dates.max() - dates.min()).days if len(dates) else 0
+    if span <= 92:
+        return 'day'
+    return 'week' if span <= 730 else 'month'
+
+
+def bin_events(data, freq):
+    """
+    依日期與事件類型統計件數，回傳以期間開始日期為索引、事件類型為欄位的表格。
+    沒有事件的期間也列出 (件數為 0)，長條之間的空白才能對應實際的時間
+    """
+    periods = data['日期'].dt.to_period(BIN_PERIODS[freq])
+    counts = data.groupby([periods, '事件類型'], observed=True).size().unstack(fill_value=0)
+    if counts.empty:
+        return counts
+    full_range = pd.period_range(counts.index.min(), counts.index.max(), freq=BIN_PERIODS[freq])
+    counts = counts.reindex(full_range, fill_value=0)
+    counts.index = counts.index.start_time
+    return counts[[event_type for event_type in event_types_of(data) if event_type in counts.columns]]
+
+
+def plot_event_data(data, output_file, title, mode='auto', freq='auto', small_multiples=False, dpi=300,
+                    show=False, metrics=None):
+    """
+    依已載入的事件日誌 (DataFrame) 繪製圖表，管線中可直接傳入記憶體中的表格。
+    show 為 False 時只輸出圖檔，不開啟互動視窗；事件類型取自資料，small_multiples 為 True 時每個事件類型一個子圖
+    提供 metrics 時記錄輸入的事件數與日期有效、畫入圖表的事件數
+    """
+    matplotlib.rc('font', family=FONT_FAMILY)
+    # 複製一份再新增欄位，避免修改呼叫端同時用於其他階段的表格
+    data = data.copy()
+
+    # 將日期字符串轉換為日期對象，無法辨識的日期不列入；事件儲存檔中已有轉換好的日期值
+    data['日期'] = data['日期值'] if '日期值' in data else pd.to_datetime(data['日期'], errors='coerce')
+    rows_in = len(data)
+    data = data.dropna(subset=['日期'])
+    if metrics is not None:
+        metrics.add_rows(rows_in=rows_in, rows_out=len(data))
+
+    if mode == 'auto':
+        mode = 'bar' if len(data) > AUTO_BAR_THRESHOLD or small_multiples else 'scatter'
+    if data.empty:
+        # 沒有事件時沒有可統計的期間，畫出空白的散點圖
+        mode = 'scatter'
+    if freq == 'auto':
+        freq = choose_bin(data['日期'])
+
+    if mode == 'scatter':
+        figure = plot_scatter(data, title)
+    elif small_multiples:
+        figure = plot_small_multiples(bin_events(data, freq), title, freq, mode)
+    elif mode == 'heatmap':
+        figure = plot_heatmap(bin_events(data, freq), title, freq)
+    else:
+        figure = plot_bars(bin_events(data, freq), title, freq)
+
+    # 保存圖表
+    figure.savefig(output_file, dpi=dpi)
+    if show:
+        plt.show()
+    plt.close(figure)
+
+
+def format_date_axis(axis):
+    """設置日期格式器和定位器，日期範圍較長時自動減少刻度"""
+    locator = mdates.AutoDateLocator(minticks=4, maxticks=24)
+    locator.intervald[mdates.MONTHLY] = [1, 2, 3, 6]
+    axis.xaxis.set_major_locator(locator)
+    axis.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m'))
+    for label in axis.get_xticklabels():
+        label.set_rotation(45)
+
+
+def plot_scatter(data, title):
+    """每個事件一個點，不同事件類型用不同顏色表示，並將圖例調整為英文"""
+    event_types = event_types_of(data)
+    colors = type_colors(event_types)
+    figure, axis = plt.subplots(figsize=(12, 6))
+    y_positions = {event_type: (len(event_types) - index) * 0.5 for index, event_type in enumerate(event_types)}
+    for event_type in event_types:
+        subset = data[data['事件類型'] == event_type]
+        axis.scatter(subset['日期'], [y_positions[event_type]] * len(subset),
+                     c=colors[event_type], label=EVENT_TYPE_LABELS.get(event_type, event_type),
+                     alpha=0.6, s=50, edgecolor='k')
 
     # 設置日期格式器和定位器
-    plt.gca().xaxis.set_major_locator(MonthLocator())
-    plt.gca().xaxis.set_major_formatter(DateFormatter('%Y-%m'))
+    axis.xaxis.set_major_locator(mdates.MonthLocator())
+    axis.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m'))
 
     # 設置標題
-    plt.title(title, fontsize=13, fontweight='bold')
-    plt.ylim(0, 1.5)  # 設定Y軸尺度為0到1.5
-    plt.yticks([1, 0.5], ['落石', '停電'], fontsize=13,
-               fontweight='bold')  # 設定Y軸刻度和標籤
-    plt.grid(True)
-    plt.xticks(rotation=45)
-    plt.tight_layout()
+    axis.set_title(title, fontsize=13, fontweight='bold')
+    axis.set_ylim(0, (len(event_types) + 1) * 0.5)
+    axis.set_yticks(list(y_positions.values()), list(y_positions), fontsize=13, fontweight='bold')
+    axis.grid(True)
+    for label in axis.get_xticklabels():
+        label.set_rotation(45)
+    figure.tight_layout()
+    return figure
+
+
+def period_edges(counts, freq):
+    """各期間的左右邊界 (matplotlib 的日期數值)，期間是連續的，因此共 len(counts) + 1 個"""
+    return mdates.date2num(list(counts.index) + [counts.index[-1] + pd.DateOffset(**PERIOD_OFFSETS[freq])])
 
-    # 保存圖表
-    plt.savefig(output_file, dpi=300)
 
-    plt.show()
+def draw_counts(axis, counts, values, bottom, freq, **style):
+    """
+    畫出各期間的件數 (疊在 bottom 之上)。期間不多時每個期間一個長條 (寬度為期間長度的八成)；
+    期間很多時 (例如多年按日統計) 以一個階梯狀的填色多邊形表示，繪製時間不隨期間數增加
+    """
+    if len(counts) <= MAX_BARS:
+        axis.bar(counts.index, values, width=PERIOD_DAYS[freq] * 0.8, bottom=bottom, align='edge',
+                 linewidth=0, **style)
+    else:
+        axis.stairs(bottom + values, period_edges(counts, freq), baseline=bottom, fill=True, **style)
+
+
+def plot_bars(counts, title, freq):
+    """各期間的件數以堆疊長條表示，每個事件類型一種顏色"""
+    colors = type_colors(list(counts.columns))
+    figure, axis = plt.subplots(figsize=(12, 6))
+    bottom = np.zeros(len(counts))
+    for event_type in counts.columns:
+        values = counts[event_type].to_numpy()
+        draw_counts(axis, counts, values, bottom, freq,
+                    color=colors[event_type], label=EVENT_TYPE_LABELS.get(event_type, event_type))
+        bottom = bottom + values
+    format_date_axis(axis)
+    axis.set_title(title, fontsize=13, fontweight='bold')
+    axis.set_ylabel(f"件數 (每{BIN_LABELS[freq]})")
+    axis.grid(True, axis='y')
+    axis.legend(loc='upper left', ncol=min(len(counts.columns), 6))
+    figure.tight_layout()
+    return figure
+
+
+def plot_heatmap(counts, title, freq):
+    """事件類型為列、期間為欄的熱度圖，顏色表示件數"""
+    figure, axis = plt.subplots(figsize=(12, max(3, 0.5 * len(counts.columns) + 2)))
+    mesh = axis.pcolormesh(period_edges(counts, freq), np.arange(len(counts.columns) + 1), counts.to_numpy().T,
+                           cmap='YlOrRd')
+    axis.xaxis_date()
+    format_date_axis(axis)
+    axis.set_yticks(np.arange(len(counts.columns)) + 0.5, list(counts.columns), fontsize=11)
+    axis.invert_yaxis()
+    axis.set_title(title, fontsize=13, fontweight='bold')
+    figure.colorbar(mesh, ax=axis, label=f"件數 (每{BIN_LABELS[freq]})")
+    figure.tight_layout()
+    return figure
+
+
+def plot_small_multiples(counts, title, freq, mode):
+    """每個事件類型一個子圖 (共用時間軸，縱軸各自縮放)，事件類型很多時分為兩欄"""
+    event_types = list(counts.columns)
+    columns = 2 if len(event_types) > 6 else 1
+    rows = max(1, -(-len(event_types) // columns))
+    figure, axes = plt.subplots(rows, columns, figsize=(12, 1.6 * rows + 1), sharex=True, squeeze=False)
+    colors = type_colors(event_types)
+    for axis, event_type in zip(axes.flat, event_types):
+        values = counts[event_type].to_numpy()
+        if mode == 'heatmap':
+            axis.pcolormesh(period_edges(counts, freq), [0, 1], values[None, :], cmap='YlOrRd')
+            axis.set_yticks([])
+        else:
+            draw_counts(axis, counts, values, np.zeros(len(values)), freq, color=colors[event_type])
+            axis.grid(True, axis='y')
+        axis.set_title(f"{event_type} ({int(values.sum())})", fontsize=10, loc='left')
+    for axis in axes.flat[len(event_types):]:
+        axis.set_visible(False)
+    for axis in axes[-1]:
+        format_date_axis(axis)
+    figure.suptitle(title, fontsize=13, fontweight='bold')
+    figure.tight_layout()
+    return figure
 
 
 class CustomArgumentParser(argparse.ArgumentParser):
@@ -63,18 +248,27 @@ class CustomArgumentParser(argparse.ArgumentParser):
 
     def print_help(self, file=None):
         # 自訂顯示的幫助訊息
-        help_message = f"""使用方法: {self.prog} [-h] -I 輸入檔案 -O 輸出圖表 [-T 標題]
+        help_message = f"""使用方法: {self.prog} [-h] -I 輸入檔案 -O 輸出圖表 [-T 標題] [--mode {{auto,scatter,bar,heatmap}}] [--bin {{auto,day,week,month}}] [--small-multiples] [--dpi 解析度] [--show] {METRICS_USAGE}
 
 繪製事件發生圖表
 
 選項:
   -h, --help            顯示此幫助訊息並退出
   -I INPUT, --input INPUT
-                        輸入檔案
+                        輸入檔案 (事件日誌 CSV 或事件儲存檔 .parquet)
   -O OUTPUT, --output OUTPUT
                         輸出圖表
   -T TITLE, --title TITLE
                         圖表標題
+  --mode {{auto,scatter,bar,heatmap}}
+                        圖表類型 (預設 auto)：scatter 每個事件一個點；bar 與 heatmap 依期間統計各事件類型的件數，
+                        以堆疊長條或熱度圖表示；auto 在事件超過 {AUTO_BAR_THRESHOLD} 件時使用 bar，否則使用 scatter
+  --bin {{auto,day,week,month}}
+                        統計的時間單位 (預設 auto：三個月以內按日，兩年以內按週，其餘按月)
+  --small-multiples     每個事件類型一個子圖 (共用時間軸)，適合事件類型很多的分類
+  --dpi DPI             輸出圖檔的解析度 (預設 300)
+  --show                輸出後開啟互動視窗 (預設只輸出圖檔，不需要顯示器)
+{METRICS_HELP}
         """
         print(help_message, file=file)
 
@@ -88,8 +282,21 @@ if __name__ == "__main__":
                         required=True, help='輸出圖表')
     parser.add_argument('-T', '--title', type=str,
                         default="事件發生頻率", help='圖表標題')
+    parser.add_argument('--mode', choices=CHART_MODES, default='auto', help='圖表類型')
+    parser.add_argument('--bin', choices=['auto', *BIN_PERIODS], default='auto', help='統計的時間單位')
+    parser.add_argument('--small-multiples', action='store_true', help='每個事件類型一個子圖')
+    parser.add_argument('--dpi', type=int, default=300, help='輸出圖檔的解析度')
+    parser.add_argument('--show', action='store_true', help='輸出後開啟互動視窗')
+    add_metrics_arguments(parser)
 
     args = parser.parse_args()
 
+    # 不需要互動視窗時使用不需要顯示器的後端，在載入 pyplot 前設定就不會載入圖形介面的後端
+    if not args.show:
+        matplotlib.use('Agg')
+
     # 調用繪圖函數
-    plot_event_occurrences(args.input, args.output, args.title)
+    with stage_metrics('03', args) as metrics:
+        plot_event_occurrences(args.input, args.output, args.title, mode=args.mode, freq=args.bin,
+                               small_multiples=args.small_multiples, dpi=args.dpi, show=args.show,
+                               metrics=metrics)
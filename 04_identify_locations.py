@@ -1,31 +1,65 @@
 import csv
 import argparse
 
+from event_store import is_event_store, place_list_entries, read_event_store
+from metrics import METRICS_HELP, METRICS_USAGE, add_metrics_arguments, stage_metrics
+from place_names import normalize_place_name
+
 # 處理CSV檔案以提取獨特地點名稱的函數
-def extract_unique_places(input_csv, output_csv):
-    unique_places = set()  # 使用集合儲存地點，避免重複
+def extract_unique_places(input_csv, output_csv, metrics=None):
+    if is_event_store(input_csv):
+        # 事件儲存檔中的地點已分割為清單，只讀取這一欄
+        place_lists = read_event_store(input_csv, columns=['地點清單'])['地點清單']
+        unique_places = sorted(set(place_list_entries(place_lists)))
+        if metrics is not None:
+            metrics.add_rows(rows_in=len(place_lists))
+    else:
+        unique_places = read_unique_places(input_csv, metrics)
+
+    save_unique_places(output_csv, unique_places)
+    if metrics is not None:
+        metrics.add_rows(rows_out=len(unique_places))
+    print(f"轉換完成，共 {len(unique_places)} 個地點 (正規化後 {count_normalized_places(unique_places)} 個)，"
+          f"請檢查輸出檔案：{output_csv}")
 
+
+def read_unique_places(input_csv, metrics=None):
+    """從事件日誌 CSV 取出不重複的地點名稱，提供 metrics 時累計讀取的事件數"""
     # 讀取輸入的CSV檔案
     with open(input_csv, 'r', encoding='utf-8') as infile:
         csv_reader = csv.reader(infile)
         next(csv_reader)  # 略過表頭列
-        for row in csv_reader:
-            place_field = row[2]  # 取得第三欄的'地點'欄位
-            # 使用分號分割地點，並去除多餘的空格
-            places = [place.strip() for place in place_field.split(';')]
-            # 將地點加入集合中，避免重複
-            unique_places.update(place for place in places if place)
+        rows = metrics.counted(csv_reader) if metrics is not None else csv_reader
+        return collect_unique_places(row[2] for row in rows)  # 第三欄為'地點'欄位
+
 
+def collect_unique_places(place_fields):
+    """從多個'地點'欄位中取出不重複的地點名稱，依名稱排序以保持輸出的一致性。"""
+    unique_places = set()  # 使用集合儲存地點，避免重複
+    for place_field in place_fields:
+        # 使用分號分割地點，並去除多餘的空格
+        places = [place.strip() for place in place_field.split(';')]
+        # 將地點加入集合中，避免重複
+        unique_places.update(place for place in places if place)
+    return sorted(unique_places)
+
+
+def count_normalized_places(unique_places):
+    """
+    計算正規化後 (全形半形、大小寫、里程樁號寫法等) 不同的地點數。
+    輸出仍保留原本的寫法，06 階段才能以事件日誌中的地點比對；05 階段查詢時會合併相同的地點。
+    """
+    return len({normalize_place_name(place) for place in unique_places})
 
-    # 將獨特的地點名稱寫入輸出的CSV檔案
+
+def save_unique_places(output_csv, unique_places):
+    """將獨特的地點名稱寫入輸出的CSV檔案。"""
     with open(output_csv, 'w', encoding='utf-8', newline='') as outfile:
         csv_writer = csv.writer(outfile)
         csv_writer.writerow(['地名'])  # 寫入表頭
-        for place in sorted(unique_places):  # 排序地點名稱以保持輸出的一致性
+        for place in unique_places:
             csv_writer.writerow([place])
 
-    print(f"轉換完成，請檢查輸出檔案：{output_csv}")
-
 
 class CustomArgumentParser(argparse.ArgumentParser):
     def __init__(self, *args, **kwargs):
@@ -33,30 +67,33 @@ class CustomArgumentParser(argparse.ArgumentParser):
 
     def print_help(self, file=None):
         # 自訂顯示的幫助訊息
-        help_message = f"""使用方法: {self.prog} [-h] -I 輸入檔案 -O 輸出檔案
+        help_message = f"""使用方法: {self.prog} [-h] -I 輸入檔案 -O 輸出檔案 {METRICS_USAGE}
 
 去除輸入檔案中重複地點後，轉存為輸出檔案
 
 選項:
   -h, --help            顯示此幫助訊息並退出
   -I INPUT, --input INPUT
-                        輸入檔案
+                        輸入檔案 (事件日誌 CSV 或事件儲存檔 .parquet)
   -O OUTPUT, --output OUTPUT
                         輸出檔案
+{METRICS_HELP}
         """
         print(help_message, file=file)
 
 
 # 主函數處理命令行參數解析
-def main():
+def main(argv=None):
     parser = CustomArgumentParser(description="去除輸入檔案中重複地點後，轉存為輸出檔案")
     parser.add_argument('-I', '--input', required=True, help="輸入檔案")
     parser.add_argument('-O', '--output', required=True, help="輸出檔案")
+    add_metrics_arguments(parser)
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     
     # 使用提供的參數呼叫處理函數
-    extract_unique_places(args.input, args.output)
+    with stage_metrics('04', args) as metrics:
+        extract_unique_places(args.input, args.output, metrics)
 
 # 程式執行入口
 if __name__ == "__main__":
@@ -1,124 +1,150 @@
-import pandas as pd
-import googlemaps
 import argparse
-import os
+from collections import Counter
 
+from geocoder import Geocoder, NegativeCache
+from lazy_modules import lazy_module
+from metrics import METRICS_HELP, METRICS_USAGE, add_metrics_arguments, stage_metrics
+from milepost import MilepostLocator, describe_marker
+from place_db import PLACE_DB_COLUMNS, PlaceDatabase
+from place_names import PlaceNameIndex
 
-def load_database_file(database_file_path):
-    """
-    加載本地數據庫文件，返回包含地名、搜尋關鍵地名、建議地名、緯度和經度的 DataFrame。
-    如果數據庫文件不存在或為空，則返回一個空的 DataFrame。
-    """
-    if os.path.exists(database_file_path):
-        try:
-            return pd.read_csv(database_file_path, sep='|')
-        except pd.errors.EmptyDataError:
-            # 如果文件為空，返回一個空的 DataFrame
-            return pd.DataFrame(columns=['地名', '搜尋關鍵地名', '建議地名', '緯度', '經度'])
-    else:
-        # 如果文件不存在，返回一個空的 DataFrame
-        return pd.DataFrame(columns=['地名', '搜尋關鍵地名', '建議地名', '緯度', '經度'])
-
-
-def save_database_to_file(database_file_path, database):
-    """
-    將數據庫內容保存到指定的 CSV 文件，使用 '|' 作為分隔符。
-    """
-    database.to_csv(database_file_path, index=False, sep='|',
-                    columns=['地名', '搜尋關鍵地名', '建議地名', '緯度', '經度'])
+# googlemaps 只在需要呼叫 API 時才載入 (例如全部地點都已在資料庫中時不需要)
+pd = lazy_module('pandas')
+googlemaps = lazy_module('googlemaps')
 
 
-def fetch_place_suggestion(gmaps_client, query):
-    """
-    使用 Google Place Autocomplete API 獲取地點建議，只返回最接近的建議。
-    """
-    suggestions = gmaps_client.places_autocomplete(query)
-    if suggestions:
-        return suggestions[0]['description']
-    return None
+def main(api_key, input_csv, output_csv, query_prefix, database_file_path, **options):
+    # 加載輸入 CSV 文件
+    input_data = pd.read_csv(input_csv)
+    update_places(api_key, input_data, output_csv, query_prefix, database_file_path, **options)
 
 
-def fetch_geolocation(gmaps_client, place_name):
+def update_places(api_key, input_data, output_csv, query_prefix, database_file_path,
+                  concurrency=4, queries_per_second=10, negative_cache_path=None,
+                  negative_ttl_days=30, normalize=True, similarity=0.85, milepost_locator=None,
+                  gmaps_client=None, metrics=None):
     """
-    根據地名獲取其經緯度，若找不到返回 (None, None)。
+    查詢 input_data ('地名' 欄位) 中的地點座標並更新數據庫，管線中可直接傳入記憶體中的地名表格。
+    數據庫中沒有的地名會同時查詢 (最多 concurrency 個、每秒最多 queries_per_second 次 API 呼叫)，
+    查無建議地名的查詢記錄在 negative_cache_path，negative_ttl_days 天內不再查詢 (0 表示不記錄)。
+    normalize 為 True 時，正規化後相同或相似度不低於 similarity 的地名直接使用已知的座標，
+    並以新的寫法加入數據庫，不需要呼叫 API。
+    提供 milepost_locator (MilepostLocator) 時，里程樁號 (例如「台7線24k」) 沿道路內插座標，不呼叫 API。
+    提供 metrics (metrics.StageMetrics) 時記錄資料列數、數據庫命中率與地點查詢的 API 延遲。
+    回傳包含查詢結果的 DataFrame。
     """
-    geocode_result = gmaps_client.geocode(place_name)
-    if geocode_result:
-        location = geocode_result[0]['geometry']['location']
-        return (location['lat'], location['lng'])
-    return (None, None)
-
-
-def main(api_key, input_csv, output_csv, query_prefix, database_file_path):
-    # 初始化 Google Maps 客戶端
-    gmaps_client = googlemaps.Client(key=api_key)
-
-    # 加載或初始化數據庫
-    database = load_database_file(database_file_path)
-
-    # 加載輸入 CSV 文件
-    input_data = pd.read_csv(input_csv)
-
-    # 增加新列，用於儲存查詢結果
-    input_data['搜尋關鍵地名'] = ''
-    input_data['建議地名'] = ''
-    input_data['緯度'] = ''
-    input_data['經度'] = ''
-
-    # API 調用次數計數器
-    api_call_counter = 0
-
-    # 處理每一筆地名資料
-    for index, row in input_data.iterrows():
-        if pd.isna( row['地名']):
-            continue
-
-        full_query_name = query_prefix + str(row['地名'])
-
-        # 檢查地名是否已存在於數據庫
-        database_row = database[database['地名'] == row['地名']]
-        if not database_row.empty:
-            # 若地名已存在，使用數據庫中的數據
-            input_data.at[index, '搜尋關鍵地名'] = database_row.iloc[0]['搜尋關鍵地名']
-            input_data.at[index, '建議地名'] = database_row.iloc[0]['建議地名']
-            input_data.at[index, '緯度'] = database_row.iloc[0]['緯度']
-            input_data.at[index, '經度'] = database_row.iloc[0]['經度']
+    # 加載或初始化數據庫，以地名為索引，查詢不需要掃描整個表格
+    database = PlaceDatabase(database_file_path)
+
+    place_names = [str(place_name) for place_name in input_data['地名'] if not pd.isna(place_name)]
+    unknown_names = [place_name for place_name in dict.fromkeys(place_names) if place_name not in database]
+    database_hits = len(set(place_names)) - len(unknown_names)
+
+    # 里程樁號在本機內插座標，比地點查詢更快也更準確
+    located = milepost_locator.locate_many(unknown_names) if milepost_locator is not None else {}
+    for place_name, (road, km, latitude, longitude) in located.items():
+        database.add({
+            '地名': place_name,
+            '搜尋關鍵地名': '',
+            '建議地名': describe_marker(road, km),
+            '緯度': latitude,
+            '經度': longitude
+        })
+    unknown_names = [place_name for place_name in unknown_names if place_name not in located]
+
+    # 數據庫中沒有的地名先比對已知地名的其他寫法，本次輸入中相同或相似的地名也只查詢一次
+    aliases = {}
+    matched = Counter()
+    if normalize and unknown_names:
+        index = PlaceNameIndex((record['地名'] for record in database.records()), threshold=similarity)
+        pending = set()
+        for place_name in unknown_names:
+            known_name, method = index.lookup(place_name)
+            if known_name is None:
+                # 需要查詢的地名也加入索引，本次輸入中的其他寫法不必再查詢
+                index.add(place_name)
+                pending.add(place_name)
+                continue
+            aliases[place_name] = known_name
+            matched['merged' if known_name in pending else method] += 1
+    query_names = [place_name for place_name in unknown_names if place_name not in aliases]
+
+    # 需要查詢的地名 (不重複) 同時送出查詢
+    negative_cache = None
+    if negative_ttl_days > 0:
+        negative_cache = NegativeCache(negative_cache_path or database_file_path + '.negative.sqlite',
+                                       negative_ttl_days)
+    # 有地名需要查詢時才初始化 Google Maps 客戶端 (並載入 googlemaps)
+    if gmaps_client is None and query_names:
+        gmaps_client = googlemaps.Client(key=api_key)
+    geocoder = Geocoder(gmaps_client, concurrency, queries_per_second, negative_cache)
+    futures = {place_name: geocoder.submit(query_prefix + place_name) for place_name in query_names}
+
+    def resolve(place_name):
+        """取得地名在數據庫中的資料，新查到的地名與其他寫法會加入數據庫。"""
+        record = database.get(place_name)
+        if record is not None:
+            return record
+        if place_name in aliases:
+            # 其他寫法使用已知地名的資料，只更換地名
+            source = resolve(aliases[place_name])
+            if source is None:
+                return None
+            record = {**source, '地名': place_name}
         else:
-            # 若地名不存在於數據庫，調用 API 獲取建議地名及其經緯度
-            suggested_place = fetch_place_suggestion(
-                gmaps_client, full_query_name)
-            if suggested_place:
-                lat, lng = fetch_geolocation(gmaps_client, suggested_place)
-                input_data.at[index, '搜尋關鍵地名'] = full_query_name
-                input_data.at[index, '建議地名'] = suggested_place
-                input_data.at[index, '緯度'] = lat
-                input_data.at[index, '經度'] = lng
-
-                # 將新資料添加至數據庫
-                new_record = pd.DataFrame({
-                    '地名': [row['地名']],
-                    '搜尋關鍵地名': [full_query_name],
-                    '建議地名': [suggested_place],
-                    '緯度': [lat],
-                    '經度': [lng]
-                })
-                database = pd.concat([database, new_record], ignore_index=True)
-
-                # 增加 API 調用次數
-                api_call_counter += 1
-
-    # 移除建議地名為空的行
-    input_data = input_data[input_data['建議地名'] != '']
-
-    # 保存更新後的數據庫
-    save_database_to_file(database_file_path, database)
+            result = futures[place_name].result()
+            if not result.suggestion:
+                return None
+            record = {
+                '地名': place_name,
+                '搜尋關鍵地名': query_prefix + place_name,
+                '建議地名': result.suggestion,
+                '緯度': result.latitude,
+                '經度': result.longitude
+            }
+        # 將新資料添加至數據庫
+        database.add(record)
+        return record
+
+    # 依輸入順序整理結果，每筆為數據庫中的一行
+    results = []
+    try:
+        for place_name in place_names:
+            record = resolve(place_name)
+
+            # 只保留有建議地名的結果
+            if record is not None and record['建議地名'] != '':
+                results.append(record)
+    finally:
+        # 保存更新後的數據庫，新的地名附加在檔尾；中斷時已完成的查詢也會保存
+        database.flush()
+        geocoder.close()
 
     # 將結果保存到輸出 CSV 文件，使用 '|' 作為分隔符
-    input_data.to_csv(output_csv, index=False, sep='|', columns=[
-                      '地名', '搜尋關鍵地名', '建議地名', '緯度', '經度'])
+    output_data = pd.DataFrame(results, columns=PLACE_DB_COLUMNS)
+    output_data.to_csv(output_csv, index=False, sep='|', columns=PLACE_DB_COLUMNS)
+
+    if metrics is not None:
+        metrics.add_rows(rows_in=len(place_names), rows_out=len(results))
+        # 數據庫中沒有的地名 (含里程樁號內插的地名) 為未命中
+        metrics.add_cache('place_db', database_hits, len(unknown_names) + len(located))
+        metrics.add_count('milepost_located', len(located))
+        metrics.add_count('name_matches', sum(matched.values()))
+        metrics.record_geocoder(geocoder)
 
     # 顯示 API 調用次數
-    print(f"API 調用次數: {api_call_counter}")
+    print(f"數據庫命中 {database_hits} 個地名，需查詢 {len(unknown_names)} 個地名")
+    if milepost_locator is not None:
+        print(f"里程樁號內插 {len(located)} 個地名 (不需要 API 呼叫)")
+    if normalize:
+        # 每個地名的查詢需要兩次 API 呼叫 (建議地名與座標)
+        avoided = sum(matched.values())
+        print(f"地名正規化：{matched['normalized']} 個與已知地名相同、{matched['km']} 個依里程樁號對應、"
+              f"{matched['similar']} 個與已知地名相似、{matched['merged']} 個與本次其他地名相同或相似，"
+              f"避免 {avoided} 次地點查詢 (約 {avoided * 2} 次 API 呼叫)")
+    print(f"API 調用次數: {geocoder.api_calls}")
+    print(geocoder.report())
+    return output_data
 
 
 class CustomArgumentParser(argparse.ArgumentParser):
@@ -127,7 +153,7 @@ class CustomArgumentParser(argparse.ArgumentParser):
 
     def print_help(self, file=None):
         # 自訂顯示的幫助訊息
-        help_message = f"""使用方法: {self.prog} [-h] -K 金鑰 -P 地名查詢前綴 -D 地名數據庫檔案 -I 輸入檔案 -O 輸出檔案
+        help_message = f"""使用方法: {self.prog} [-h] -K 金鑰 -P 地名查詢前綴 -D 地名數據庫檔案 -I 輸入檔案 -O 輸出檔案 [-J 同時查詢數] [--qps 每秒查詢數] [--negative-cache 快取檔案] [--negative-ttl-days 天數] [--similarity 相似度 | --no-normalize] [--mileposts 里程樁檔案 [--road 道路]] {METRICS_USAGE}
 
 使用 Google Maps API 獲取地名建議和經緯度
 
@@ -142,6 +168,20 @@ class CustomArgumentParser(argparse.ArgumentParser):
                         輸入檔案
   -O OUTPUT, --output OUTPUT
                         輸出檔案
+  -J CONCURRENCY, --concurrency CONCURRENCY
+                        同時進行的地點查詢數 (預設 4)
+  --qps QPS             每秒最多的 API 呼叫次數 (預設 10)
+  --negative-cache NEGATIVE_CACHE
+                        查無建議地名的快取檔案 (SQLite，預設為 數據庫檔案.negative.sqlite)
+  --negative-ttl-days NEGATIVE_TTL_DAYS
+                        查無建議地名的結果保存天數，期間內不再查詢 (預設 30，0 表示不記錄)
+  --similarity SIMILARITY
+                        地名相似度門檻 (0 ~ 1，預設 0.85)，相似的地名直接使用已知座標，1 表示只合併正規化後相同的地名
+  --no-normalize        不正規化地名，只有完全相同的地名才使用已知座標
+  --mileposts MILEPOSTS
+                        道路折線與里程樁的 GeoJSON 檔案，里程樁號 (例如「台7線24k」) 沿道路內插座標，不呼叫 API
+  --road ROAD           只寫樁號的地名 (例如「28.7K」) 所在的道路 (例如「台7線」)
+{METRICS_HELP}
         """
         print(help_message, file=file)
 
@@ -156,8 +196,24 @@ if __name__ == "__main__":
     parser.add_argument('-D', '--database', required=True, help='數據庫 CSV 檔案路徑')
     parser.add_argument('-I', '--input', required=True, help='輸入檔案')
     parser.add_argument('-O', '--output', required=True, help='輸出檔案')
+    parser.add_argument('-J', '--concurrency', type=int, default=4, help='同時進行的地點查詢數')
+    parser.add_argument('--qps', type=float, default=10, help='每秒最多的 API 呼叫次數')
+    parser.add_argument('--negative-cache', help='查無建議地名的快取檔案 (SQLite)')
+    parser.add_argument('--negative-ttl-days', type=float, default=30,
+                        help='查無建議地名的結果保存天數 (0 表示不記錄)')
+    parser.add_argument('--similarity', type=float, default=0.85, help='地名相似度門檻')
+    parser.add_argument('--no-normalize', action='store_true', help='不正規化地名')
+    parser.add_argument('--mileposts', help='道路折線與里程樁的 GeoJSON 檔案')
+    parser.add_argument('--road', help='只寫樁號的地名所在的道路')
+    add_metrics_arguments(parser)
 
     args = parser.parse_args()
 
     # 調用 main 函數並傳入參數
-    main(args.key, args.input, args.output, args.prefix, args.database)
+    with stage_metrics('05', args) as metrics:
+        main(args.key, args.input, args.output, args.prefix, args.database,
+             concurrency=args.concurrency, queries_per_second=args.qps,
+             negative_cache_path=args.negative_cache, negative_ttl_days=args.negative_ttl_days,
+             normalize=not args.no_normalize, similarity=args.similarity,
+             milepost_locator=MilepostLocator.from_geojson(args.mileposts, args.road) if args.mileposts else None,
+             metrics=metrics)
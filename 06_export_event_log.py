@@ -1,55 +1,129 @@
 import csv
 import argparse
 
+from event_store import explode_places, is_event_store, place_list_entries, read_event_store
+from lazy_modules import lazy_module
+from metrics import METRICS_HELP, METRICS_USAGE, add_metrics_arguments, stage_metrics
+from milepost import MilepostLocator, describe_marker
+
+np = lazy_module('numpy')
+pd = lazy_module('pandas')
+
+
+# 事件日誌的欄位與輸出檔案的欄位
+EVENT_COLUMNS = ['日期', '事件類型', '地點', '額外說明']
+OUTPUT_COLUMNS = ['name', 'longitude', 'latitude', 'description']
+PLACE_COLUMNS = ['地名', '建議地名', '緯度', '經度']
+
 
 def load_place_data(database_file):
-    """載入地點資料庫，將每個地名和對應的建議地名及經緯度資訊儲存到字典中"""
-    place_data = {}
-    with open(database_file, mode='r', encoding='utf-8') as db_file:
-        csv_reader = csv.DictReader(db_file, delimiter='|')
-        for row in csv_reader:
-            # 將整行資料儲存，以便地名和建議地名的使用
-            place_data[row['地名']] = {
-                'original_name': row['地名'],
-                'suggested_name': row['建議地名'],
-                'latitude': row['緯度'],
-                'longitude': row['經度']
-            }
-    return place_data
-
-
-def process_event_data(input_file, place_data):
+    """載入地點資料庫為表格 (地名、建議地名、緯度、經度)，同一地名出現多次時以最後一筆為準"""
+    place_data = pd.read_csv(database_file, sep='|', dtype=str, keep_default_na=False)
+    return place_data[PLACE_COLUMNS].drop_duplicates('地名', keep='last')
+
+
+def load_events(input_file):
+    """
+    一次讀入事件日誌為表格。欄位不足的資料列補上空白；額外說明中未加引號的逗號之後的內容不列入欄位，
+    與逐行以 csv.DictReader 讀取時相同。輸入為事件儲存檔 (.parquet) 時直接讀取，地點已分割為清單
+    """
+    if is_event_store(input_file):
+        return read_event_store(input_file, columns=EVENT_COLUMNS + ['地點清單'])
+    with open(input_file, mode='r', encoding='utf-8', newline='') as in_file:
+        header = next(csv.reader(in_file), EVENT_COLUMNS)
+    # 以欄位編號指定欄位，多出的欄位會被忽略
+    events = pd.read_csv(input_file, header=None, skiprows=1, names=range(len(header)),
+                         usecols=range(len(header)), dtype=str, keep_default_na=False, encoding='utf-8')
+    events.columns = header
+    return events[EVENT_COLUMNS]
+
+
+def process_event_data(input_file, place_data, milepost_locator=None):
     """處理輸入檔案，依據地點名稱匹配資料庫中的地名並組合事件資訊"""
-    processed_events = []
-    with open(input_file, mode='r', encoding='utf-8') as in_file:
-        csv_reader = csv.DictReader(in_file)
-        for row in csv_reader:
-            event_type = row['事件類型']
-            event_date = row['日期']
-            location = row['地點']
-            additional_info = row['額外說明']
-
-            # 確認地點是否在地點資料庫中
-            if location in place_data:
-                place_info = place_data[location]
-                combined_description = f"{event_date}_{event_type}_{location}_{additional_info}"
-                processed_events.append({
-                    'name': place_info['original_name'],  # 使用地名（原始名稱）
-                    'longitude': place_info['longitude'],
-                    'latitude': place_info['latitude'],
-                    'description': combined_description
-                })
-    return processed_events
+    return match_events(load_events(input_file), place_data, milepost_locator)
+
+
+def locate_mileposts(place_names, place_data, milepost_locator):
+    """資料庫中沒有的里程樁號 (例如「台7線24k」) 沿道路內插座標，回傳加入這些地點的地點資料"""
+    missing = pd.Index(place_names.unique()).difference(place_data['地名'])
+    located = milepost_locator.locate_many(missing)
+    if not located:
+        return place_data
+    rows = [(name, describe_marker(road, km), str(latitude), str(longitude))
+            for name, (road, km, latitude, longitude) in located.items()]
+    return pd.concat([place_data, pd.DataFrame(rows, columns=PLACE_COLUMNS)], ignore_index=True)
+
+
+def join_places(events, place_data, milepost_locator=None, keep_unmatched=False):
+    """
+    將事件與地點資料庫合併 (hash join)，一次比對全部事件，回傳依事件順序排列的合併表格。
+    events 為事件表格 (或以欄位名稱為鍵值的事件資料)，place_data 為 load_place_data() 載入的地點表格。
+    '地點'欄位中以分號分隔的多個地點分別匹配；提供 milepost_locator 時，資料庫中沒有的里程樁號在本機內插座標。
+    keep_unmatched 為 True 時保留資料庫中沒有的地點 (left join)，建議地名與座標為空白。
+    """
+    if not isinstance(events, pd.DataFrame):
+        events = pd.DataFrame(list(events), columns=EVENT_COLUMNS).fillna('')
+    events = events.reset_index(drop=True)
+    if '地點清單' in events:
+        names = place_list_entries(events['地點清單'])
+    else:
+        names = explode_places(events['地點'])
+    if milepost_locator is not None:
+        place_data = locate_mileposts(names, place_data, milepost_locator)
+
+    # 以地名索引找出每個地點在資料庫中的位置，不在資料庫中的為 -1
+    positions = pd.Index(place_data['地名']).get_indexer(names)
+    found = positions >= 0
+    if keep_unmatched:
+        event_rows = names.index.to_numpy()
+        place_rows = positions
+        matched = {'事件': event_rows, '地名': names.to_numpy()}
+        # 資料庫可能是空的，只以找到的位置取值，不在資料庫中的地點維持空白
+        for column in PLACE_COLUMNS[1:]:
+            values = np.full(len(place_rows), '', dtype=object)
+            values[found] = place_data[column].to_numpy()[place_rows[found]]
+            matched[column] = values
+    else:
+        event_rows = names.index.to_numpy()[found]
+        place_rows = positions[found]
+        matched = {'事件': event_rows, '地名': names.to_numpy()[found]}
+        for column in PLACE_COLUMNS[1:]:
+            matched[column] = place_data[column].to_numpy()[place_rows]
+    for column in EVENT_COLUMNS:
+        matched[column] = events[column].to_numpy()[event_rows]
+    return pd.DataFrame(matched)
+
+
+def count_recovered(matched):
+    """計算合併結果中，'地點'欄位與匹配的地名不同 (原本以整個欄位比對時會被略過) 的列數"""
+    return int((matched['地點'] != matched['地名']).sum())
+
+
+def format_events(matched):
+    """將合併結果整理為輸出的欄位，描述為「日期_事件類型_地點_額外說明」"""
+    descriptions = [f"{event_date}_{event_type}_{location}_{additional_info}"
+                    for event_date, event_type, location, additional_info
+                    in zip(*(matched[column].tolist() for column in EVENT_COLUMNS))]
+    return pd.DataFrame({
+        'name': matched['地名'].to_numpy(),  # 使用地名（原始名稱）
+        'longitude': matched['經度'].to_numpy(),
+        'latitude': matched['緯度'].to_numpy(),
+        'description': descriptions
+    }, columns=OUTPUT_COLUMNS)
+
+
+def match_events(events, place_data, milepost_locator=None):
+    """依據地點名稱匹配資料庫中的地名並組合事件資訊，回傳輸出欄位的表格"""
+    return format_events(join_places(events, place_data, milepost_locator))
 
 
 def save_to_csv(output_file, processed_events):
-    """將處理後的事件資料儲存至輸出檔案"""
+    """將處理後的事件資料 (表格或以欄位名稱為鍵值的資料) 一次寫入輸出檔案"""
+    frame = pd.DataFrame(processed_events, columns=OUTPUT_COLUMNS)
     with open(output_file, mode='w', newline='', encoding='utf-8') as out_file:
-        fieldnames = ['name', 'longitude', 'latitude', 'description']
-        csv_writer = csv.DictWriter(out_file, fieldnames=fieldnames)
-        csv_writer.writeheader()
-        for event in processed_events:
-            csv_writer.writerow(event)
+        csv_writer = csv.writer(out_file)
+        csv_writer.writerow(OUTPUT_COLUMNS)
+        csv_writer.writerows(zip(*(frame[column].tolist() for column in OUTPUT_COLUMNS)))
 
 
 class CustomArgumentParser(argparse.ArgumentParser):
@@ -58,7 +132,7 @@ class CustomArgumentParser(argparse.ArgumentParser):
 
     def print_help(self, file=None):
         # 自訂顯示的幫助訊息
-        help_message = f"""使用方法: {self.prog} [-h] -D 地名數據庫檔案 -I 輸入檔案 -O 輸出檔案
+        help_message = f"""使用方法: {self.prog} [-h] -D 地名數據庫檔案 -I 輸入檔案 -O 輸出檔案 [--mileposts 里程樁檔案 [--road 道路]] {METRICS_USAGE}
 
 使用地點資料庫，查詢輸入檔案中事件地點座標，並輸出存檔
 
@@ -67,25 +141,39 @@ class CustomArgumentParser(argparse.ArgumentParser):
   -D DATABASE, --database DATABASE
                         地名數據庫檔案
   -I INPUT, --input INPUT
-                        輸入檔案
+                        輸入檔案 (事件日誌 CSV 或事件儲存檔 .parquet)
   -O OUTPUT, --output OUTPUT
                         輸出檔案
+  --mileposts MILEPOSTS
+                        道路折線與里程樁的 GeoJSON 檔案，資料庫中沒有的里程樁號 (例如「台7線24k」) 沿道路內插座標
+  --road ROAD           只寫樁號的地點 (例如「28.7K」) 所在的道路 (例如「台7線」)
+{METRICS_HELP}
         """
         print(help_message, file=file)
 
 
-def main():
+def main(argv=None):
     """主函數，負責解析命令行參數並執行各處理函數"""
     parser = CustomArgumentParser(description="使用地名數據庫檔案，查詢輸入檔案中事件地點座標，並輸出存檔")
     parser.add_argument('-D', '--database', required=True, help="地名數據庫檔案")
     parser.add_argument('-I', '--input', required=True, help="輸入檔案")
     parser.add_argument('-O', '--output', required=True, help="輸出檔案")
-
-    args = parser.parse_args()
-
-    place_data = load_place_data(args.database)
-    processed_events = process_event_data(args.input, place_data)
-    save_to_csv(args.output, processed_events)
+    parser.add_argument('--mileposts', help="道路折線與里程樁的 GeoJSON 檔案")
+    parser.add_argument('--road', help="只寫樁號的地點所在的道路")
+    add_metrics_arguments(parser)
+
+    args = parser.parse_args(argv)
+
+    with stage_metrics('06', args) as metrics:
+        place_data = load_place_data(args.database)
+        milepost_locator = MilepostLocator.from_geojson(args.mileposts, args.road) if args.mileposts else None
+        events = load_events(args.input)
+        matched = join_places(events, place_data, milepost_locator)
+        save_to_csv(args.output, format_events(matched))
+        metrics.add_rows(rows_in=len(events), rows_out=len(matched))
+        metrics.add_count('recovered_rows', count_recovered(matched))
+    print(f"匹配 {len(matched)} 列 (共 {len(events)} 個事件)，其中 {count_recovered(matched)} 列來自多地點的"
+          f"'地點'欄位，原本會被略過")
 
 
 if __name__ == "__main__":
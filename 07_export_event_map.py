@@ -1,7 +1,36 @@
 import csv
 import argparse
-import folium
-import pandas as pd
+import html
+import os
+
+from lazy_modules import lazy_module
+from metrics import METRICS_HELP, METRICS_USAGE, add_metrics_arguments, stage_metrics
+
+# folium 與 pandas 在產生地圖時才載入
+folium = lazy_module('folium')
+folium_plugins = lazy_module('folium.plugins')
+pd = lazy_module('pandas')
+
+# 地圖輸出方式：markers 為每個事件一個標記 (原本的方式)；geojson 與 cluster 將同一座標的事件合併為一個地點，
+# 以一個 GeoJSON 圖層或一份叢集資料輸出，HTML 大小只與地點數有關。auto 在事件數超過門檻時使用 cluster
+MAP_MODES = ['auto', 'markers', 'geojson', 'cluster']
+AUTO_CLUSTER_THRESHOLD = 1000
+
+# 依時間分割輸出檔案的單位 (pandas 的期間代碼)
+SPLIT_PERIODS = {'month': 'M', 'quarter': 'Q', 'year': 'Y'}
+
+# 每個地點的彈出視窗顯示的最近事件數
+RECENT_EVENTS = 5
+
+# 叢集中的每個地點以 JavaScript 建立標記，資料為 [緯度, 經度, 彈出視窗, 提示]
+CLUSTER_CALLBACK = """
+function (row) {
+    var marker = L.marker(new L.LatLng(row[0], row[1]));
+    marker.bindPopup(row[2]);
+    marker.bindTooltip(row[3]);
+    return marker;
+};
+"""
 
 
 def save_to_csv(output_file, processed_events):
@@ -20,7 +49,7 @@ class CustomArgumentParser(argparse.ArgumentParser):
 
     def print_help(self, file=None):
         # 自訂顯示的幫助訊息
-        help_message = f"""使用方法: {self.prog} [-h] -I 輸入檔案 -O 輸出檔案
+        help_message = f"""使用方法: {self.prog} [-h] -I 輸入檔案 -O 輸出檔案 [--mode {{auto,markers,geojson,cluster}}] [--split {{month,quarter,year}}] {METRICS_USAGE}
 
 輸出地圖
 
@@ -30,26 +59,60 @@ class CustomArgumentParser(argparse.ArgumentParser):
                         輸入檔案
   -O OUTPUT, --output OUTPUT
                         輸出檔案
+  --mode {{auto,markers,geojson,cluster}}
+                        輸出方式 (預設 auto)：markers 每個事件一個標記；geojson 與 cluster 將同一座標的事件合併，
+                        顯示事件數與各類型的件數，以一個 GeoJSON 圖層或標記叢集輸出；
+                        auto 在事件超過 {AUTO_CLUSTER_THRESHOLD} 件時使用 cluster，否則使用 markers
+  --split {{month,quarter,year}}
+                        依事件日期按月、季或年分割為多個地圖檔案 (例如 event_map_2024-11.html)
+{METRICS_HELP}
         """
         print(help_message, file=file)
 
 
-def main():
+def main(argv=None):
     """主函數，負責解析命令行參數並執行各處理函數"""
     parser = CustomArgumentParser(description="輸出地圖")
     parser.add_argument('-I', '--input', required=True, help="輸入檔案")
     parser.add_argument('-O', '--output', required=True, help="輸出檔案")
+    parser.add_argument('--mode', choices=MAP_MODES, default='auto', help="輸出方式")
+    parser.add_argument('--split', choices=list(SPLIT_PERIODS), help="依事件日期分割輸出檔案")
+    add_metrics_arguments(parser)
+
+    args = parser.parse_args(argv)
+
+    with stage_metrics('07', args) as metrics:
+        # 載入 CSV 檔案
+        csv_data = pd.read_csv(args.input)
+        metrics.add_rows(rows_in=len(csv_data))
 
-    args = parser.parse_args()
+        # 將地圖儲存為 HTML 檔案
+        if args.split:
+            for output_file in save_split_maps(csv_data, args.output, args.split, args.mode):
+                print(f"已輸出 {output_file}")
+                metrics.add_count('map_files', 1)
+        else:
+            build_event_map(csv_data, args.mode).save(args.output)
+            metrics.add_count('map_files', 1)
 
-    # 載入 CSV 檔案
-    csv_data = pd.read_csv(args.input)
+
+def build_event_map(csv_data, mode='auto'):
+    """依匯出的事件地點 (DataFrame) 建立地圖，管線中可直接傳入記憶體中的表格"""
+    if mode == 'auto':
+        mode = 'cluster' if len(csv_data) > AUTO_CLUSTER_THRESHOLD else 'markers'
 
     # 初始化地圖，將中心設置為平均座標
     avg_lat = csv_data['latitude'].mean()
     avg_lon = csv_data['longitude'].mean()
     m = folium.Map(location=[avg_lat, avg_lon], zoom_start=10)
 
+    if mode == 'geojson':
+        add_geojson_layer(m, aggregate_events(csv_data))
+        return m
+    if mode == 'cluster':
+        add_cluster_layer(m, aggregate_events(csv_data))
+        return m
+
     # 迭代 CSV 中的每一行並添加帶有標籤的標記
     for index, row in csv_data.iterrows():
         # 設定標記，popup 顯示描述，tooltip 顯示地點名稱
@@ -59,8 +122,86 @@ def main():
             tooltip=row['name']
         ).add_to(m)
 
-    # 將地圖儲存為 HTML 檔案
-    m.save(args.output)
+    return m
+
+
+def event_fields(csv_data):
+    """從描述欄位 (日期_事件類型_地點_額外說明) 取出日期與事件類型"""
+    parts = csv_data['description'].fillna('').astype(str).str.split('_', n=2, expand=True)
+    parts = parts.reindex(columns=range(3)).fillna('')
+    return parts[0], parts[1]
+
+
+def aggregate_events(csv_data):
+    """
+    將同一座標的事件合併為一個地點，回傳每個地點一列的表格：
+    地名、事件數、最早與最近的日期、各事件類型的件數 (依件數排序) 與最近幾則事件的描述
+    """
+    event_dates, event_types = event_fields(csv_data)
+    data = csv_data.assign(date=event_dates, event_type=event_types)
+    data = data.dropna(subset=['latitude', 'longitude'])
+    keys = ['latitude', 'longitude']
+
+    places = data.groupby(keys, sort=False).agg(
+        name=('name', 'first'), count=('name', 'size'),
+        first_date=('date', 'min'), last_date=('date', 'max'))
+    type_counts = (data.groupby(keys + ['event_type'], sort=False).size().rename('type_count')
+                   .reset_index().sort_values('type_count', ascending=False, kind='stable'))
+    type_counts['label'] = type_counts['event_type'] + ' ' + type_counts['type_count'].astype(str)
+    places['types'] = type_counts.groupby(keys, sort=False)['label'].agg(list)
+    places['recent'] = data.groupby(keys, sort=False).tail(RECENT_EVENTS).groupby(
+        keys, sort=False)['description'].agg(list)
+    return places.reset_index()
+
+
+def place_popup(place):
+    """地點彈出視窗的 HTML：地名、事件數與日期範圍、各類型的件數、最近幾則事件"""
+    dates = place.first_date if place.first_date == place.last_date else f"{place.first_date} ~ {place.last_date}"
+    recent = '<br>'.join(html.escape(str(description)) for description in reversed(place.recent))
+    return (f"<b>{html.escape(str(place.name))}</b><br>{place.count} 件 ({html.escape(dates)})<br>"
+            f"{html.escape('、'.join(place.types))}<hr>{recent}")
+
+
+def add_geojson_layer(m, places):
+    """將合併後的地點以一個 GeoJSON 圖層加入地圖"""
+    features = [{
+        'type': 'Feature',
+        'geometry': {'type': 'Point', 'coordinates': [float(place.longitude), float(place.latitude)]},
+        'properties': {'name': str(place.name), 'count': int(place.count), 'popup': place_popup(place)}
+    } for place in places.itertuples(index=False)]
+    folium.GeoJson(
+        {'type': 'FeatureCollection', 'features': features},
+        name='事件地點',
+        tooltip=folium.GeoJsonTooltip(fields=['name', 'count'], aliases=['地點', '事件數']),
+        popup=folium.GeoJsonPopup(fields=['popup'], labels=False)
+    ).add_to(m)
+
+
+def add_cluster_layer(m, places):
+    """將合併後的地點以一份標記叢集資料加入地圖，標記在瀏覽器中建立"""
+    data = [[float(place.latitude), float(place.longitude), place_popup(place),
+             f"{html.escape(str(place.name))} ({place.count} 件)"]
+            for place in places.itertuples(index=False)]
+    folium_plugins.FastMarkerCluster(data, callback=CLUSTER_CALLBACK, name='事件地點').add_to(m)
+
+
+def split_by_period(csv_data, split):
+    """依描述欄位中的日期將事件分組，回傳 [(期間, 表格), ...]；無法辨識日期的事件歸入「未知日期」"""
+    event_dates, _ = event_fields(csv_data)
+    periods = pd.to_datetime(event_dates, errors='coerce').dt.to_period(SPLIT_PERIODS[split])
+    labels = periods.astype(str).where(periods.notna(), '未知日期')
+    return [(label, csv_data[labels == label]) for label in sorted(labels.unique())]
+
+
+def save_split_maps(csv_data, output_file, split, mode='auto'):
+    """依期間分別輸出地圖 (例如 event_map_2024-11.html)，回傳輸出的檔案路徑"""
+    root, extension = os.path.splitext(output_file)
+    output_files = []
+    for label, period_data in split_by_period(csv_data, split):
+        period_file = f"{root}_{label}{extension or '.html'}"
+        build_event_map(period_data, mode).save(period_file)
+        output_files.append(period_file)
+    return output_files
 
 
 if __name__ == "__main__":
@@ -0,0 +1,171 @@
+"""
+比較 01_clean_chat_data.py 原本整檔逐行處理的 parse_events 與串流、以訊息為單位的解析器的效能。
+
+以 chat_history.txt 重複 N 次 (預設 100 倍) 產生合成的聊天記錄，
+分別在獨立的子行程中執行兩種實作，量測執行時間與尖峰記憶體 (RSS)。
+另外以逐漸增加的關鍵字數量 (事件分類檔的同義詞加上隨機產生的關鍵字) 比對同一批訊息，
+比較原本的正規表達式交替式與 KeywordMatcher (Aho–Corasick) 的耗時是否隨關鍵字數量增加。
+
+使用方法: python benchmarks/bench_clean_chat_data.py [-S 倍數] [-I 聊天記錄] [-K 關鍵字數量,...]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import re
+import resource
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stages import ROOT_DIR, load_stage  # noqa: E402
+
+
+def legacy_parse_events(chat_content):
+    """原本的實作：整份內容 splitlines 後逐行比對，作為效能比較的基準。"""
+    events_by_date = defaultdict(lambda: defaultdict(list))
+    current_date = None
+    target_event_types = ['落石', '停電']
+
+    for line in chat_content.splitlines():
+        date_match = re.match(r'^(\d{4}/\d{2}/\d{2}),', line)
+        if date_match:
+            current_date = date_match.group(1)
+        elif current_date:
+            for event_type in target_event_types:
+                if event_type in line:
+                    event_details = re.sub(r'\d{2}:\d{2} (AM|PM)\t.*?\t', '', line).strip()
+                    events_by_date[current_date][event_type].append(event_details)
+    return events_by_date
+
+
+class AlternationMatcher:
+    """原本的關鍵字比對器：所有關鍵字組成單一交替式並加上前瞻，作為關鍵字數量擴展性的比較基準。"""
+
+    def __init__(self, keywords):
+        self.keywords = list(dict.fromkeys(keywords))
+        alternation = '|'.join(re.escape(keyword) for keyword in sorted(self.keywords, key=len, reverse=True))
+        self._prefilter = re.compile(alternation)
+        self._pattern = re.compile(f'(?=({alternation}))')
+        self._contained = {keyword: {other for other in self.keywords if other in keyword} for keyword in self.keywords}
+        self._order = {keyword: index for index, keyword in enumerate(self.keywords)}
+
+    def find_all(self, text):
+        if not self._prefilter.search(text):
+            return []
+        found = set()
+        for match in self._pattern.finditer(text):
+            found |= self._contained[match.group(1)]
+        return sorted(found, key=self._order.__getitem__)
+
+
+def synthetic_keywords(count, seed=0):
+    """產生 count 個 2 ~ 4 字的隨機中文關鍵字 (常用漢字範圍)，模擬大型事件分類檔的同義詞。"""
+    rng = random.Random(seed)
+    keywords = set()
+    while len(keywords) < count:
+        keywords.add(''.join(chr(rng.randint(0x4E00, 0x6FFF)) for _ in range(rng.randint(2, 4))))
+    return sorted(keywords)
+
+
+def bench_keyword_counts(path, counts, scale):
+    """以不同數量的關鍵字比對聊天記錄中的每則訊息，回傳 [(關鍵字數, 交替式秒數, 自動機秒數, 結果相同), ...]。"""
+    stage = load_stage(1)
+    with open(path, 'r', encoding='utf-8') as file:
+        texts = [message.text for message in stage.iter_messages(file)] * scale
+    base_keywords = list(stage.EventClassifier(stage.load_taxonomy(
+        os.path.join(ROOT_DIR, 'event_taxonomy.json')))._event_types_by_keyword)
+    results = []
+    for count in counts:
+        keywords = base_keywords + synthetic_keywords(max(count - len(base_keywords), 0))
+        timings, outputs = [], []
+        for matcher_class in (AlternationMatcher, stage.KeywordMatcher):
+            matcher = matcher_class(keywords)
+            start = time.perf_counter()
+            outputs.append([matcher.find_all(text) for text in texts])
+            timings.append(time.perf_counter() - start)
+        results.append((len(keywords), *timings, outputs[0] == outputs[1]))
+    return len(texts), results
+
+
+def run_legacy(path):
+    stage = load_stage(1)
+    return stage.format_event_summary(legacy_parse_events(stage.read_file(path)))
+
+
+def run_streaming(path):
+    stage = load_stage(1)
+    return stage.format_event_summary(stage.collect_events(stage.stream_file_events(path)))
+
+
+def measure(runner, path, queue):
+    """在子行程中執行，回傳 (秒數, 尖峰 RSS MB, 輸出摘要)。"""
+    start = time.perf_counter()
+    summary = runner(path)
+    elapsed = time.perf_counter() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 的 ru_maxrss 單位為 KB，macOS 為 bytes
+    peak_mb = peak_rss / (1024 * 1024) if sys.platform == 'darwin' else peak_rss / 1024
+    queue.put((elapsed, peak_mb, summary))
+
+
+def run_isolated(runner, path):
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=measure, args=(runner, path, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def build_synthetic_export(source, scale, target):
+    """將原始聊天記錄重複 scale 次寫入 target。"""
+    with open(source, 'r', encoding='utf-8') as file:
+        content = file.read()
+    if not content.endswith('\n'):
+        content += '\n'
+    with open(target, 'w', encoding='utf-8') as file:
+        for _ in range(scale):
+            file.write(content)
+    return os.path.getsize(target)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比較聊天記錄解析器的效能")
+    parser.add_argument('-I', '--input', default=os.path.join(ROOT_DIR, 'chat_history.txt'),
+                        help="作為樣本的聊天記錄檔案")
+    parser.add_argument('-S', '--scale', type=int, default=100, help="樣本重複的倍數")
+    parser.add_argument('-K', '--keyword-counts', default='10,100,1000,5000',
+                        help="關鍵字比對使用的關鍵字數量 (以逗號分隔)")
+    args = parser.parse_args()
+    keyword_counts = [int(count) for count in args.keyword_counts.split(',') if count.strip()]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        synthetic_path = os.path.join(tmp_dir, 'synthetic_chat.txt')
+        size = build_synthetic_export(args.input, args.scale, synthetic_path)
+        print(f"合成聊天記錄：{args.scale} 倍，{size / (1024 * 1024):.1f} MB")
+
+        results = {}
+        for name, runner in (('legacy', run_legacy), ('streaming', run_streaming)):
+            elapsed, peak_mb, summary = run_isolated(runner, synthetic_path)
+            results[name] = summary
+            print(f"{name:>10}: {elapsed:8.2f} 秒  尖峰 RSS {peak_mb:8.1f} MB")
+
+        # 串流解析器以訊息為單位，多行訊息會合併成一筆，因此比較的是事件描述的筆數
+        for name, summary in results.items():
+            details = sum(line.count('；') + 1 for line in summary.splitlines())
+            print(f"{name:>10}: {len(summary.splitlines())} 行摘要，{details} 筆事件描述")
+
+    # 關鍵字比對只需要訊息文字，樣本重複的倍數縮小為十分之一即可得到穩定的時間
+    message_count, keyword_results = bench_keyword_counts(args.input, keyword_counts, max(args.scale // 10, 1))
+    print(f"\n關鍵字比對：{message_count} 則訊息")
+    print(f"{'關鍵字數':>8} {'交替式':>10} {'自動機':>10}  結果")
+    for count, alternation_seconds, automaton_seconds, same in keyword_results:
+        print(f"{count:>8} {alternation_seconds:9.3f}秒 {automaton_seconds:9.3f}秒  {'相同' if same else '不同！'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+量測 01_clean_chat_data.py 切段平行解析 (-J) 在 1 ~ N 個行程下的擴展性。
+
+以 synthetic_line_export.py 產生指定規模的聊天記錄 (可分成多個檔案，模擬多個群組或多年的匯出檔)，
+先以依序解析 (-J 1) 作為基準，再以 2 ~ N 個行程執行，每種設定在獨立的子行程中執行 --repeat 次取最短時間，
+並確認摘要與依序解析完全相同。加速比受限於 CPU 核心數，超過核心數的行程數只會增加切換成本。
+
+使用方法: python benchmarks/bench_clean_scaling.py [--scale 100] [--files 1] [--max-jobs CPU核心數]
+                                                  [--shard-mb 16] [--repeat 3]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_line_export import write_export  # noqa: E402
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLEAN_SCRIPT = os.path.join(ROOT_DIR, '01_clean_chat_data.py')
+TAXONOMY_FILE = os.path.join(ROOT_DIR, 'event_taxonomy.json')
+
+
+def run_clean(inputs, output, jobs, shard_mb):
+    """在子行程中執行 01 階段，回傳耗時 (秒)。"""
+    command = [sys.executable, CLEAN_SCRIPT, '-I', *inputs, '-O', output, '-T', TAXONOMY_FILE,
+               '-J', str(jobs), '--shard-mb', str(shard_mb)]
+    start = time.perf_counter()
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def read_bytes(path):
+    with open(path, 'rb') as file:
+        return file.read()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="量測聊天記錄切段平行解析的擴展性")
+    parser.add_argument('--scale', type=float, default=100, help="聊天記錄的總規模 (相對於 chat_history.txt 的倍數)")
+    parser.add_argument('--files', type=int, default=1, help="分成幾個檔案 (各檔案使用不同的種子)")
+    parser.add_argument('--max-jobs', type=int, default=os.cpu_count() or 1, help="最多使用的行程數")
+    parser.add_argument('--shard-mb', type=float, default=16, help="切段時每段的大小 (MB)")
+    parser.add_argument('--repeat', type=int, default=3, help="每種設定執行的次數 (取最短時間)")
+    parser.add_argument('--seed', type=int, default=0, help="亂數種子")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        inputs, total_bytes = [], 0
+        for index in range(args.files):
+            path = os.path.join(tmp_dir, f'chat_history_{index}.txt')
+            total_bytes += write_export(path, args.scale / args.files, args.seed + index)['bytes']
+            inputs.append(path)
+        print(f"聊天記錄：{args.files} 個檔案，共 {total_bytes / 1e6:.1f} MB；CPU 核心 {os.cpu_count()} 個，"
+              f"每段 {args.shard_mb:g} MB")
+
+        expected_path = os.path.join(tmp_dir, 'summary_serial.txt')
+        serial = min(run_clean(inputs, expected_path, 1, args.shard_mb) for _ in range(args.repeat))
+        expected = read_bytes(expected_path)
+        print(f"{'行程數':>6} {'秒數':>8} {'MB/秒':>8} {'加速比':>7} {'效率':>6}  摘要")
+        print(f"{'1 (依序)':>6} {serial:8.2f} {total_bytes / 1e6 / serial:8.1f} {1:7.2f} {1:6.0%}  基準")
+
+        identical = True
+        for jobs in range(2, args.max_jobs + 1):
+            output = os.path.join(tmp_dir, f'summary_{jobs}.txt')
+            elapsed = min(run_clean(inputs, output, jobs, args.shard_mb) for _ in range(args.repeat))
+            same = read_bytes(output) == expected
+            identical &= same
+            speedup = serial / elapsed
+            print(f"{jobs:>6} {elapsed:8.2f} {total_bytes / 1e6 / elapsed:8.1f} {speedup:7.2f} {speedup / jobs:6.0%}  "
+                  f"{'相同' if same else '不同！'}")
+        if args.max_jobs < 2:
+            print("未比較平行解析，以 --max-jobs 指定大於 1 的行程數")
+    return 0 if identical else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
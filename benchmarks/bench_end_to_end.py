@@ -0,0 +1,261 @@
+"""
+端對端的規模基準測試：以 synthetic_line_export.py 產生 chat_history.txt 的 1、10、100、1000 倍大小的聊天記錄，
+依序執行 01 ~ 07 階段，記錄各階段的耗時、處理量 (每秒處理的輸入列數) 與記憶體用量峰值，並與儲存的基準比較。
+
+- 每個階段在獨立的子程序中以與命令列相同的參數執行 (加上 --metrics)，數據取自階段寫入的統計 (見 metrics.py)，
+  記憶體用量峰值是該子程序的 VmHWM；每個階段執行 --repeat 次，取最快的一次；
+- 02 階段使用依地名清單填入地點的假大語言模型供應商，05 階段使用不連線的 geocoder.FakeMapsClient，
+  兩者預設沒有延遲，測得的是程式本身的耗時，不需要 API 金鑰；
+- 耗時或記憶體用量比基準多出 --tolerance 的比例 (且超過最小差距) 時標示為退步，並以結束碼 1 結束；
+- --save-baseline 將這次的結果寫入基準檔案 (只取代這次執行的規模)。基準與機器有關，換機器後請重新記錄。
+
+使用方法: python benchmarks/bench_end_to_end.py [--scales 1 10 100 1000] [--repeat 3] [--seed 0] [--tolerance 0.25]
+                                               [--baseline 基準檔案] [--save-baseline] [--work-dir 目錄]
+"""
+import argparse
+import functools
+import json
+import os
+import platform
+import re
+import runpy
+import subprocess
+import sys
+import tempfile
+import time
+import types
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, BENCHMARK_DIR)
+
+from geocoder import FakeMapsClient  # noqa: E402
+from llm_providers import FakeProvider  # noqa: E402
+from prompt_builder import CSV_HEADER  # noqa: E402
+from stages import stage_path  # noqa: E402
+from synthetic_line_export import PLACE_NAMES, ROADS, write_export  # noqa: E402
+
+DEFAULT_SCALES = [1, 10, 100, 1000]
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, 'baselines', 'end_to_end.json')
+# 差距小於此值時不視為退步：小規模時大部分的耗時是載入套件，前後兩次執行可能相差三成
+MIN_REGRESSION_SECONDS = 0.25
+MIN_REGRESSION_BYTES = 16 * 1024 * 1024
+RATE_LIMIT_KEYS = ['requests_per_minute', 'tokens_per_minute']
+
+# 依地名清單辨識事件描述中的地點，較長的地名優先 (例如「下巴陵」不會被辨識為「巴陵」)
+PLACE_PATTERN = re.compile('|'.join(
+    [rf"{re.escape(road)}\d+(?:\.\d+)?K" for road, _, _ in ROADS]
+    + [re.escape(name) for name in sorted(PLACE_NAMES, key=len, reverse=True)]))
+
+
+class GazetteerFakeProvider(FakeProvider):
+    """將摘要中提到的地名 (不重複，以分號分隔) 填入地點欄位的假供應商，讓 04 ~ 07 階段有地點可以處理。"""
+
+    def respond(self, message):
+        rows = []
+        for line in message.splitlines():
+            fields = line.split('，', 2)
+            if len(fields) == 3:
+                places = ';'.join(dict.fromkeys(PLACE_PATTERN.findall(fields[2])))
+                rows.append(f"{fields[0].replace('/', '-')},{fields[1]},{places},")
+        return '\n'.join([CSV_HEADER, *rows])
+
+
+def install_stubs(llm_latency, geocoder_latency):
+    """以替身取代 02 階段的大語言模型供應商與 05 階段的 googlemaps 模組 (在執行階段腳本之前呼叫)。"""
+    import llm_providers
+
+    llm_providers.create_provider = lambda provider, api_key, model_name, system_config, **kwargs: \
+        GazetteerFakeProvider(model_name, system_config, base_latency=llm_latency, seconds_per_1k_tokens=0, **kwargs)
+    googlemaps = types.ModuleType('googlemaps')
+    googlemaps.Client = functools.partial(FakeMapsClient, latency=geocoder_latency)
+    sys.modules['googlemaps'] = googlemaps
+
+
+def run_child(argv):
+    """子程序：安裝替身後以命令列的方式執行階段腳本。參數為 階段編號 大語言模型延遲 地圖延遲 [階段的選項 ...]。"""
+    number, llm_latency, geocoder_latency, *stage_args = argv
+    install_stubs(float(llm_latency), float(geocoder_latency))
+    path = stage_path(int(number))
+    sys.argv = [path, *stage_args]
+    runpy.run_path(path, run_name='__main__')
+    return 0
+
+
+def write_system_config(path):
+    """複製 02 階段的系統設定檔並移除每分鐘請求數與 token 數的限制，替身沒有速率限制，耗時才是程式本身的耗時。"""
+    with open(os.path.join(ROOT_DIR, 'system_config_openai.json'), 'r', encoding='utf-8') as config_file:
+        config = json.load(config_file)
+    for key in RATE_LIMIT_KEYS:
+        config.pop(key, None)
+    with open(path, 'w', encoding='utf-8') as config_file:
+        json.dump(config, config_file, ensure_ascii=False, indent=2)
+
+
+def stage_jobs(directory):
+    """
+    各階段的 (編號, 選項, 每次執行前刪除的檔案)，與依序執行各階段腳本時相同。
+    05 階段會更新地名數據庫與查無結果的快取，重複執行前刪除，每次都從空白的數據庫開始查詢。
+    """
+    def path(name):
+        return os.path.join(directory, name)
+
+    write_system_config(path('system_config.json'))
+    return [
+        (1, ['-I', path('chat_history.txt'), '-O', path('output_summary.txt'),
+             '-T', os.path.join(ROOT_DIR, 'event_taxonomy.json')], []),
+        (2, ['-K', 'unused', '-L', 'fake', '-P', 'openai', '-S', path('system_config.json'),
+             '-H', os.path.join(ROOT_DIR, 'history_openai.json'), '-I', path('output_summary.txt'),
+             '-O', path('event_log.txt'), '-C', '2000', '-J', '8', '--no-cache'], []),
+        (3, ['-I', path('event_log.txt'), '-O', path('chart.png')], []),
+        (4, ['-I', path('event_log.txt'), '-O', path('unique_places.csv')], []),
+        (5, ['-K', 'unused', '-P', '桃園市復興區', '-D', path('place_db.csv'), '-I', path('unique_places.csv'),
+             '-O', path('updated_places.csv'), '--qps', '0', '--negative-cache', path('negative_cache.sqlite')],
+         [path('place_db.csv'), path('negative_cache.sqlite')]),
+        (6, ['-D', path('place_db.csv'), '-I', path('event_log.txt'), '-O', path('output_matched_events.csv')], []),
+        (7, ['-I', path('output_matched_events.csv'), '-O', path('event_map.html')], []),
+    ]
+
+
+def run_stage(number, stage_args, directory, llm_latency, geocoder_latency):
+    """在子程序中執行一個階段，回傳該階段的統計 (加上包含程序啟動的總耗時)；失敗時顯示輸出並結束。"""
+    metrics_path = os.path.join(directory, f"metrics_{number:02d}.jsonl")
+    if os.path.exists(metrics_path):
+        os.remove(metrics_path)
+    command = [sys.executable, os.path.abspath(__file__), 'child', str(number), str(llm_latency),
+               str(geocoder_latency), *stage_args, '--metrics', metrics_path]
+    started = time.perf_counter()
+    completed = subprocess.run(command, cwd=directory, capture_output=True, text=True,
+                               env={**os.environ, 'MPLBACKEND': 'Agg'})
+    process_seconds = time.perf_counter() - started
+    if completed.returncode != 0:
+        sys.exit(f"{number:02d} 階段執行失敗 ({completed.returncode})\n{completed.stdout}{completed.stderr}")
+    with open(metrics_path, 'r', encoding='utf-8') as metrics_file:
+        record = json.loads(metrics_file.readlines()[-1])
+    wall = record['wall_seconds']
+    return {'wall_seconds': wall, 'process_seconds': round(process_seconds, 6),
+            'cpu_seconds': record['cpu_seconds'], 'peak_rss_bytes': record['peak_rss_bytes'],
+            'rows_in': record['rows_in'], 'rows_out': record['rows_out'],
+            'rows_per_second': round(record['rows_in'] / wall, 1) if record['rows_in'] and wall else None}
+
+
+def run_scale(scale, directory, args):
+    """產生指定規模的聊天記錄並執行所有階段，回傳 (聊天記錄的統計, {階段: 統計})。"""
+    started = time.perf_counter()
+    export = write_export(os.path.join(directory, 'chat_history.txt'), scale, args.seed,
+                          args.event_rate, args.place_rate)
+    export['seconds'] = round(time.perf_counter() - started, 3)
+    results = {}
+    for number, stage_args, reset_files in stage_jobs(directory):
+        runs = []
+        for _ in range(args.repeat):
+            for path in reset_files:
+                if os.path.exists(path):
+                    os.remove(path)
+            runs.append(run_stage(number, stage_args, directory, args.llm_latency, args.geocoder_latency))
+        # 取最快的一次，其他程序造成的延遲只會讓耗時變長
+        results[f"{number:02d}"] = min(runs, key=lambda run: run['wall_seconds'])
+    return export, results
+
+
+def compare(current, baseline, tolerance):
+    """回傳退步的項目說明；沒有基準的階段不比較。"""
+    regressions = []
+    for key, unit, minimum, scale_unit in [('wall_seconds', '秒', MIN_REGRESSION_SECONDS, 1),
+                                           ('peak_rss_bytes', 'MB', MIN_REGRESSION_BYTES, 1e6)]:
+        value, reference = current.get(key), (baseline or {}).get(key)
+        if value is None or not reference:
+            continue
+        if value > reference * (1 + tolerance) and value - reference > minimum:
+            regressions.append(f"{key} {reference / scale_unit:.2f} -> {value / scale_unit:.2f} {unit} "
+                               f"(+{(value / reference - 1) * 100:.0f}%)")
+    return regressions
+
+
+def format_rate(rate):
+    return f"{rate:>12,.0f}" if rate is not None else f"{'-':>12}"
+
+
+def load_baseline(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as baseline_file:
+            return json.load(baseline_file)
+    except FileNotFoundError:
+        return None
+
+
+def save_baseline(path, baseline, scales_results, args):
+    document = baseline or {'scales': {}}
+    document['machine'] = {'python': platform.python_version(), 'platform': platform.platform(),
+                           'processor': platform.machine(), 'cpus': os.cpu_count()}
+    document['parameters'] = {'seed': args.seed, 'repeat': args.repeat, 'event_rate': args.event_rate, 'place_rate': args.place_rate,
+                              'llm_latency': args.llm_latency, 'geocoder_latency': args.geocoder_latency}
+    document['scales'].update(scales_results)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'w', encoding='utf-8') as baseline_file:
+        json.dump(document, baseline_file, ensure_ascii=False, indent=2, sort_keys=True)
+        baseline_file.write('\n')
+    os.replace(temporary_path, path)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ['child']:
+        return run_child(argv[1:])
+
+    parser = argparse.ArgumentParser(description="以不同規模的合成聊天記錄執行所有階段，並與基準比較")
+    parser.add_argument('--scales', type=float, nargs='+', default=DEFAULT_SCALES, help="相對於 chat_history.txt 的規模倍數")
+    parser.add_argument('--seed', type=int, default=0, help="亂數種子")
+    parser.add_argument('--event-rate', type=float, default=0.05, help="一般訊息中提到事件關鍵字的比例")
+    parser.add_argument('--place-rate', type=float, default=0.7, help="事件訊息中提到地名或道路里程的比例")
+    parser.add_argument('--repeat', type=int, default=3, help="每個階段的執行次數 (取最快的一次)")
+    parser.add_argument('--llm-latency', type=float, default=0.0, help="假大語言模型供應商每次請求的延遲 (秒)")
+    parser.add_argument('--geocoder-latency', type=float, default=0.0, help="假 Google Maps 客戶端每次呼叫的延遲 (秒)")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="基準檔案")
+    parser.add_argument('--save-baseline', action='store_true', help="將這次的結果寫入基準檔案")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="超過基準多少比例視為退步")
+    parser.add_argument('--work-dir', help="保留輸出檔案的目錄 (預設使用暫存目錄並在結束後刪除)")
+    args = parser.parse_args(argv)
+
+    baseline = load_baseline(args.baseline)
+    if baseline is None and not args.save_baseline:
+        print(f"找不到基準檔案 {args.baseline}，只顯示結果 (以 --save-baseline 記錄基準)")
+    scales_results, regressions = {}, []
+    for scale in args.scales:
+        label = f"{scale:g}x"
+        with tempfile.TemporaryDirectory() as temporary_dir:
+            directory = os.path.join(args.work_dir, label) if args.work_dir else temporary_dir
+            os.makedirs(directory, exist_ok=True)
+            export, results = run_scale(scale, directory, args)
+        scales_results[label] = {'export': export, 'stages': results}
+        reference = ((baseline or {}).get('scales', {}).get(label) or {}).get('stages', {})
+
+        print(f"\n規模 {label}：{export['days']:,} 天、{export['messages']:,} 則訊息、{export['bytes'] / 1e6:.1f} MB "
+              f"(產生耗時 {export['seconds']:.2f} 秒)")
+        print(f"{'階段':<4} {'耗時 (秒)':>10} {'含啟動 (秒)':>12} {'輸入列數':>10} {'列/秒':>12} {'記憶體 (MB)':>12} {'基準耗時':>10}  比較")
+        for stage, result in results.items():
+            stage_regressions = [] if args.save_baseline else compare(result, reference.get(stage), args.tolerance)
+            regressions += [f"{label} {stage} 階段：{regression}" for regression in stage_regressions]
+            base_wall = reference.get(stage, {}).get('wall_seconds')
+            print(f"{stage:<6} {result['wall_seconds']:>10.3f} {result['process_seconds']:>12.3f} "
+                  f"{result['rows_in'] or 0:>12,} {format_rate(result['rows_per_second'])} "
+                  f"{(result['peak_rss_bytes'] or 0) / 1e6:>12.1f} "
+                  f"{f'{base_wall:.3f}' if base_wall is not None else '-':>12}  "
+                  f"{'退步' if stage_regressions else ('-' if base_wall is None else '正常')}")
+
+    if args.save_baseline:
+        save_baseline(args.baseline, baseline, scales_results, args)
+        print(f"\n已將 {', '.join(scales_results)} 的結果寫入基準檔案 {args.baseline}")
+        return 0
+    if regressions:
+        print("\n與基準相比退步的項目：")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
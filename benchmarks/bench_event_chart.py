@@ -0,0 +1,80 @@
+"""
+比較 03_visualize_event_trends.py 在 100k 個事件時各圖表類型的繪製時間與圖檔大小：
+scatter (每個事件一個點，原本的方式) 與依日、週、月統計後的 bar、heatmap 以及每個事件類型一個子圖的 small multiples。
+
+事件分布在數年內，事件類型數可調整。使用不需要顯示器的 Agg 後端，不開啟互動視窗。
+
+使用方法: python benchmarks/bench_event_chart.py [--events 100000] [--years 3] [--types 6] [--dpi 300]
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stages import load_stage  # noqa: E402
+
+EVENT_TYPES = ['落石', '停電', '坍方', '道路封閉', '交通管制', '事故', '淹水', '土石流', '路樹倒塌', '施工']
+
+# 測試環境不一定有設定的中文字型，略過找不到字型的訊息
+logging.getLogger('matplotlib.font_manager').setLevel(logging.ERROR)
+
+
+def make_events(count, years, types, seed):
+    """產生事件日誌表格 (日期為字串，與讀入的事件日誌相同)。"""
+    generator = np.random.default_rng(seed)
+    days = generator.integers(0, 365 * years, count)
+    return pd.DataFrame({
+        '日期': (pd.Timestamp('2022-01-01') + pd.to_timedelta(days, unit='D')).strftime('%Y-%m-%d'),
+        '事件類型': generator.choice(EVENT_TYPES[:types], count),
+        '地點': '台7線',
+        '額外說明': ''
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比較事件趨勢圖各圖表類型的繪製時間")
+    parser.add_argument('--events', type=int, default=100_000, help="事件數")
+    parser.add_argument('--years', type=int, default=3, help="事件分布的年數")
+    parser.add_argument('--types', type=int, default=6, help="事件類型數 (最多 10)")
+    parser.add_argument('--dpi', type=int, default=300, help="圖檔解析度")
+    parser.add_argument('--seed', type=int, default=0, help="亂數種子")
+    args = parser.parse_args()
+
+    stage = load_stage(3)
+    events = make_events(args.events, args.years, args.types, args.seed)
+    cases = [
+        ('scatter', {'mode': 'scatter'}),
+        ('bar (日)', {'mode': 'bar', 'freq': 'day'}),
+        ('bar (週)', {'mode': 'bar', 'freq': 'week'}),
+        ('bar (月)', {'mode': 'bar', 'freq': 'month'}),
+        ('heatmap (週)', {'mode': 'heatmap', 'freq': 'week'}),
+        ('small multiples (週)', {'mode': 'bar', 'freq': 'week', 'small_multiples': True}),
+        ('auto', {}),
+    ]
+
+    started = time.perf_counter()
+    dated = events.assign(日期=pd.to_datetime(events['日期']))
+    binned = stage.bin_events(dated, 'week')
+    print(f"{args.events} 個事件、{args.types} 種事件類型、{args.years} 年，解析日期並按週統計 "
+          f"{time.perf_counter() - started:.3f} 秒 ({len(binned)} 週)")
+    print(f"{'圖表類型':<22} {'耗時 (秒)':>10} {'圖檔 (KB)':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        for label, options in cases:
+            output_file = os.path.join(directory, 'chart.png')
+            started = time.perf_counter()
+            stage.plot_event_data(events, output_file, "事件發生頻率", dpi=args.dpi, **options)
+            elapsed = time.perf_counter() - started
+            print(f"{label:<22} {elapsed:>10.2f} {os.path.getsize(output_file) / 1e3:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+比較 07_export_event_map.py 各輸出方式在 1k、10k、100k 個事件時的產生時間與 HTML 大小：
+markers (每個事件一個 folium.Marker，原本的方式)、geojson 與 cluster (同一座標的事件合併為一個地點，
+以一個 GeoJSON 圖層或一份標記叢集資料輸出)，以及依月分割輸出的 cluster。
+
+事件分布在固定數量的地點上 (預設 2000 個)，日期分布在兩年內。markers 在事件數很多時需要數分鐘，
+預設只在不超過 --max-markers 個事件時執行。
+
+使用方法: python benchmarks/bench_event_map.py [--sizes 1000 10000 100000] [--places 2000] [--max-markers 10000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stages import load_stage  # noqa: E402
+
+EVENT_TYPES = ['落石', '坍方', '道路封閉', '交通管制', '事故']
+
+
+def make_events(count, places, seed):
+    """產生匯出的事件地點表格 (與 06 階段的輸出相同的欄位)。"""
+    generator = random.Random(seed)
+    rows = []
+    for index in range(count):
+        place = generator.randrange(places)
+        day = pd.Timestamp('2023-01-01') + pd.Timedelta(days=generator.randrange(730))
+        rows.append({
+            'name': f"地點{place:05d}",
+            'longitude': round(121.2 + place % 50 / 100, 4),
+            'latitude': round(24.6 + place // 50 / 100, 4),
+            'description': f"{day:%Y-%m-%d}_{generator.choice(EVENT_TYPES)}_地點{place:05d}_第{index}則事件說明"
+        })
+    return pd.DataFrame(rows)
+
+
+def measure(function):
+    """回傳 (耗時, 輸出的檔案總大小)。"""
+    started = time.perf_counter()
+    paths = function()
+    return time.perf_counter() - started, sum(os.path.getsize(path) for path in paths)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比較事件地圖各輸出方式的產生時間與 HTML 大小")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10_000, 100_000], help="事件數")
+    parser.add_argument('--places', type=int, default=2000, help="地點數")
+    parser.add_argument('--max-markers', type=int, default=10_000, help="markers 方式執行的最大事件數")
+    parser.add_argument('--seed', type=int, default=0, help="亂數種子")
+    args = parser.parse_args()
+
+    stage = load_stage(7)
+    print(f"{'事件數':>8} {'方式':<14} {'耗時 (秒)':>10} {'HTML (MB)':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            events = make_events(size, args.places, args.seed)
+            for mode in ('markers', 'geojson', 'cluster'):
+                if mode == 'markers' and size > args.max_markers:
+                    print(f"{size:>8} {mode:<14} {'略過':>10}")
+                    continue
+                output_file = os.path.join(directory, f"{mode}_{size}.html")
+
+                def render():
+                    stage.build_event_map(events, mode).save(output_file)
+                    return [output_file]
+                elapsed, html_size = measure(render)
+                print(f"{size:>8} {mode:<14} {elapsed:>10.2f} {html_size / 1e6:>10.2f}")
+
+            split_file = os.path.join(directory, f"split_{size}.html")
+            elapsed, html_size = measure(lambda: stage.save_split_maps(events, split_file, 'month', 'cluster'))
+            print(f"{size:>8} {'cluster (按月)':<14} {elapsed:>10.2f} {html_size / 1e6:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+比較 event_query.py 的索引查詢與每次掃描整個合併表格 (已載入記憶體，以 pandas 條件篩選) 的耗時，並確認結果相同。
+
+產生地點數據庫 (地點分布在北部山區約 0.6 x 0.6 度的範圍內) 與事件日誌 (預設 1M 列，分布在三年內，
+一部分事件有多個以分號分隔的地點)，建立索引後執行日期範圍、範圍、半徑、組合條件與依地點統計的查詢。
+
+使用方法: python benchmarks/bench_event_query.py [--events 1000000] [--places 5000] [--repeat 20]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from event_query import EventIndex, haversine_km, parse_bound  # noqa: E402
+from event_store import parse_event_dates  # noqa: E402
+from place_db import PLACE_DB_COLUMNS  # noqa: E402
+from prompt_builder import CSV_HEADER  # noqa: E402
+
+EVENT_TYPES = ['落石', '坍方', '道路封閉', '交通管制', '事故']
+ROADS = ['台7線', '台7甲線', '台3線', '縣道118線']
+
+
+def write_inputs(directory, events, places, multi_rate, seed):
+    """產生地點數據庫與事件日誌，回傳兩者的路徑。"""
+    generator = random.Random(seed)
+    names = [f"{ROADS[index % len(ROADS)]}{index // len(ROADS) / 10:g}k" for index in range(places)]
+    db_path = os.path.join(directory, 'place_db.csv')
+    with open(db_path, 'w', encoding='utf-8') as db_file:
+        db_file.write('|'.join(PLACE_DB_COLUMNS) + '\n')
+        for name in names:
+            db_file.write(f"{name}|{name}|{name}(建議)|{generator.uniform(24.4, 25.0):.5f}|"
+                          f"{generator.uniform(121.0, 121.6):.5f}\n")
+
+    event_path = os.path.join(directory, 'event_log.txt')
+    with open(event_path, 'w', encoding='utf-8') as event_file:
+        event_file.write(CSV_HEADER + '\n')
+        for index in range(events):
+            if generator.random() < multi_rate:
+                location = ';'.join(generator.sample(names, 2))
+            else:
+                location = generator.choice(names)
+            day = pd.Timestamp('2022-01-01') + pd.Timedelta(days=generator.randrange(3 * 365))
+            event_file.write(f"{day:%Y-%m-%d},{generator.choice(EVENT_TYPES)},{location},第{index}則\n")
+    return db_path, event_path
+
+
+def prepare_scan(entries):
+    """掃描用的表格：日期與座標先轉換一次，每次查詢只計算條件。"""
+    return entries.assign(日期值=parse_event_dates(entries['日期']),
+                          緯度值=pd.to_numeric(entries['緯度'], errors='coerce'),
+                          經度值=pd.to_numeric(entries['經度'], errors='coerce'))
+
+
+def scan(entries, start=None, end=None, event_types=None, place=None, bbox=None, center=None, radius_km=None):
+    """不使用索引：每次對整個表格 (prepare_scan) 計算條件。"""
+    dates, latitudes, longitudes = entries['日期值'], entries['緯度值'], entries['經度值']
+    mask = pd.Series(True, index=entries.index)
+    if start is not None:
+        mask &= dates >= parse_bound(start)
+    if end is not None:
+        mask &= dates <= parse_bound(end, upper=True)
+    if event_types:
+        mask &= entries['事件類型'].isin(event_types)
+    if place:
+        mask &= entries['地名'].str.contains(place, regex=False)
+    if bbox is not None:
+        south, west, north, east = bbox
+        mask &= latitudes.between(south, north) & longitudes.between(west, east)
+    if center is not None:
+        mask &= pd.Series(haversine_km(latitudes.to_numpy(), longitudes.to_numpy(), *center) <= radius_km,
+                          index=entries.index)
+    return int(mask.sum())
+
+
+def measure(function, repeat):
+    """回傳 (平均耗時, 結果)。"""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return (time.perf_counter() - started) / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比較事件索引查詢與掃描整個表格的耗時")
+    parser.add_argument('--events', type=int, default=1_000_000, help="事件數")
+    parser.add_argument('--places', type=int, default=5000, help="地點數據庫的地點數")
+    parser.add_argument('--multi-rate', type=float, default=0.1, help="'地點'欄位有多個地點的事件比例")
+    parser.add_argument('--repeat', type=int, default=20, help="每個查詢的重複次數")
+    parser.add_argument('--seed', type=int, default=0, help="亂數種子")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_path, event_path = write_inputs(directory, args.events, args.places, args.multi_rate, args.seed)
+        started = time.perf_counter()
+        index = EventIndex.from_files(event_path, db_path)
+        build_time = time.perf_counter() - started
+    entries = prepare_scan(index.entries)
+
+    queries = [
+        ('日期範圍 (一季)', {'start': '2023-06', 'end': '2023-09'}),
+        ('日期範圍 (一天)', {'start': '2023-07-01', 'end': '2023-07-01'}),
+        ('經緯度範圍', {'bbox': (24.70, 121.20, 24.75, 121.25)}),
+        ('半徑 2 公里', {'center': (24.7, 121.3), 'radius_km': 2.0}),
+        ('落石 + 台7線 + 一季', {'start': '2023-06', 'end': '2023-09', 'event_types': ['落石'], 'place': '台7線'}),
+        ('落石 + 半徑 + 一季', {'start': '2023-06', 'end': '2023-09', 'event_types': ['落石'],
+                               'center': (24.7, 121.3), 'radius_km': 5.0}),
+    ]
+    print(f"{args.events} 個事件、{args.places} 個地點，建立索引 {build_time:.2f} 秒 ({len(index)} 筆事件地點)")
+    print(f"{'查詢':<22} {'結果筆數':>10} {'索引 (毫秒)':>12} {'掃描 (毫秒)':>12} {'加速':>8}")
+    same = True
+    for label, conditions in queries:
+        index_time, count = measure(lambda: index.count(**conditions), args.repeat)
+        query_time, result = measure(lambda: index.query(**conditions), max(1, args.repeat // 4))
+        scan_time, expected = measure(lambda: scan(entries, **conditions), max(1, args.repeat // 10))
+        same &= count == len(result) == expected
+        print(f"{label:<22} {count:>10} {index_time * 1000:>12.2f} {scan_time * 1000:>12.1f} "
+              f"{scan_time / index_time:>7.0f}x  (含建立結果表格 {query_time * 1000:.1f} 毫秒)")
+
+    counts_time, counts = measure(lambda: index.count_by_place(start='2023-06', end='2023-09'),
+                                  max(1, args.repeat // 4))
+    print(f"依地點統計 (一季)：{len(counts)} 個地點，{counts_time * 1000:.1f} 毫秒，"
+          f"最多為 {counts.iloc[0]['地名']} ({counts.iloc[0]['事件數']} 筆)")
+    same &= int(counts['事件數'].sum()) == index.count(start='2023-06', end='2023-09')
+    same &= bool(np.all(np.diff(parse_event_dates(index.query(place='台7線')['日期']).to_numpy()).astype(int) >= 0))
+    print(f"索引查詢與掃描的結果{'相同' if same else '不同'}")
+    return 0 if same else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
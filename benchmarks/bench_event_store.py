@@ -0,0 +1,141 @@
+"""
+比較事件日誌 (CSV) 與事件儲存檔 (Parquet，event_store.py) 的載入時間、峰值記憶體與檔案大小。
+
+產生事件日誌 (預設 1M 列，其中一部分事件的'地點'欄位有多個以分號分隔的地點)，並寫入儲存檔。
+各階段讀入事件後需要的資料相同：CSV 需要解析文字、解析日期並以分號分割地點，
+儲存檔則直接讀入日期值與地點清單。每種方式在獨立的子程序中執行，峰值記憶體互不影響，
+並另外記錄只載入模組時的峰值記憶體作為基準。峰值記憶體讀取 /proc/self/status 的 VmHWM
+(ru_maxrss 在 Linux 上會沿用 fork 時父程序的記憶體用量，父程序已載入事件表格，無法用來比較)。
+
+使用方法: python benchmarks/bench_event_store.py [--events 1000000] [--places 5000] [--multi-rate 0.1]
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from event_store import store_available  # noqa: E402
+from prompt_builder import CSV_HEADER  # noqa: E402
+
+EVENT_TYPES = ['落石', '坍方', '道路封閉', '交通管制', '事故']
+LOADERS = ['modules', 'csv', 'store']
+
+
+def write_event_log(path, events, places, multi_rate, seed):
+    generator = random.Random(seed)
+    names = [f"地點{index:05d}" for index in range(places)]
+    with open(path, 'w', encoding='utf-8') as event_file:
+        event_file.write(CSV_HEADER + '\n')
+        for index in range(events):
+            if generator.random() < multi_rate:
+                location = ';'.join(generator.sample(names, generator.randint(2, 3)))
+            else:
+                location = generator.choice(names)
+            day = index * 730 // events
+            event_file.write(f"{2023 + day // 365}-{day // 31 % 12 + 1:02d}-{day % 28 + 1:02d},"
+                             f"{generator.choice(EVENT_TYPES)},{location},第{index}則\n")
+
+
+def load(loader, path):
+    """在子程序中執行：載入事件並取得日期值、事件類型與展開的地名，回傳 (耗時, 列數, 地名數)。"""
+    import pandas as pd
+
+    from event_store import EVENT_COLUMNS, explode_places, parse_event_dates, place_list_entries, read_event_store
+
+    started = time.perf_counter()
+    if loader == 'modules':
+        return 0.0, 0, 0
+    if loader == 'csv':
+        events = pd.read_csv(path, header=None, names=range(len(EVENT_COLUMNS)), usecols=range(len(EVENT_COLUMNS)),
+                             skiprows=1, dtype=str, keep_default_na=False)
+        events.columns = EVENT_COLUMNS
+        dates = parse_event_dates(events['日期'])
+        event_types = events['事件類型'].astype('category')
+        names = explode_places(events['地點'])
+    else:
+        events = read_event_store(path, columns=EVENT_COLUMNS + ['日期值', '地點清單'])
+        dates = events['日期值']
+        event_types = events['事件類型']
+        names = place_list_entries(events['地點清單'])
+    elapsed = time.perf_counter() - started
+    assert len(dates) == len(event_types) == len(events)
+    return elapsed, len(events), len(names)
+
+
+def peak_rss():
+    """目前程序的峰值記憶體 (KB)。"""
+    try:
+        with open('/proc/self/status', encoding='ascii') as status_file:
+            for line in status_file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    # 沒有 /proc 時以 ru_maxrss 代替 (Linux 以 KB、macOS 以 byte 為單位)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_child(loader, path):
+    """以子程序執行 load，回傳 (耗時, 列數, 地名數, 峰值記憶體 MB)。"""
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', loader, path],
+                            check=True, capture_output=True, text=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    return result['elapsed'], result['rows'], result['names'], result['max_rss'] / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比較事件日誌 CSV 與 Parquet 儲存檔的載入時間與記憶體")
+    parser.add_argument('--events', type=int, default=1_000_000, help="事件數")
+    parser.add_argument('--places', type=int, default=5000, help="地點數")
+    parser.add_argument('--multi-rate', type=float, default=0.1, help="'地點'欄位有多個地點的事件比例")
+    parser.add_argument('--seed', type=int, default=0, help="亂數種子")
+    parser.add_argument('--child', nargs=2, metavar=('LOADER', 'PATH'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        elapsed, rows, names = load(*args.child)
+        print(json.dumps({'elapsed': elapsed, 'rows': rows, 'names': names, 'max_rss': peak_rss()}))
+        return 0
+    if not store_available():
+        print("需要 pyarrow 才能寫入事件儲存檔")
+        return 1
+
+    import pandas as pd
+
+    from event_store import EVENT_COLUMNS, write_event_store
+
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = os.path.join(directory, 'event_log.txt')
+        store_path = os.path.join(directory, 'event_log.parquet')
+        write_event_log(csv_path, args.events, args.places, args.multi_rate, args.seed)
+        events = pd.read_csv(csv_path, dtype=str, keep_default_na=False, usecols=range(len(EVENT_COLUMNS)))
+        started = time.perf_counter()
+        write_event_store(store_path, events)
+        write_time = time.perf_counter() - started
+        sizes = {'csv': os.path.getsize(csv_path), 'store': os.path.getsize(store_path)}
+        results = {loader: run_child(loader, store_path if loader == 'store' else csv_path) for loader in LOADERS}
+
+    base_rss = results['modules'][3]
+    print(f"{args.events} 個事件、{args.places} 個地點 (多地點比例 {args.multi_rate:.0%})，"
+          f"寫入儲存檔 {write_time:.2f} 秒，只載入模組的峰值記憶體 {base_rss:.0f} MB")
+    print(f"{'格式':<10} {'檔案 (MB)':>10} {'載入 (秒)':>10} {'峰值記憶體 (MB)':>16} {'扣除模組 (MB)':>14} {'地名數':>10}")
+    for loader, label in (('csv', 'CSV'), ('store', 'Parquet')):
+        elapsed, rows, names, max_rss = results[loader]
+        print(f"{label:<10} {sizes[loader] / 1e6:>10.1f} {elapsed:>10.2f} {max_rss:>16.0f} "
+              f"{max_rss - base_rss:>14.0f} {names:>10}")
+    csv_result, store_result = results['csv'], results['store']
+    print(f"載入加速 {csv_result[0] / store_result[0]:.1f} 倍，檔案大小為 CSV 的 {sizes['store'] / sizes['csv']:.0%}")
+    same = csv_result[1:3] == store_result[1:3]
+    print(f"列數與展開的地名數{'相同' if same else '不同'}")
+    return 0 if same else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
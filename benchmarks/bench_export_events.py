@@ -0,0 +1,143 @@
+"""
+比較 06_export_event_log.py 原本逐行比對 (csv.DictReader 逐列查詢字典、以整個'地點'欄位比對、逐列寫入)
+與以表格展開多地點後合併 (hash join) 並一次寫入的做法。
+
+產生地點數據庫與事件日誌 (預設 1M 列)，其中一部分事件的'地點'欄位有多個以分號分隔的地點
+(例如「前光華;楓墅」，04 階段會分別查詢座標)，原本的做法會略過這些事件。
+確認新做法中不是來自多地點欄位的列與原本的輸出完全相同，並計算找回的列數。
+
+使用方法: python benchmarks/bench_export_events.py [--events 1000000] [--places 5000] [--multi-rate 0.1]
+"""
+import argparse
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from place_db import PLACE_DB_COLUMNS  # noqa: E402
+from prompt_builder import CSV_HEADER  # noqa: E402
+from stages import load_stage  # noqa: E402
+
+EVENT_TYPES = ['落石', '坍方', '道路封閉', '交通管制', '事故']
+
+
+def write_inputs(directory, events, places, multi_rate, miss_rate, seed):
+    """產生地點數據庫與事件日誌，回傳兩者的路徑。"""
+    generator = random.Random(seed)
+    names = [f"地點{index:05d}" for index in range(places)]
+    db_path = os.path.join(directory, 'place_db.csv')
+    with open(db_path, 'w', encoding='utf-8') as db_file:
+        db_file.write('|'.join(PLACE_DB_COLUMNS) + '\n')
+        for index, name in enumerate(names):
+            db_file.write(f"{name}|{name}|{name}(建議)|{24.6 + index % 1000 / 10000:.4f}|"
+                          f"{121.4 + index // 1000 % 1000 / 10000:.4f}\n")
+
+    event_path = os.path.join(directory, 'event_log.txt')
+    with open(event_path, 'w', encoding='utf-8') as event_file:
+        event_file.write(CSV_HEADER + '\n')
+        for index in range(events):
+            draw = generator.random()
+            if draw < miss_rate:
+                location = f"未知地點{generator.randrange(places)}"
+            elif draw < miss_rate + multi_rate:
+                location = ';'.join(generator.sample(names, generator.randint(2, 3)))
+                if generator.random() < 0.3:
+                    location = location.replace(';', '; ')
+            else:
+                location = generator.choice(names)
+            day = index * 365 // events
+            event_file.write(f"2024-{day // 31 % 12 + 1:02d}-{day % 28 + 1:02d},{generator.choice(EVENT_TYPES)},"
+                             f"{location},第{index}則\n")
+    return db_path, event_path
+
+
+def legacy_match(database_file, input_file):
+    """原本的做法：載入地點字典，逐列以整個'地點'欄位查詢。"""
+    place_data = {}
+    with open(database_file, mode='r', encoding='utf-8') as db_file:
+        for row in csv.DictReader(db_file, delimiter='|'):
+            place_data[row['地名']] = {'original_name': row['地名'], 'suggested_name': row['建議地名'],
+                                     'latitude': row['緯度'], 'longitude': row['經度']}
+    processed_events = []
+    with open(input_file, mode='r', encoding='utf-8') as in_file:
+        for row in csv.DictReader(in_file):
+            location = row['地點']
+            if location in place_data:
+                place_info = place_data[location]
+                processed_events.append({
+                    'name': place_info['original_name'],
+                    'longitude': place_info['longitude'],
+                    'latitude': place_info['latitude'],
+                    'description': f"{row['日期']}_{row['事件類型']}_{location}_{row['額外說明']}"
+                })
+    return processed_events
+
+
+def legacy_save(output_file, processed_events):
+    """原本的做法：以 csv.DictWriter 逐列寫入。"""
+    with open(output_file, mode='w', newline='', encoding='utf-8') as out_file:
+        csv_writer = csv.DictWriter(out_file, fieldnames=['name', 'longitude', 'latitude', 'description'])
+        csv_writer.writeheader()
+        for event in processed_events:
+            csv_writer.writerow(event)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比較逐行比對與展開後合併的事件地點匯出")
+    parser.add_argument('--events', type=int, default=1_000_000, help="事件數")
+    parser.add_argument('--places', type=int, default=5000, help="地點數據庫的地點數")
+    parser.add_argument('--multi-rate', type=float, default=0.1, help="'地點'欄位有多個地點的事件比例")
+    parser.add_argument('--miss-rate', type=float, default=0.05, help="地點不在數據庫中的事件比例")
+    parser.add_argument('--seed', type=int, default=0, help="亂數種子")
+    args = parser.parse_args()
+
+    stage = load_stage(6)
+    with tempfile.TemporaryDirectory() as directory:
+        db_path, event_path = write_inputs(directory, args.events, args.places, args.multi_rate,
+                                           args.miss_rate, args.seed)
+        legacy_path = os.path.join(directory, 'legacy.csv')
+        output_path = os.path.join(directory, 'output.csv')
+
+        started = time.perf_counter()
+        legacy_events = legacy_match(db_path, event_path)
+        legacy_match_time = time.perf_counter() - started
+        started = time.perf_counter()
+        legacy_save(legacy_path, legacy_events)
+        legacy_save_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        matched = stage.join_places(stage.load_events(event_path), stage.load_place_data(db_path))
+        exported = stage.format_events(matched)
+        match_time = time.perf_counter() - started
+        started = time.perf_counter()
+        stage.save_to_csv(output_path, exported)
+        save_time = time.perf_counter() - started
+
+        recovered = stage.count_recovered(matched)
+        # 不是來自多地點欄位的列應與原本的輸出完全相同 (包含順序)
+        kept = stage.format_events(matched[matched['地點'] == matched['地名']])
+        kept_path = os.path.join(directory, 'kept.csv')
+        stage.save_to_csv(kept_path, kept)
+        with open(legacy_path, 'rb') as legacy_file, open(kept_path, 'rb') as kept_file:
+            same = legacy_file.read() == kept_file.read()
+
+    print(f"{args.events} 個事件、{args.places} 個地點 (多地點比例 {args.multi_rate:.0%}，"
+          f"數據庫中沒有的比例 {args.miss_rate:.0%})")
+    print(f"原本 (逐行比對)   讀取與比對 {legacy_match_time:5.2f} 秒，寫入 {legacy_save_time:5.2f} 秒，"
+          f"輸出 {len(legacy_events)} 列")
+    print(f"展開後合併       讀取與比對 {match_time:5.2f} 秒，寫入 {save_time:5.2f} 秒，"
+          f"輸出 {len(matched)} 列 (找回 {recovered} 列多地點事件)")
+    print(f"讀取與比對加速 {legacy_match_time / match_time:.1f} 倍，每列寫入加速 "
+          f"{legacy_save_time / len(legacy_events) / (save_time / len(matched)):.1f} 倍，"
+          f"合計 {legacy_match_time + legacy_save_time:.2f} -> {match_time + save_time:.2f} 秒 (輸出多 "
+          f"{len(matched) / len(legacy_events) - 1:.0%})")
+    print(f"單一地點的列與原本的輸出{'相同' if same else '不同'}")
+    return 0 if same else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
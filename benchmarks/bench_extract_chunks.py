@@ -0,0 +1,81 @@
+"""
+以模擬延遲的本機假供應商，比較 02_extract_event_mentions.py 單次送出整份摘要
+與依日期分批、同時送出的執行時間。
+
+假供應商不連線，依輸入的 token 數模擬延遲，並將每行摘要轉成一列 CSV 回傳，
+藉此確認分批合併後的表格依日期排序且只有一個表頭。
+
+使用方法: python benchmarks/bench_extract_chunks.py -I output_summary.txt [-C 分批token上限] [-J 同時請求數]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stages import load_stage  # noqa: E402
+
+
+class StubSender:
+    """模擬大語言模型的延遲：固定的請求延遲加上與輸入 token 數成正比的生成時間。"""
+
+    def __init__(self, stage, base_latency, seconds_per_1k_tokens):
+        self.stage = stage
+        self.base_latency = base_latency
+        self.seconds_per_1k_tokens = seconds_per_1k_tokens
+        self.calls = 0
+
+    def __call__(self, message, history):
+        self.calls += 1
+        tokens = self.stage.estimate_tokens(message)
+        time.sleep(self.base_latency + tokens / 1000 * self.seconds_per_1k_tokens)
+        rows = []
+        for line in message.splitlines():
+            date, event_type = line.split('，')[:2]
+            rows.append(f"{date.replace('/', '-')},{event_type},,")
+        return f"```csv\n{self.stage.CSV_HEADER}\n" + '\n'.join(rows) + "\n```"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比較分批同時送出與單次送出的執行時間")
+    parser.add_argument('-I', '--input', required=True, help="01 階段產生的事件摘要檔案")
+    parser.add_argument('-C', '--chunk-tokens', type=int, default=2000, help="每批輸入的 token 上限")
+    parser.add_argument('-J', '--concurrency', type=int, default=8, help="同時請求數")
+    parser.add_argument('--base-latency', type=float, default=0.5, help="每次請求的固定延遲 (秒)")
+    parser.add_argument('--per-1k-tokens', type=float, default=0.5, help="每 1000 個輸入 token 的延遲 (秒)")
+    args = parser.parse_args()
+
+    stage = load_stage(2)
+    with open(args.input, 'r', encoding='utf-8') as file:
+        summary = file.read()
+
+    chunks = stage.build_chunks(stage.split_summary_by_day(summary), args.chunk_tokens)
+    print(f"摘要估計 {stage.estimate_tokens(summary)} tokens，分成 {len(chunks)} 批")
+
+    timings = {}
+    outputs = {}
+    for name, batches, concurrency in (
+            ('single', [summary], 1),
+            ('chunked-serial', chunks, 1),
+            (f'chunked-x{args.concurrency}', chunks, args.concurrency)):
+        sender = StubSender(stage, args.base_latency, args.per_1k_tokens)
+        start = time.perf_counter()
+        responses = stage.extract_chunks(sender, [(batch, []) for batch in batches], concurrency)
+        timings[name] = time.perf_counter() - start
+        outputs[name] = stage.merge_csv_responses(responses)
+        print(f"{name:>16}: {timings[name]:6.2f} 秒，{sender.calls} 次請求")
+
+    baseline = timings['single']
+    for name, elapsed in timings.items():
+        print(f"{name:>16}: 相對單次送出加速 {baseline / elapsed:5.2f}x")
+
+    merged = outputs[f'chunked-x{args.concurrency}']
+    rows = merged.splitlines()
+    dates = [row.split(',')[0] for row in rows[1:]]
+    print(f"表頭數量：{rows.count(stage.CSV_HEADER)}，日期是否依序：{'是' if dates == sorted(dates) else '否'}，"
+          f"與單次送出結果一致：{'是' if merged == outputs['single'] else '否'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+以注入延遲的 googlemaps.Client 替身 (geocoder.FakeMapsClient)，比較原本逐一查詢的地點查詢
+與 05 階段的查詢引擎 (同時查詢、合併重複查詢、查無結果快取、每秒呼叫次數限制)。
+
+輸入地名中有一部分只差在空白 (例如「光華  部落」與「光華 部落」)，加上前綴後會成為相同的查詢；
+部分地名查無建議地名。第二次執行時，已查到的地名在地點數據庫中，查無結果的地名在快取中，
+因此不需要任何 API 呼叫。不需要 API 金鑰，也不會連線。
+
+使用方法: python benchmarks/bench_geocoder.py [--names 300] [--latency 0.05] [--miss-rate 0.2] [-J 8] [--qps 40]
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from geocoder import FakeMapsClient  # noqa: E402
+from stages import load_stage  # noqa: E402
+
+QUERY_PREFIX = '桃園市復興區'
+
+
+def make_names(count, seed):
+    """產生不重複的地名，其中約四分之一另有一個只差在空白的寫法。"""
+    generator = random.Random(seed)
+    names = []
+    for index in range(count):
+        names.append(f"地點{index:05d} 部落")
+        if generator.random() < 0.25:
+            names.append(f"地點{index:05d}  部落")
+    generator.shuffle(names)
+    return names
+
+
+def legacy_lookup(client, names):
+    """原本的做法：數據庫中沒有的地名逐一查詢建議地名與座標，查無建議地名時不記錄。"""
+    for name in dict.fromkeys(names):
+        suggestions = client.places_autocomplete(QUERY_PREFIX + name)
+        if suggestions:
+            client.geocode(suggestions[0]['description'])
+
+
+def max_calls_per_second(call_times):
+    """任一秒內的最大呼叫次數。"""
+    call_times = sorted(call_times)
+    best, start = 0, 0
+    for end, moment in enumerate(call_times):
+        while moment - call_times[start] >= 1.0:
+            start += 1
+        best = max(best, end - start + 1)
+    return best
+
+
+def run_engine(stage, client, names, directory, args):
+    output = io.StringIO()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        stage.update_places('unused', pd.DataFrame({'地名': names}),
+                            os.path.join(directory, 'updated_places.csv'), QUERY_PREFIX,
+                            os.path.join(directory, 'place_db.csv'),
+                            concurrency=args.concurrency, queries_per_second=args.qps,
+                            normalize=False, gmaps_client=client)
+    return time.perf_counter() - started, output.getvalue().strip().splitlines()[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比較逐一查詢與同時、合併、快取的地點查詢")
+    parser.add_argument('--names', type=int, default=300, help="不重複的地名數")
+    parser.add_argument('--latency', type=float, default=0.05, help="每次 API 呼叫的延遲 (秒)")
+    parser.add_argument('--miss-rate', type=float, default=0.2, help="查無建議地名的比例")
+    parser.add_argument('-J', '--concurrency', type=int, default=8, help="同時查詢數")
+    parser.add_argument('--qps', type=float, default=40, help="每秒最多的 API 呼叫次數")
+    parser.add_argument('--seed', type=int, default=0, help="亂數種子")
+    args = parser.parse_args()
+
+    stage = load_stage(5)
+    names = make_names(args.names, args.seed)
+    print(f"輸入 {len(names)} 個地名 ({args.names} 個不重複的查詢)，每次呼叫延遲 {args.latency * 1000:.0f} 毫秒，"
+          f"查無結果比例 {args.miss_rate:.0%}")
+
+    client = FakeMapsClient(latency=args.latency, miss_rate=args.miss_rate)
+    started = time.perf_counter()
+    legacy_lookup(client, names)
+    legacy_time = time.perf_counter() - started
+    print(f"原本 (逐一查詢)       {legacy_time:6.2f} 秒，API 呼叫 {client.calls} 次 (每次執行都相同)")
+
+    with tempfile.TemporaryDirectory() as directory:
+        client = FakeMapsClient(latency=args.latency, miss_rate=args.miss_rate)
+        first_time, report = run_engine(stage, client, names, directory, args)
+        print(f"查詢引擎 (第一次執行) {first_time:6.2f} 秒，API 呼叫 {client.calls} 次，"
+              f"最多同時 {client.max_concurrent} 個，任一秒最多 {max_calls_per_second(client.call_times)} 次"
+              f" (上限 {args.qps:g}/秒)")
+        print(f"  {report}")
+
+        client = FakeMapsClient(latency=args.latency, miss_rate=args.miss_rate)
+        second_time, report = run_engine(stage, client, names, directory, args)
+        print(f"查詢引擎 (第二次執行) {second_time:6.2f} 秒，API 呼叫 {client.calls} 次")
+        print(f"  {report}")
+    print(f"第一次執行加速 {legacy_time / first_time:.1f} 倍 (受每秒呼叫次數上限限制)，"
+          f"第二次執行不需要任何 API 呼叫")
+
+
+if __name__ == "__main__":
+    main()
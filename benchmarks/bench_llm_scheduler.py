@@ -0,0 +1,48 @@
+"""
+以不連線的 FakeProvider 對 llm_providers 的速率限制與重試機制做負載測試。
+
+依不同的同時請求數送出相同的批次，假供應商依比例隨機回傳 429 錯誤，
+檢查實際的每分鐘請求數不超過設定上限，並列出延遲百分位數與重試次數。
+
+使用方法: python benchmarks/bench_llm_scheduler.py [-N 請求數] [--rpm 每分鐘請求數] [--failure-rate 錯誤比例]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_providers import FakeProvider, RateLimiter  # noqa: E402
+from stages import load_stage  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="以假供應商測試速率限制與重試")
+    parser.add_argument('-N', '--requests', type=int, default=60, help="送出的請求數")
+    parser.add_argument('--rpm', type=int, default=600, help="每分鐘請求數上限")
+    parser.add_argument('--tpm', type=int, default=2_000_000, help="每分鐘 token 數上限")
+    parser.add_argument('--failure-rate', type=float, default=0.1, help="模擬 429 錯誤的比例")
+    parser.add_argument('--latency', type=float, default=0.2, help="每次請求的固定延遲 (秒)")
+    args = parser.parse_args()
+
+    stage = load_stage(2)
+    message = "2023/05/29，落石，台7線37.7K落石已排除，謝謝\n2023/05/30，停電，前光華停電～；楓墅停電了～"
+    requests = [(message, [])] * args.requests
+
+    for concurrency in (1, 4, 16):
+        provider = FakeProvider(
+            base_latency=args.latency, failure_rate=args.failure_rate, seed=0,
+            # 從空桶開始，才能量測穩定狀態下的速率
+            rate_limiter=RateLimiter(args.rpm, args.tpm, start_full=False),
+            base_delay=0.05, max_delay=1.0)
+        start = time.perf_counter()
+        stage.extract_chunks(provider.send, requests, concurrency)
+        elapsed = time.perf_counter() - start
+        observed_rpm = (provider.calls + provider.retries) / elapsed * 60
+        print(f"同時 {concurrency:>2} 個：{elapsed:6.2f} 秒，實際 {observed_rpm:6.0f} 次/分 (上限 {args.rpm})")
+        print(f"    {provider.report()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+比較里程樁號地名 (例如「台7線24.5k」、「28.7K」) 以地點查詢 API 取得座標與以 milepost.py 離線內插的耗時與誤差。
+
+道路與里程樁為程式產生的合成資料 (蜿蜒的折線，樁距與實際距離有 ±5% 的差異)，寫入暫存的 GeoJSON 檔案，
+並非真實的道路圖資；每個樁號在折線上的正確位置已知，因此可以計算內插的誤差。
+Google Maps 以注入延遲的 geocoder.FakeMapsClient 取代，不需要 API 金鑰，也不會連線。
+
+使用方法: python benchmarks/bench_mileposts.py [--road-km 60] [--names 100] [--markers 100000] [--latency 0.05]
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from geocoder import FakeMapsClient  # noqa: E402
+from milepost import MilepostLocator, to_meters  # noqa: E402
+from stages import load_stage  # noqa: E402
+
+ROAD = '台7線'
+QUERY_PREFIX = '桃園市復興區'
+
+
+def make_road(road_km, seed):
+    """
+    產生合成道路：每 50 公尺一個頂點的蜿蜒折線，以及每公里一個里程樁。
+    樁號與實際距離的比例在每公里之間隨機變動，回傳 (GeoJSON, 由公里數求正確座標的函數)。
+    """
+    generator = random.Random(seed)
+    step = 50
+    heading, x, y = 0.0, 0.0, 0.0
+    points = [(0.0, 0.0)]
+    for _ in range(int(road_km * 1000 * 1.1 / step)):
+        heading += generator.uniform(-0.25, 0.25)
+        x, y = x + step * math.cos(heading), y + step * math.sin(heading)
+        points.append((x, y))
+    points = np.array(points)
+    # 以北橫公路附近的緯度換算為經緯度
+    scale = np.pi / 180 * 6_371_000
+    latitudes = 24.8 + points[:, 1] / scale
+    longitudes = 121.3 + points[:, 0] / (scale * np.cos(np.radians(latitudes.mean())))
+    chainage = np.arange(len(points)) * float(step)
+
+    post_km = np.arange(0, road_km + 1)
+    post_chainage = np.concatenate([[0.0], np.cumsum([1000 * generator.uniform(0.95, 1.05) for _ in post_km[1:]])])
+
+    def true_position(kms):
+        distances = np.interp(kms, post_km, post_chainage)
+        return np.interp(distances, chainage, latitudes), np.interp(distances, chainage, longitudes)
+
+    post_latitudes, post_longitudes = true_position(post_km)
+    features = [{'type': 'Feature', 'properties': {'road': ROAD},
+                 'geometry': {'type': 'LineString', 'coordinates': np.column_stack([longitudes, latitudes]).tolist()}}]
+    features += [{'type': 'Feature', 'properties': {'road': ROAD, 'km': float(km)},
+                  'geometry': {'type': 'Point', 'coordinates': [float(lon), float(lat)]}}
+                 for km, lat, lon in zip(post_km, post_latitudes, post_longitudes)]
+    return {'type': 'FeatureCollection', 'features': features}, true_position
+
+
+def make_names(count, road_km, seed):
+    """產生不重複的里程樁號地名，包含不同的寫法與只寫樁號的地名。"""
+    generator = random.Random(seed)
+    kms = generator.sample(range(1, int(road_km * 10)), count)
+    formats = ["台7線{km:g}k", "臺7線 {km:g}K", "{km:g}K", "台7線{km:g}公里"]
+    return [generator.choice(formats).format(km=km / 10) for km in kms], [km / 10 for km in kms]
+
+
+def run_update(stage, names, directory, locator, latency):
+    client = FakeMapsClient(latency=latency)
+    db_path = os.path.join(directory, f"place_db_{locator is not None}.csv")
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        stage.update_places('unused', pd.DataFrame({'地名': names}), os.path.join(directory, 'updated_places.csv'),
+                            QUERY_PREFIX, db_path, negative_ttl_days=0, milepost_locator=locator,
+                            gmaps_client=client)
+    return time.perf_counter() - started, client.calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比較里程樁號以 API 查詢與離線內插的耗時與誤差")
+    parser.add_argument('--road-km', type=int, default=60, help="道路長度 (公里)")
+    parser.add_argument('--names', type=int, default=100, help="05 階段輸入的樁號地名數")
+    parser.add_argument('--markers', type=int, default=100_000, help="批次內插的樁號數")
+    parser.add_argument('--latency', type=float, default=0.05, help="每次 API 呼叫的延遲 (秒)")
+    parser.add_argument('--seed', type=int, default=0, help="亂數種子")
+    args = parser.parse_args()
+
+    geojson, true_position = make_road(args.road_km, args.seed)
+    names, kms = make_names(args.names, args.road_km, args.seed)
+    stage = load_stage(5)
+    with tempfile.TemporaryDirectory() as directory:
+        geojson_path = os.path.join(directory, 'mileposts.geojson')
+        with open(geojson_path, 'w', encoding='utf-8') as geojson_file:
+            json.dump(geojson, geojson_file)
+        started = time.perf_counter()
+        locator = MilepostLocator.from_geojson(geojson_path)
+        load_time = time.perf_counter() - started
+
+        api_time, api_calls = run_update(stage, names, directory, None, args.latency)
+        local_time, local_calls = run_update(stage, names, directory, locator, args.latency)
+
+    print(f"合成道路 {args.road_km} 公里 ({len(geojson['features']) - 1} 個里程樁)，載入 {load_time * 1000:.1f} 毫秒")
+    print(f"05 階段 {args.names} 個樁號地名：地點查詢 {api_time:.2f} 秒 ({api_calls} 次 API 呼叫，"
+          f"每次延遲 {args.latency * 1000:.0f} 毫秒、每秒最多 10 次)；離線內插 {local_time:.3f} 秒 ({local_calls} 次)")
+
+    # 內插誤差：與合成道路上的正確位置比較
+    located = locator.locate_many(names)
+    latitudes = np.array([located[name][2] for name in names])
+    longitudes = np.array([located[name][3] for name in names])
+    true_latitudes, true_longitudes = true_position(np.array(kms))
+    reference = float(true_latitudes.mean())
+    errors = np.hypot(*(to_meters(longitudes, latitudes, reference)
+                        - to_meters(true_longitudes, true_latitudes, reference)).T)
+    print(f"內插誤差：全部 {len(located)}/{len(names)} 個地名已定位，平均 {errors.mean():.2f} 公尺，最大 {errors.max():.2f} 公尺")
+
+    # 批次內插與逐一內插的耗時
+    generator = random.Random(args.seed)
+    markers = [f"台7線{generator.uniform(0, args.road_km):.3f}k" for _ in range(args.markers)]
+    started = time.perf_counter()
+    locator.locate_many(markers)
+    batch_time = time.perf_counter() - started
+    sample = markers[:min(len(markers), 2000)]
+    started = time.perf_counter()
+    for marker in sample:
+        locator.locate(marker)
+    single_time = (time.perf_counter() - started) / len(sample) * len(markers)
+    print(f"{len(markers)} 個樁號：批次內插 {batch_time:.2f} 秒，逐一內插推估 {single_time:.2f} 秒")
+    return 0 if len(located) == len(names) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+"""
+比較 05_map_location_coordinates.py 原本逐行掃描 DataFrame 的查詢方式 (每個地名掃描整個數據庫、
+每個新地名以 pd.concat 複製整個數據庫、最後重寫整個檔案) 與以地名為索引的 PlaceDatabase。
+
+產生 200k 行的 place_db.csv 與 50k 個輸入地名 (預設 80% 已在數據庫中)，Google Maps 以不連線、
+零延遲的替身取代並關閉速率限制，只量測查詢與寫入本身。原本的方式是 O(n·m)，完整執行需要數分鐘，
+因此預設只取部分輸入地名執行並依每個地名的平均耗時推估 (新地名越多 concat 越慢，推估值偏低)。
+
+使用方法: python benchmarks/bench_place_db.py [--db-rows 200000] [--names 50000] [--hit-rate 0.8] [--legacy-sample 1000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from place_db import PLACE_DB_COLUMNS  # noqa: E402
+from stages import load_stage  # noqa: E402
+
+QUERY_PREFIX = '桃園市復興區'
+
+
+class FakeMapsClient:
+    """零延遲的 Google Maps 客戶端替身，記錄呼叫次數。"""
+
+    calls = 0
+
+    def __init__(self, key=None):
+        pass
+
+    def places_autocomplete(self, query):
+        FakeMapsClient.calls += 1
+        return [{'description': f"{query}(建議)"}]
+
+    def geocode(self, place_name):
+        FakeMapsClient.calls += 1
+        digest = sum(place_name.encode('utf-8'))
+        return [{'geometry': {'location': {'lat': round(24.6 + digest % 1000 / 10000, 4),
+                                           'lng': round(121.4 + digest // 7 % 1000 / 10000, 4)}}}]
+
+
+def write_database(path, rows):
+    """產生 rows 行的地點數據庫。"""
+    with open(path, 'w', encoding='utf-8') as db_file:
+        db_file.write('|'.join(PLACE_DB_COLUMNS) + '\n')
+        for index in range(rows):
+            name = f"地點{index:07d}"
+            db_file.write(f"{name}|{QUERY_PREFIX}{name}|{QUERY_PREFIX}{name}(建議)|"
+                          f"{24.6 + index % 1000 / 10000:.4f}|{121.4 + index // 1000 % 1000 / 10000:.4f}\n")
+
+
+def make_names(count, db_rows, hit_rate, seed):
+    """產生輸入地名：hit_rate 的比例取自數據庫，其餘為新地名 (其中部分重複)。"""
+    generator = random.Random(seed)
+    names = []
+    for _ in range(count):
+        if generator.random() < hit_rate:
+            names.append(f"地點{generator.randrange(db_rows):07d}")
+        else:
+            names.append(f"新地點{generator.randrange(count):07d}")
+    return names
+
+
+def legacy_update(stage, input_data, output_csv, query_prefix, database_file_path):
+    """原本 main() 的查詢流程：iterrows、逐行掃描數據庫、pd.concat 新增與重寫整個數據庫。"""
+    gmaps_client = stage.googlemaps.Client(key='unused')
+    database = pd.read_csv(database_file_path, sep='|')
+    input_data = input_data.copy()
+    input_data['搜尋關鍵地名'] = ''
+    input_data['建議地名'] = ''
+    input_data['緯度'] = ''
+    input_data['經度'] = ''
+    for index, row in input_data.iterrows():
+        full_query_name = query_prefix + str(row['地名'])
+        database_row = database[database['地名'] == row['地名']]
+        if not database_row.empty:
+            for column in PLACE_DB_COLUMNS[1:]:
+                input_data.at[index, column] = database_row.iloc[0][column]
+        else:
+            suggestions = gmaps_client.places_autocomplete(full_query_name)
+            suggested_place = suggestions[0]['description'] if suggestions else None
+            if suggested_place:
+                location = gmaps_client.geocode(suggested_place)[0]['geometry']['location']
+                lat, lng = location['lat'], location['lng']
+                input_data.at[index, '搜尋關鍵地名'] = full_query_name
+                input_data.at[index, '建議地名'] = suggested_place
+                input_data.at[index, '緯度'] = lat
+                input_data.at[index, '經度'] = lng
+                new_record = pd.DataFrame({'地名': [row['地名']], '搜尋關鍵地名': [full_query_name],
+                                           '建議地名': [suggested_place], '緯度': [lat], '經度': [lng]})
+                database = pd.concat([database, new_record], ignore_index=True)
+    input_data = input_data[input_data['建議地名'] != '']
+    database.to_csv(database_file_path, index=False, sep='|', columns=PLACE_DB_COLUMNS)
+    input_data.to_csv(output_csv, index=False, sep='|', columns=PLACE_DB_COLUMNS)
+    return input_data
+
+
+def comparable(frame):
+    """將查詢結果轉為可比較的 (地名, 建議地名, 緯度, 經度) 串列。"""
+    return [(str(row[0]), str(row[2]), round(float(row[3]), 4), round(float(row[4]), 4))
+            for row in frame[PLACE_DB_COLUMNS].itertuples(index=False)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比較逐行掃描與索引查詢的地點數據庫")
+    parser.add_argument('--db-rows', type=int, default=200_000, help="數據庫行數")
+    parser.add_argument('--names', type=int, default=50_000, help="輸入地名數")
+    parser.add_argument('--hit-rate', type=float, default=0.8, help="輸入地名已在數據庫中的比例")
+    parser.add_argument('--legacy-sample', type=int, default=1000,
+                        help="原本方式實際執行的地名數 (0 表示全部)")
+    parser.add_argument('--seed', type=int, default=0, help="亂數種子")
+    args = parser.parse_args()
+
+    stage = load_stage(5)
+    stage.googlemaps.Client = FakeMapsClient
+    names = make_names(args.names, args.db_rows, args.hit_rate, args.seed)
+    sample = names[:args.legacy_sample] if args.legacy_sample else names
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, 'place_db.csv')
+        output_path = os.path.join(directory, 'updated_places.csv')
+
+        write_database(db_path, args.db_rows)
+        db_size = os.path.getsize(db_path)
+        started = time.perf_counter()
+        legacy_result = legacy_update(stage, pd.DataFrame({'地名': sample}), output_path, QUERY_PREFIX, db_path)
+        legacy_time = time.perf_counter() - started
+        legacy_written = os.path.getsize(db_path)
+
+        write_database(db_path, args.db_rows)
+        started = time.perf_counter()
+        with open(os.devnull, 'w') as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                indexed_sample = stage.update_places('unused', pd.DataFrame({'地名': sample}),
+                                                     output_path, QUERY_PREFIX, db_path,
+                                                     queries_per_second=0, negative_ttl_days=0, normalize=False)
+            finally:
+                sys.stdout = stdout
+        sample_time = time.perf_counter() - started
+        appended = os.path.getsize(db_path) - db_size
+        same = comparable(legacy_result) == comparable(indexed_sample)
+
+        write_database(db_path, args.db_rows)
+        FakeMapsClient.calls = 0
+        started = time.perf_counter()
+        with open(os.devnull, 'w') as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                stage.update_places('unused', pd.DataFrame({'地名': names}), output_path, QUERY_PREFIX, db_path,
+                                    queries_per_second=0, negative_ttl_days=0, normalize=False)
+            finally:
+                sys.stdout = stdout
+        indexed_time = time.perf_counter() - started
+
+    per_name = legacy_time / len(sample)
+    print(f"數據庫 {args.db_rows} 行，輸入 {args.names} 個地名 (命中率 {args.hit_rate:.0%})")
+    print(f"原本 (逐行掃描)：{len(sample)} 個地名 {legacy_time:.2f} 秒 ({per_name * 1000:.2f} 毫秒/地名)，"
+          f"推估 {args.names} 個地名 ≥ {per_name * args.names:.1f} 秒；寫入 {legacy_written / 1e6:.1f} MB (重寫整個數據庫)")
+    print(f"索引查詢：{len(sample)} 個地名 {sample_time:.2f} 秒；寫入 {appended / 1e3:.1f} KB (只附加新地名)")
+    print(f"索引查詢：{args.names} 個地名 {indexed_time:.2f} 秒 (含載入數據庫)，API 呼叫 {FakeMapsClient.calls} 次")
+    print(f"推估加速 {per_name * args.names / indexed_time:.0f} 倍")
+    print(f"{len(sample)} 個地名的查詢結果：{'相同' if same else '不同'}")
+    return 0 if same else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""
+比較 05 階段查詢地點時，地名只以完全相同比對 (--no-normalize) 與正規化、相似比對後的 API 呼叫次數。
+
+地點數據庫中已有一批道路里程樁號與地標，輸入地名是這些地點與新地點的各種寫法：
+全形英數、空白、大小寫、「臺/台」、「37K+700」與「37.7公里」等里程寫法、只寫樁號 (「37.7K」)、
+加上「前/旁」等字尾，以及少數只差在數字、實際上不同的地點 (不應被合併)。
+Google Maps 以 geocoder.FakeMapsClient 取代，不需要 API 金鑰，也不會連線。
+
+使用方法: python benchmarks/bench_place_names.py [--roads 20] [--landmarks 40] [--variants 4] [--similarity 0.85]
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from geocoder import FakeMapsClient  # noqa: E402
+from place_db import PLACE_DB_COLUMNS  # noqa: E402
+from place_names import normalize_place_name  # noqa: E402
+from stages import load_stage  # noqa: E402
+
+QUERY_PREFIX = '桃園市復興區'
+FULL_WIDTH = str.maketrans('0123456789Kk.', '０１２３４５６７８９Ｋｋ．')
+LANDMARK_SUFFIXES = ['前', '旁', '附近']
+
+
+def km_variants(road, km):
+    """同一里程樁號的各種寫法。"""
+    whole, meters = divmod(round(km * 1000), 1000)
+    text = f"{km:g}"
+    return [
+        f"{road}{text}K",
+        f"{road} {text}k",
+        f"{road.replace('台', '臺')}{text}公里",
+        f"{road}{whole}K+{meters:03d}",
+        f"{road}{text}K".translate(FULL_WIDTH),
+    ]
+
+
+def make_places(roads, landmarks, seed):
+    """產生已知地點 (數據庫中的寫法) 與新地點。"""
+    generator = random.Random(seed)
+    markers = []
+    for index in range(roads):
+        road = f"台{7 + index}線"
+        km = round(generator.uniform(10, 80), 1)
+        markers.append((road, km))
+    names = [f"{generator.choice('東西南北上下')}{'光華巴陵榮華高義三光'[index % 5 * 2:index % 5 * 2 + 2]}"
+             f"{['派出所', '國小', '部落', '吊橋', '停車場'][index // 5 % 5]}{index:02d}"
+             for index in range(landmarks)]
+    return markers, names
+
+
+def make_input(markers, landmarks, variants, seed):
+    """
+    產生輸入地名：一半的地點已在數據庫中 (以不同寫法出現)，另一半是新地點 (同一地點有多種寫法)；
+    另有只差在數字的不同樁號，不應與已知樁號合併。回傳 (數據庫地名, 輸入地名, 實際不同的地點數)。
+    """
+    generator = random.Random(seed)
+    known, names, places = [], [], 0
+    for index, (road, km) in enumerate(markers):
+        spellings = km_variants(road, km)
+        if index % 2 == 0:
+            known.append(spellings[0])
+            # 只寫樁號，道路可由數據庫中唯一的同樁號地點判斷
+            names.append(f"{km:g}K")
+        places += 1
+        names.extend(generator.sample(spellings, min(variants, len(spellings))))
+        # 相差 100 公尺的另一個樁號是不同的地點
+        names.append(f"{road}{km + 0.1:g}K")
+        places += 1
+    for index, landmark in enumerate(landmarks):
+        if index % 2 == 0:
+            known.append(landmark)
+        spellings = [landmark, f" {landmark} ", landmark.replace('台', '臺')]
+        spellings += [landmark + suffix for suffix in LANDMARK_SUFFIXES]
+        names.extend(generator.sample(spellings, min(variants, len(spellings))))
+        places += 1
+    generator.shuffle(names)
+    return known, names, places
+
+
+def write_database(path, known):
+    """以 FakeMapsClient 產生座標的方式寫入已知地點。"""
+    client = FakeMapsClient(latency=0)
+    with open(path, 'w', encoding='utf-8') as db_file:
+        db_file.write('|'.join(PLACE_DB_COLUMNS) + '\n')
+        for name in known:
+            suggestion = client.places_autocomplete(QUERY_PREFIX + name)[0]['description']
+            location = client.geocode(suggestion)[0]['geometry']['location']
+            db_file.write(f"{name}|{QUERY_PREFIX}{name}|{suggestion}|{location['lat']}|{location['lng']}\n")
+
+
+def run(stage, known, names, directory, normalize, args):
+    db_path = os.path.join(directory, f"place_db_{normalize}.csv")
+    write_database(db_path, known)
+    client = FakeMapsClient(latency=args.latency)
+    output = io.StringIO()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        result = stage.update_places('unused', pd.DataFrame({'地名': names}),
+                                     os.path.join(directory, 'updated_places.csv'), QUERY_PREFIX, db_path,
+                                     concurrency=8, queries_per_second=0, negative_ttl_days=0,
+                                     normalize=normalize, similarity=args.similarity, gmaps_client=client)
+    elapsed = time.perf_counter() - started
+    return result, client.calls, elapsed, output.getvalue().strip().splitlines()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比較地名正規化前後的地點查詢 API 呼叫次數")
+    parser.add_argument('--roads', type=int, default=20, help="道路里程樁號地點數")
+    parser.add_argument('--landmarks', type=int, default=40, help="地標地點數")
+    parser.add_argument('--variants', type=int, default=4, help="每個地點在輸入中出現的寫法數")
+    parser.add_argument('--similarity', type=float, default=0.85, help="地名相似度門檻")
+    parser.add_argument('--latency', type=float, default=0.01, help="每次 API 呼叫的延遲 (秒)")
+    parser.add_argument('--seed', type=int, default=0, help="亂數種子")
+    args = parser.parse_args()
+
+    stage = load_stage(5)
+    markers, landmarks = make_places(args.roads, args.landmarks, args.seed)
+    known, names, places = make_input(markers, landmarks, args.variants, args.seed)
+    distinct = len(set(names))
+    normalized = len({normalize_place_name(name) for name in names})
+    print(f"數據庫 {len(known)} 個地點；輸入 {len(names)} 個地名，{distinct} 種寫法，"
+          f"正規化後 {normalized} 種，實際 {places} 個地點")
+
+    with tempfile.TemporaryDirectory() as directory:
+        exact, exact_calls, exact_time, _ = run(stage, known, names, directory, False, args)
+        print(f"完全相同比對   API 呼叫 {exact_calls:4d} 次，{exact_time:.2f} 秒")
+        fuzzy, fuzzy_calls, fuzzy_time, report = run(stage, known, names, directory, True, args)
+        print(f"正規化與相似比對 API 呼叫 {fuzzy_calls:4d} 次，{fuzzy_time:.2f} 秒")
+        for line in report:
+            if line.startswith('地名正規化'):
+                print(f"  {line}")
+
+    # 每個輸入地名都應取得座標，且同一地點的各種寫法座標相同
+    coordinates = {}
+    for row in fuzzy.itertuples(index=False):
+        coordinates.setdefault(normalize_place_name(row[0]), set()).add((row[3], row[4]))
+    consistent = all(len(values) == 1 for values in coordinates.values())
+    missing = set(exact['地名']) - set(fuzzy['地名'])
+    print(f"減少 {exact_calls - fuzzy_calls} 次 API 呼叫 ({1 - fuzzy_calls / exact_calls:.0%})；"
+          f"正規化後相同的寫法座標{'一致' if consistent else '不一致'}，"
+          f"{'所有地名都有座標' if not missing else f'{len(missing)} 個地名沒有座標'}")
+    return 0 if consistent and not missing else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
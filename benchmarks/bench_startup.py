@@ -0,0 +1,115 @@
+"""
+比較各階段腳本的冷啟動 (每次以 python 0X_*.py 啟動新的程序) 與透過常駐程序 (stage_worker.py) 執行的耗時。
+
+- 說明：每個階段執行 -h，耗時幾乎都是啟動 Python 與載入模組的時間；
+- 小型工作：以 chat_history.txt 與產生的小型事件日誌 (預設 200 列) 與地名數據庫執行 01、03、04、06、07 階段，
+  模擬每天只處理少量新增資料的情況。
+常駐程序在基準測試開始時啟動 (不計入耗時)，透過 stage_worker.py run 送出工作，耗時包含用戶端程序的啟動。
+每種方式執行多次取中位數。
+
+使用方法: python benchmarks/bench_startup.py [--repeat 5] [--events 200]
+"""
+import argparse
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from place_db import PLACE_DB_COLUMNS  # noqa: E402
+from prompt_builder import CSV_HEADER  # noqa: E402
+from stages import stage_path  # noqa: E402
+
+WORKER = os.path.join(ROOT_DIR, 'stage_worker.py')
+EVENT_TYPES = ['落石', '坍方', '道路封閉', '交通管制', '事故']
+
+
+def write_inputs(directory, events, seed):
+    """產生小型事件日誌與涵蓋所有地點的地名數據庫，回傳兩者的路徑。"""
+    generator = random.Random(seed)
+    names = [f"台7線{index / 10:g}k" for index in range(50)]
+    db_path = os.path.join(directory, 'place_db.csv')
+    with open(db_path, 'w', encoding='utf-8') as db_file:
+        db_file.write('|'.join(PLACE_DB_COLUMNS) + '\n')
+        for name in names:
+            db_file.write(f"{name}|{name}|{name}(建議)|{generator.uniform(24.4, 25.0):.5f}|"
+                          f"{generator.uniform(121.0, 121.6):.5f}\n")
+    event_path = os.path.join(directory, 'event_log.txt')
+    with open(event_path, 'w', encoding='utf-8') as event_file:
+        event_file.write(CSV_HEADER + '\n')
+        for index in range(events):
+            event_file.write(f"2024-{index % 12 + 1:02d}-{index % 28 + 1:02d},{generator.choice(EVENT_TYPES)},"
+                             f"{generator.choice(names)},第{index}則\n")
+    return db_path, event_path
+
+
+def timed(command, cwd):
+    """執行命令並回傳耗時；命令失敗時顯示輸出並結束。"""
+    started = time.perf_counter()
+    completed = subprocess.run(command, cwd=cwd, capture_output=True, text=True,
+                               env={**os.environ, 'MPLBACKEND': 'Agg'})
+    elapsed = time.perf_counter() - started
+    if completed.returncode != 0:
+        sys.exit(f"執行失敗 ({completed.returncode})：{' '.join(command)}\n{completed.stdout}{completed.stderr}")
+    return elapsed
+
+
+def median_time(command, cwd, repeat):
+    return statistics.median(timed(command, cwd) for _ in range(repeat))
+
+
+def start_worker(info_path):
+    """啟動常駐程序並等待它寫入位址檔案。"""
+    process = subprocess.Popen([sys.executable, WORKER, 'serve', '--info-file', info_path],
+                               cwd=ROOT_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    started = time.perf_counter()
+    while not os.path.exists(info_path):
+        if process.poll() is not None:
+            sys.exit("常駐程序無法啟動")
+        time.sleep(0.05)
+    return process, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比較各階段冷啟動與透過常駐程序執行的耗時")
+    parser.add_argument('--repeat', type=int, default=5, help="每種方式的執行次數 (取中位數)")
+    parser.add_argument('--events', type=int, default=200, help="小型工作的事件日誌列數")
+    parser.add_argument('--seed', type=int, default=0, help="亂數種子")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_path, event_path = write_inputs(directory, args.events, args.seed)
+        exported_path = os.path.join(directory, 'exported.csv')
+        jobs = [(number, ['-h'], '說明') for number in range(1, 8)]
+        jobs += [
+            (1, ['-I', os.path.join(ROOT_DIR, 'chat_history.txt'), '-O', os.path.join(directory, 'cleaned.txt')],
+             '清理 chat_history.txt'),
+            (3, ['-I', event_path, '-O', os.path.join(directory, 'chart.png')], f'圖表 ({args.events} 列)'),
+            (4, ['-I', event_path, '-O', os.path.join(directory, 'places.txt')], f'去除重複地點 ({args.events} 列)'),
+            (6, ['-D', db_path, '-I', event_path, '-O', exported_path], f'匯出事件 ({args.events} 列)'),
+            (7, ['-I', exported_path, '-O', os.path.join(directory, 'map.html')], f'地圖 ({args.events} 列)'),
+        ]
+
+        info_path = os.path.join(directory, 'worker.json')
+        worker, startup_time = start_worker(info_path)
+        print(f"常駐程序啟動 (預先載入模組) {startup_time:.2f} 秒，不計入下列耗時")
+        print(f"{'階段':<4} {'工作':<22} {'冷啟動 (秒)':>12} {'常駐程序 (秒)':>14} {'加速':>8}")
+        try:
+            for number, stage_args, label in jobs:
+                cold = median_time([sys.executable, stage_path(number), *stage_args], directory, args.repeat)
+                warm = median_time([sys.executable, WORKER, 'run', '--info-file', info_path, str(number), *stage_args],
+                                   directory, args.repeat)
+                print(f"{number:02d}   {label:<22} {cold:>12.3f} {warm:>14.3f} {cold / warm:>7.1f}x")
+        finally:
+            subprocess.run([sys.executable, WORKER, 'stop', '--info-file', info_path], capture_output=True)
+            worker.wait(timeout=30)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+"""
+以本機檔案系統上的 Batch API 替身 (LocalBatchBackend) 端對端檢查 02 階段的 --batch 模式：
+寫出 JSONL、送出、查詢狀態、中斷後依狀態檔繼續查詢，最後依 custom_id 對應回各批次並合併成事件日誌。
+回應為結構化輸出的 JSON，並模擬其中一批回應格式不符，確認只重新請求該批次。
+另外確認取得結果後會移除狀態檔、中斷後改用其他模型重新執行時不會沿用舊模型的批次，
+以及所有請求都失敗 (批次為 completed 但只有錯誤檔) 時回傳空的結果與每個請求的錯誤。
+不需要 API 金鑰，也不會連線。
+
+使用方法: python benchmarks/check_batch_mode.py [-I 事件摘要] [-C 分批token上限]
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_batch import LocalBatchBackend, build_batch_lines, load_state, run_batch  # noqa: E402
+from llm_cache import ResponseCache  # noqa: E402
+from llm_providers import FakeProvider  # noqa: E402
+from prompt_builder import PromptBuilder  # noqa: E402
+from stages import ROOT_DIR, load_stage  # noqa: E402
+
+
+class Interrupted(Exception):
+    """模擬查詢途中程式被中斷。"""
+
+
+def interrupt(_seconds):
+    raise Interrupted()
+
+
+def reject(_body):
+    raise ValueError("模擬請求失敗")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端對端檢查 Batch API 模式")
+    parser.add_argument('-I', '--input', help="事件摘要檔案 (未指定時以 01 階段處理 chat_history.txt)")
+    parser.add_argument('-C', '--chunk-tokens', type=int, default=2000, help="每批輸入的 token 上限")
+    args = parser.parse_args()
+
+    if args.input:
+        with open(args.input, 'r', encoding='utf-8') as file:
+            summary = file.read()
+    else:
+        clean_stage = load_stage(1)
+        summary = clean_stage.format_event_summary(clean_stage.collect_events(
+            clean_stage.stream_file_events(os.path.join(ROOT_DIR, 'chat_history.txt'))))
+
+    stage = load_stage(2)
+    provider = FakeProvider(base_latency=0)
+    prompt_builder = PromptBuilder([], 'openai', max_examples=0)
+    chunks = stage.build_chunks(stage.split_summary_by_day(summary), args.chunk_tokens)
+    requests = [(chunk, prompt_builder.history_for(chunk)) for chunk in chunks]
+    expected = stage.format_event_log([stage.validate_row(line) for chunk in chunks
+                                       for line in stage.parse_csv_rows(provider.respond(chunk))])
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        backend = LocalBatchBackend(os.path.join(tmp_dir, 'batch_api'), provider.respond_to_body,
+                                    polls_to_complete=3)
+        state_path = os.path.join(tmp_dir, 'event_log.txt.batch.json')
+
+        # 第一次執行：送出後在第一次查詢時中斷
+        try:
+            stage.batch_extract(backend, provider, requests, state_path, poll_interval=0, sleep=interrupt)
+        except Interrupted:
+            state = load_state(state_path)
+            print(f"第一次執行中斷，批次 {state['batch_id']} 狀態 {state['status']}")
+
+        # 第二次執行：依狀態檔繼續查詢同一個批次，並將結果存入快取
+        cache = ResponseCache(os.path.join(tmp_dir, 'cache.sqlite'))
+        key_parts = dict(provider='fake', model='fake', system_instruction='', generation_config={})
+        responses = stage.batch_extract(backend, provider, requests, state_path, poll_interval=0,
+                                        cache=cache, key_parts=key_parts, sleep=lambda _: None)
+        batch_dir = os.path.join(tmp_dir, 'batch_api', 'batches')
+        resumed_batch = os.listdir(batch_dir) == [f"{state['batch_id']}.json"]
+        state_discarded = load_state(state_path) is None
+        rows, _, _ = stage.extract_validated(None, provider.send, requests, provider.structured, responses=responses)
+        merged = stage.format_event_log(rows)
+
+        # 其中一批的回應格式不符 (例如被截斷的 JSON)，只重新請求這一批
+        broken = list(responses)
+        broken[len(broken) // 2] = broken[len(broken) // 2][:20]
+        calls = provider.calls
+        rows, retries, failures = stage.extract_validated(None, provider.send, requests, provider.structured,
+                                                          responses=broken)
+        retried_only_broken = retries == provider.calls - calls == 1 and not failures
+        merged_after_retry = stage.format_event_log(rows)
+
+        # 第三次執行：全部命中快取，不會送出新的批次
+        stage.batch_extract(backend, provider, requests, state_path, cache=cache, key_parts=key_parts)
+        batches = os.listdir(batch_dir)
+        print(f"{len(chunks)} 個批次請求，建立的批次數：{len(batches)}，{cache.summary()}")
+        cache.close()
+
+        # 中斷後改用其他模型重新執行：請求內容不同，必須送出新的批次而不是沿用舊模型的批次
+        other_dir = os.path.join(tmp_dir, 'other_model')
+        other_backend = LocalBatchBackend(other_dir, provider.respond_to_body, polls_to_complete=3)
+        other_state_path = os.path.join(tmp_dir, 'other_model.batch.json')
+        try:
+            stage.batch_extract(other_backend, provider, requests, other_state_path, poll_interval=0, sleep=interrupt)
+        except Interrupted:
+            stale_batch = load_state(other_state_path)['batch_id']
+        other_provider = FakeProvider('fake-2', base_latency=0)
+        stage.batch_extract(other_backend, other_provider, requests, other_state_path, poll_interval=0,
+                            sleep=lambda _: None)
+        other_batches = os.listdir(os.path.join(other_dir, 'batches'))
+        new_batch_for_model = len(other_batches) == 2 and f"{stale_batch}.json" in other_batches
+
+        # 所有請求都失敗：批次為 completed，沒有結果檔，只有錯誤檔
+        failing_backend = LocalBatchBackend(os.path.join(tmp_dir, 'failing'), reject, polls_to_complete=1)
+        lines = build_batch_lines(provider, requests)
+        failed_state_path = os.path.join(tmp_dir, 'failing.batch.json')
+        results, errors = run_batch(failing_backend, lines, failed_state_path, poll_interval=0)
+        all_failed_reported = (results == {} and sorted(errors) == sorted(custom_id for custom_id, _ in lines)
+                               and load_state(failed_state_path) is None)
+
+    print(f"沿用中斷前的批次：{'是' if resumed_batch else '否'}")
+    print(f"取得結果後移除狀態檔：{'是' if state_discarded else '否'}")
+    print(f"改用其他模型時送出新的批次：{'是' if new_batch_for_model else '否'}")
+    print(f"所有請求都失敗時回傳每個請求的錯誤：{'是' if all_failed_reported else '否'}")
+    print(f"結果與逐批送出一致：{'是' if merged == expected else '否'}")
+    print(f"格式不符的批次只重新請求一次且結果一致：{'是' if retried_only_broken and merged_after_retry == expected else '否'}")
+    sys.exit(0 if resumed_batch and state_discarded and new_batch_for_model and all_failed_reported
+             and merged == expected and len(batches) == 1 and retried_only_broken
+             and merged_after_retry == expected else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+檢查增量管線 (pipeline.py)：先以較早的聊天記錄匯出完整執行一次，再換成較新的匯出增量執行，
+比對結果與直接完整處理新匯出的結果是否相同，並統計兩種方式送出的大語言模型請求與地圖 API 呼叫次數。
+大語言模型與 Google Maps 都以不連線的替身取代，不需要 API 金鑰。
+
+使用方法: python benchmarks/check_pipeline.py [-I 聊天記錄] [--split 較早匯出所佔的比例]
+"""
+import argparse
+import contextlib
+import hashlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from event_store import store_available  # noqa: E402
+from llm_providers import FakeProvider  # noqa: E402
+from prompt_builder import CSV_HEADER  # noqa: E402
+from stages import ROOT_DIR, load_stage  # noqa: E402
+
+import pipeline  # noqa: E402
+
+PLACES = ['華陵', '巴陵', '上巴陵', '拉拉山', '光華', '高義', '三光']
+CONFIG_FILES = ['system_config_openai.json', 'history_openai.json', 'event_taxonomy.json']
+COMPARED_FILES = [pipeline.SUMMARY_FILE, pipeline.EVENT_LOG_FILE, pipeline.MATCHED_EVENTS_FILE]
+
+
+class PlaceFakeProvider(FakeProvider):
+    """依事件描述的雜湊填入一個固定地點的假供應商，讓 04 ~ 07 階段有地點可以處理。"""
+
+    requests = 0
+
+    def respond(self, message):
+        PlaceFakeProvider.requests += 1
+        rows = []
+        for line in message.splitlines():
+            fields = line.split('，', 2)
+            if len(fields) == 3:
+                place = PLACES[int(hashlib.sha256(fields[2].encode('utf-8')).hexdigest(), 16) % len(PLACES)]
+                rows.append(f"{fields[0].replace('/', '-')},{fields[1]},{place},")
+        return '\n'.join([CSV_HEADER, *rows])
+
+
+class FakeMapsClient:
+    """Google Maps 客戶端的替身，記錄呼叫次數。"""
+
+    calls = 0
+
+    def __init__(self, key=None):
+        pass
+
+    def places_autocomplete(self, query):
+        FakeMapsClient.calls += 1
+        return [{'description': f"{query}(建議)"}]
+
+    def geocode(self, place_name):
+        FakeMapsClient.calls += 1
+        digest = int(hashlib.sha256(place_name.encode('utf-8')).hexdigest(), 16)
+        return [{'geometry': {'location': {'lat': round(24.6 + digest % 1000 / 10000, 4),
+                                           'lng': round(121.4 + digest // 1000 % 1000 / 10000, 4)}}}]
+
+
+def run_pipeline(directory, *extra):
+    """在指定目錄執行管線，回傳 (秒數, 大語言模型請求數, 地圖 API 呼叫數, 各階段耗時報告)。"""
+    PlaceFakeProvider.requests = FakeMapsClient.calls = 0
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            graph = pipeline.main(['-K', 'unused', '-L', 'fake', '-P', 'openai', '-M', 'unused',
+                           '-R', '桃園市復興區', '-C', '2000', '--no-cache', *extra])
+        elapsed = time.perf_counter() - started
+    finally:
+        os.chdir(cwd)
+    return elapsed, PlaceFakeProvider.requests, FakeMapsClient.calls, graph.report()
+
+
+def prepare(directory, chat):
+    for name in CONFIG_FILES:
+        shutil.copy(os.path.join(ROOT_DIR, name), directory)
+    with open(os.path.join(directory, 'chat_history.txt'), 'wb') as file:
+        file.write(chat)
+
+
+def read(path):
+    with open(path, 'r', encoding='utf-8') as file:
+        return file.read()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="檢查增量管線的結果與完整處理相同")
+    parser.add_argument('-I', '--input', default=os.path.join(ROOT_DIR, 'chat_history.txt'), help="聊天記錄")
+    parser.add_argument('--split', type=float, default=0.9, help="較早匯出所佔的比例")
+    args = parser.parse_args()
+
+    stage_02 = load_stage(2)
+    stage_02.create_provider = lambda name, key, model, config, **kwargs: PlaceFakeProvider(
+        model, config, base_latency=0.02, seconds_per_1k_tokens=0.05)
+    load_stage(5).googlemaps.Client = FakeMapsClient
+
+    with open(args.input, 'rb') as file:
+        chat = file.read()
+    # 在某一天的訊息中間切開，模擬前一次匯出時最後一天尚未結束
+    split_at = chat.index(b'\n', int(len(chat) * args.split)) + 1
+
+    with tempfile.TemporaryDirectory() as incremental_dir, tempfile.TemporaryDirectory() as full_dir:
+        prepare(incremental_dir, chat[:split_at])
+        first = run_pipeline(incremental_dir)
+        prepare(incremental_dir, chat)
+        incremental = run_pipeline(incremental_dir)
+        unchanged = run_pipeline(incremental_dir)
+
+        prepare(full_dir, chat)
+        full = run_pipeline(full_dir)
+
+        for label, (elapsed, requests, calls, _) in [("較早匯出 (完整)", first), ("新匯出 (增量)", incremental),
+                                                   ("未改變 (增量)", unchanged), ("新匯出 (完整)", full)]:
+            print(f"{label:<14} {elapsed:6.2f} 秒，大語言模型請求 {requests:3d} 次，地圖 API 呼叫 {calls:3d} 次")
+
+        print(f"新匯出 (完整) 的各階段耗時：\n{full[3]}")
+        print(f"新匯出 (增量) 的各階段耗時：\n{incremental[3]}")
+
+        identical = True
+        for name in COMPARED_FILES:
+            same = read(os.path.join(incremental_dir, name)) == read(os.path.join(full_dir, name))
+            identical &= same
+            print(f"{name}: {'相同' if same else '不同'}")
+        incremental_places = sorted(read(os.path.join(incremental_dir, pipeline.PLACE_DB_FILE)).splitlines())
+        full_places = sorted(read(os.path.join(full_dir, pipeline.PLACE_DB_FILE)).splitlines())
+        identical &= incremental_places == full_places
+        print(f"{pipeline.PLACE_DB_FILE}: {'相同 (不計順序)' if incremental_places == full_places else '不同'}")
+
+        # 管線在記憶體中傳遞表格，結果應與單獨執行 06 階段 (讀取 CSV 或事件儲存檔) 相同
+        inputs = [pipeline.EVENT_LOG_FILE] + ([pipeline.EVENT_STORE_FILE] if store_available() else [])
+        for input_name in inputs:
+            standalone = os.path.join(full_dir, 'standalone_matched_events.csv')
+            load_stage(6).main(['-I', os.path.join(full_dir, input_name), '-O', standalone,
+                                '-D', os.path.join(full_dir, pipeline.PLACE_DB_FILE)])
+            same = read(standalone) == read(os.path.join(full_dir, pipeline.MATCHED_EVENTS_FILE))
+            identical &= same
+            print(f"單獨執行 06 階段 ({input_name}): {'相同' if same else '不同'}")
+        print("增量結果與完整處理相同" if identical else "增量結果與完整處理不同")
+        return 0 if identical else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+"""
+離線檢查 prompt_builder 的範例挑選：對每個批次確認挑選出的範例涵蓋批次中出現的所有事件類型，
+並列出精簡後節省的提示詞 token 數量。不需要 API 金鑰，也不會連線。
+
+使用方法: python benchmarks/check_prompt_builder.py [-I 事件摘要] [-C 分批token上限] [-F 範例數]
+未指定 -I 時，以 01 階段處理 chat_history.txt 產生事件摘要。
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prompt_builder import PromptBuilder, summary_event_types  # noqa: E402
+from stages import ROOT_DIR, load_stage  # noqa: E402
+
+
+def load_summary(path):
+    if path:
+        with open(path, 'r', encoding='utf-8') as file:
+            return file.read()
+    stage = load_stage(1)
+    taxonomy = stage.load_taxonomy(os.path.join(ROOT_DIR, 'event_taxonomy.json'))
+    chat_path = os.path.join(ROOT_DIR, 'chat_history.txt')
+    return stage.format_event_summary(stage.collect_events(stage.stream_file_events(chat_path, taxonomy)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="離線檢查範例挑選與提示詞 token 節省量")
+    parser.add_argument('-I', '--input', help="事件摘要檔案")
+    parser.add_argument('-C', '--chunk-tokens', type=int, default=2000, help="每批輸入的 token 上限")
+    parser.add_argument('-F', '--few-shot', type=int, default=8, help="每批挑選的範例數量")
+    args = parser.parse_args()
+
+    extract_stage = load_stage(2)
+    summary = load_summary(args.input)
+    chunks = extract_stage.build_chunks(extract_stage.split_summary_by_day(summary), args.chunk_tokens)
+
+    failures = 0
+    for provider in ('google', 'openai'):
+        with open(os.path.join(ROOT_DIR, f'system_config_{provider}.json'), 'r', encoding='utf-8') as file:
+            system_config = json.load(file)
+        with open(os.path.join(ROOT_DIR, f'history_{provider}.json'), 'r', encoding='utf-8') as file:
+            history = json.load(file)
+
+        builder = PromptBuilder(history, provider, system_config.get('instruction', ''),
+                                max_examples=args.few_shot, compact_instruction=True)
+        print(f"[{provider}] 對話歷史拆成 {len(builder.examples)} 個單日範例，共用範例 {len(builder.pinned)} 個")
+        for number, chunk in enumerate(chunks, start=1):
+            indices = builder.select_examples(chunk)
+            builder.history_for(chunk)
+            missing = summary_event_types(chunk) - builder.covered_event_types(indices)
+            if missing:
+                failures += 1
+                print(f"  第 {number} 批缺少事件類型的範例：{'、'.join(sorted(missing))}")
+        print(f"  {builder.report()}")
+
+    print("所有批次的範例皆涵蓋批次中的事件類型" if not failures else f"{failures} 個批次未通過檢查")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
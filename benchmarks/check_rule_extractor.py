@@ -0,0 +1,130 @@
+"""
+離線檢查規則擷取 (rule_extractor.py)：
+
+- 一致性：以對話歷史 (history_*.json) 中的範例作為大語言模型的輸出，比對規則處理的摘要行是否產生相同的資料列。
+  地名數據庫通常由 05 階段從大語言模型的輸出建立，而範例中的地點正是大語言模型的輸出，
+  因此比對每一行時只以「其他摘要行」的範例地點建立地名清單，避免答案本身出現在地名清單中；提供 -D 時改用該地名數據庫；
+- 略過比例：以 01 階段處理 chat_history.txt 產生事件摘要，統計不需送給大語言模型的摘要行與輸入 token 數量，
+  地名清單為所有範例的地點 (模擬已處理過這些資料的地名數據庫) 加上 -D 的地名數據庫。
+
+不需要 API 金鑰，也不會連線。
+
+使用方法: python benchmarks/check_rule_extractor.py [-H history_openai.json ...] [-D place_db.csv] [-T event_taxonomy.json]
+"""
+import argparse
+import json
+import os
+import sys
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from event_schema import csv_fields  # noqa: E402
+from place_db import PlaceDatabase  # noqa: E402
+from place_names import normalize_place_name  # noqa: E402
+from prompt_builder import estimate_tokens, message_text, normalize_date  # noqa: E402
+from rule_extractor import Gazetteer, RuleExtractor, bypass_report, load_taxonomy  # noqa: E402
+from stages import ROOT_DIR, load_stage  # noqa: E402
+
+
+def history_pairs(history):
+    """將對話歷史拆成 (摘要行, 範例中對應的資料列) 的清單，以日期與事件類型對應。"""
+    pairs = []
+    for user_message, model_message in zip(history[::2], history[1::2]):
+        rows = {}
+        for line in message_text(model_message).splitlines():
+            fields = csv_fields(line)
+            if fields is not None and normalize_date(fields[0]):
+                rows.setdefault((normalize_date(fields[0]), fields[1]), []).append(fields)
+        for line in message_text(user_message).splitlines():
+            fields = line.split('，', 2)
+            if len(fields) == 3 and normalize_date(fields[0]):
+                pairs.append((line, rows.get((normalize_date(fields[0]), fields[1].strip()), [])))
+    return pairs
+
+
+def row_places(rows):
+    return [place for row in rows for place in row[2].split(';') if place.strip()]
+
+
+def place_keys(rows):
+    return {normalize_place_name(place) for place in row_places(rows)}
+
+
+def check_agreement(path, taxonomy, place_db, max_listed):
+    with open(path, 'r', encoding='utf-8') as history_file:
+        pairs = history_pairs(json.load(history_file))
+    counts = Counter(place for _, rows in pairs for place in row_places(rows))
+    fixed = RuleExtractor(Gazetteer.from_place_db(place_db), taxonomy) if place_db else None
+
+    bypassed = places_agree = exact = 0
+    disagreements = []
+    for line, expected in pairs:
+        if fixed is None:
+            # 只出現在這一行範例中的地點不列入地名清單
+            own = Counter(row_places(expected))
+            extractor = RuleExtractor(Gazetteer(place for place, count in counts.items() if count > own[place]),
+                                      taxonomy)
+        else:
+            extractor = fixed
+        rows = extractor.extract_line(line)
+        if rows is None:
+            continue
+        bypassed += 1
+        same_places = place_keys(rows) == place_keys(expected) and bool(rows) == bool(expected)
+        same_info = [row[3] for row in rows] == [row[3] for row in expected]
+        places_agree += same_places
+        exact += same_places and same_info
+        if not (same_places and same_info):
+            disagreements.append((line, rows, expected))
+
+    total = len(pairs)
+    print(f"{os.path.basename(path)}：共 {total} 行摘要，規則處理 {bypassed} 行 ({bypassed / total * 100:.1f}%)")
+    if bypassed:
+        print(f"  地點與範例相同 {places_agree}/{bypassed} 行 ({places_agree / bypassed * 100:.1f}%)，"
+              f"連同額外說明都相同 {exact}/{bypassed} 行 ({exact / bypassed * 100:.1f}%)")
+    for line, rows, expected in disagreements[:max_listed]:
+        print(f"  不同：{line[:60]}")
+        print(f"        規則 {[','.join(row) for row in rows] or '(沒有資料列)'}")
+        print(f"        範例 {[','.join(row) for row in expected] or '(沒有資料列)'}")
+    return places_agree == bypassed
+
+
+def check_bypass(histories, taxonomy, place_db):
+    names = []
+    for path in histories:
+        with open(path, 'r', encoding='utf-8') as history_file:
+            names += [place for _, rows in history_pairs(json.load(history_file)) for place in row_places(rows)]
+    if place_db:
+        names += [record['地名'] for record in PlaceDatabase(place_db).records()]
+    extractor = RuleExtractor(Gazetteer(names), taxonomy)
+
+    stage = load_stage(1)
+    chat_path = os.path.join(ROOT_DIR, 'chat_history.txt')
+    summary = stage.format_event_summary(stage.collect_events(stage.stream_file_events(chat_path, taxonomy)))
+    rows, remaining, stats = extractor.split(summary)
+    saved = estimate_tokens(summary) - estimate_tokens(remaining)
+    print(f"\nchat_history.txt (地名清單 {len(extractor.gazetteer)} 個地名)：{bypass_report(stats)}")
+    print(f"  送給大語言模型的摘要減少約 {saved:,} 個輸入 token ({saved / estimate_tokens(summary) * 100:.1f}%)，"
+          f"規則產生 {len(rows)} 列")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="檢查規則擷取與大語言模型輸出的一致性以及略過比例")
+    parser.add_argument('-H', '--history', nargs='+',
+                        default=[os.path.join(ROOT_DIR, 'history_openai.json'),
+                                 os.path.join(ROOT_DIR, 'history_google.json')], help="對話記錄檔案")
+    parser.add_argument('-D', '--place-db', help="地名數據庫 (預設以範例中的地點建立地名清單)")
+    parser.add_argument('-T', '--taxonomy', default=os.path.join(ROOT_DIR, 'event_taxonomy.json'),
+                        help="事件分類檔")
+    parser.add_argument('--show', type=int, default=10, help="列出不一致的摘要行數")
+    args = parser.parse_args()
+
+    taxonomy = load_taxonomy(args.taxonomy)
+    consistent = all([check_agreement(path, taxonomy, args.place_db, args.show) for path in args.history])
+    check_bypass(args.history, taxonomy, args.place_db)
+    return 0 if consistent else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""
+檢查 02 階段的 --stream 模式在中途被強制結束後，以 --resume 是否從最後寫入的日期繼續：
+先完整執行一次作為基準，再以相同參數在子程序中執行，出現第一筆進度記錄後以 SIGKILL 結束該程序，
+接著加上 --resume 重新執行，確認從進度記錄的日期之後繼續 (只送出剩下的批次)，且最後的事件日誌與基準完全相同。
+大語言模型為 bench_end_to_end.py 的假供應商 (每個請求延遲 --latency 秒)，不需要 API 金鑰，也不會連線。
+
+使用方法: python benchmarks/check_stream_resume.py [-C 分批token上限] [--latency 秒數]
+"""
+import argparse
+import json
+import os
+import re
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+sys.path.insert(0, BENCHMARK_DIR)
+
+from bench_end_to_end import write_system_config  # noqa: E402
+from stages import ROOT_DIR, stage_path  # noqa: E402
+
+END_TO_END = os.path.join(BENCHMARK_DIR, 'bench_end_to_end.py')
+RESUME_PATTERN = re.compile(r'從 (\S+) 之後繼續')
+BATCHES_PATTERN = re.compile(r'共 (\d+) 批')
+
+
+def stream_command(directory, output, chunk_tokens, latency, resume=False):
+    """以假供應商執行 02 階段串流模式的命令 (未指定 -C 時使用串流模式的預設分批)。"""
+    command = [sys.executable, END_TO_END, 'child', '2', str(latency), '0',
+               '-K', 'unused', '-L', 'fake', '-P', 'openai', '-S', os.path.join(directory, 'system_config.json'),
+               '-H', os.path.join(ROOT_DIR, 'history_openai.json'), '-I', os.path.join(directory, 'output_summary.txt'),
+               '-O', output, '-J', '1', '--no-cache', '--stream']
+    if chunk_tokens:
+        command += ['-C', str(chunk_tokens)]
+    if resume:
+        command.append('--resume')
+    return command
+
+
+def read_text(path):
+    with open(path, 'r', encoding='utf-8') as file:
+        return file.read()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="檢查串流模式中斷後以 --resume 繼續")
+    parser.add_argument('-C', '--chunk-tokens', type=int, default=0,
+                        help="每批輸入的 token 上限 (預設 0，使用串流模式的預設分批)")
+    parser.add_argument('--latency', type=float, default=0.3, help="假供應商每個請求的延遲秒數")
+    parser.add_argument('--timeout', type=float, default=60, help="等待第一筆進度記錄的秒數上限")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        write_system_config(os.path.join(tmp_dir, 'system_config.json'))
+        subprocess.run([sys.executable, stage_path(1), '-I', os.path.join(ROOT_DIR, 'chat_history.txt'),
+                        '-O', os.path.join(tmp_dir, 'output_summary.txt'),
+                        '-T', os.path.join(ROOT_DIR, 'event_taxonomy.json')], check=True, stdout=subprocess.DEVNULL)
+
+        # 基準：不中斷地執行一次
+        expected_path = os.path.join(tmp_dir, 'expected.txt')
+        completed = subprocess.run(stream_command(tmp_dir, expected_path, args.chunk_tokens, args.latency),
+                                   check=True, capture_output=True, text=True)
+        total_batches = int(BATCHES_PATTERN.search(completed.stdout).group(1))
+        expected = read_text(expected_path)
+
+        # 出現第一筆進度記錄 (第一批已驗證並寫入) 後強制結束程序
+        output = os.path.join(tmp_dir, 'event_log.txt')
+        progress_file = output + '.progress.json'
+        process = subprocess.Popen(stream_command(tmp_dir, output, args.chunk_tokens, args.latency),
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + args.timeout
+        while not os.path.exists(progress_file) and process.poll() is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        killed = process.poll() is None
+        if killed:
+            process.send_signal(signal.SIGKILL)
+        process.wait()
+        # 程序在出現進度記錄前就完成時 (例如只有一批)，進度記錄已被移除，--resume 會從頭執行
+        last_date = None
+        if os.path.exists(progress_file):
+            with open(progress_file, 'r', encoding='utf-8') as file:
+                last_date = json.load(file)['last_completed_date']
+        interrupted_rows = len(read_text(output).splitlines()) - 1
+        print(f"共 {total_batches} 批；第一次執行{'在寫入後被強制結束' if killed else '在強制結束前已完成'}，"
+              f"進度記錄 {last_date}，事件日誌已有 {interrupted_rows} 列")
+
+        # 以 --resume 繼續
+        resumed = subprocess.run(stream_command(tmp_dir, output, args.chunk_tokens, args.latency, resume=True),
+                                 check=True, capture_output=True, text=True)
+        resume_match = RESUME_PATTERN.search(resumed.stdout)
+        resumed_from = resume_match.group(1) if resume_match else None
+        resumed_batches = int(BATCHES_PATTERN.search(resumed.stdout).group(1))
+        print(f"--resume 從 {resumed_from} 之後繼續，送出 {resumed_batches} 批")
+        same = read_text(output) == expected
+        progress_removed = not os.path.exists(progress_file)
+
+    print(f"串流模式分批 (中斷時已有完成的日期)：{'是' if total_batches > 1 else '否'}")
+    print(f"從最後寫入的日期繼續且只送出剩下的批次：{'是' if resumed_from == last_date and resumed_batches < total_batches else '否'}")
+    print(f"結果與不中斷的執行相同：{'是' if same else '否'}")
+    print(f"完成後移除進度記錄：{'是' if progress_removed else '否'}")
+    sys.exit(0 if killed and total_batches > 1 and resumed_from == last_date and resumed_batches < total_batches
+             and same and progress_removed else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+以固定的亂數種子產生任意大小的 LINE 聊天記錄匯出檔 (格式與 chat_history.txt 相同)，用於測試各階段在大量資料下的表現。
+
+- 檔案標題、每天的日期行 (前面空一行)、12 小時制的時間、發送者與訊息以 Tab 分隔；
+- 一般對話、貼圖、照片、影片等媒體、以引號包住的多行訊息；
+- 沒有發送者的系統訊息：加入、邀請、退出群組與收回訊息；
+- 依 --event-rate 的比例提到事件分類檔中的關鍵字，其中依 --place-rate 的比例同時提到地名或道路里程。
+
+規模以 chat_history.txt 為 1 倍 (311 天、約 9,500 則訊息)。10 倍以內增加天數，
+超過 10 倍時維持約 8.5 年的期間並增加每天的訊息數，避免日期超出 pandas 可以表示的範圍。
+相同的種子與參數產生完全相同的檔案。
+
+使用方法: python benchmarks/synthetic_line_export.py -O 輸出檔案 [--scale 1] [--seed 0]
+                                                      [--event-rate 0.05] [--place-rate 0.7]
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# chat_history.txt 的規模
+SAMPLE_DAYS = 311
+SAMPLE_MESSAGES_PER_DAY = 30.5
+# 超過此倍數時改為增加每天的訊息數
+MAX_DAY_SCALE = 10
+START_DATE = datetime.date(2023, 5, 29)
+GROUP_NAME = '華陵里里民（公務）平台'
+
+# 各種訊息所佔的比例 (與 chat_history.txt 相近)，剩下的是一般對話與事件訊息
+SYSTEM_RATE = 0.05
+PHOTO_RATE = 0.27
+STICKER_RATE = 0.12
+OTHER_MEDIA_RATE = 0.025
+MULTILINE_RATE = 0.06
+OTHER_MEDIA = ['[Video]', '[File]', '[Voice message]', '[Contact]']
+
+# 地名與道路，事件訊息中的地點由這兩份清單產生
+PLACE_NAMES = ['華陵', '巴陵', '上巴陵', '下巴陵', '拉拉山', '光華', '高義', '三光', '中心路', '楓墅',
+               '比亞外', '蘇樂', '下蘇樂', '爺亨', '嘎拉賀', '新興', '巴陵大橋', '四稜', '明池', '榮華']
+ROADS = [('台7線', 20.0, 60.0), ('桃116線', 0.0, 12.0), ('北橫', 30.0, 70.0)]
+
+EVENT_TEMPLATES_WITH_PLACE = [
+    '{place}{keyword}了', '{place}{keyword}，目前無法通行', '民眾反映{place}也有{keyword}',
+    '{place}{keyword}已排除', '{place}附近{keyword}，請用路人注意安全', '{place}又{keyword}了，請協助處理謝謝',
+]
+EVENT_TEMPLATES = ['{keyword}', '又{keyword}了', '{keyword}中，請小心', '家裡{keyword}了～']
+
+# 一般對話不包含事件分類檔中的關鍵字
+CHAT_PHRASES = [
+    '早安', '午安', '晚安', '謝謝分享', '收到', '辛苦了', '謝謝里長', '好的 👍', '感謝🙏', '了解',
+    '請問明天有開會嗎？', '今天天氣很好', '路上小心', '大家注意安全', '明天的活動幾點開始？',
+    '已回報給公所', '麻煩您了⋯⋯謝謝', '已經通知相關單位處理', '里長晚安', '請問垃圾車今天有來嗎',
+    '拉拉山的水蜜桃開始採收了', '週末市集在活動中心', '謝謝大家的幫忙', '有人知道公車時刻表嗎？',
+]
+ANNOUNCEMENT_LINES = [
+    '各位里民大家好', '本週六上午 9 點於活動中心舉辦里民大會', '請大家踴躍參加', '',
+    '活動內容：', '1.健康檢查', '2.社區清潔', '3.防災宣導', '報名請洽里辦公處', '謝謝大家🙏',
+]
+
+SURNAMES = '陳林黃張李王吳劉蔡楊許鄭謝郭洪曾邱廖賴周徐蘇葉莊呂江何蕭羅高'
+GIVEN_NAME_CHARACTERS = '志明雅惠淑芬家豪建宏怡君俊傑美玲榮樹朝煌文華秀英麗珍國強宗翰'
+SENDER_COUNT = 375
+
+
+def scale_layout(scale):
+    """依規模回傳 (天數, 每天的平均訊息數)。"""
+    day_scale = min(scale, MAX_DAY_SCALE)
+    days = max(1, round(SAMPLE_DAYS * day_scale))
+    return days, SAMPLE_MESSAGES_PER_DAY * scale / day_scale
+
+
+def load_keywords(taxonomy_path):
+    """事件分類檔中所有的同義詞 (事件類型 -> 同義詞)。"""
+    with open(taxonomy_path, 'r', encoding='utf-8') as taxonomy_file:
+        taxonomy = json.load(taxonomy_file)
+    return sorted({synonym for synonyms in taxonomy.values() for synonym in synonyms})
+
+
+class LineExportGenerator:
+    """依種子產生聊天記錄的每一行；訊息一天一天產生，不論規模多大都不會佔用大量記憶體。"""
+
+    def __init__(self, keywords, seed=0, event_rate=0.05, place_rate=0.7):
+        self.keywords = keywords
+        self.event_rate = event_rate
+        self.place_rate = place_rate
+        self.random = random.Random(seed)
+        self.senders = self._make_senders()
+        self.stats = {'days': 0, 'messages': 0, 'events': 0, 'events_with_place': 0, 'lines': 0}
+
+    def _make_senders(self):
+        senders = {f"{self.random.choice(SURNAMES)}{''.join(self.random.sample(GIVEN_NAME_CHARACTERS, 2))}"
+                   for _ in range(SENDER_COUNT * 2)}
+        senders = sorted(senders)[:SENDER_COUNT - 1]
+        self.random.shuffle(senders)
+        return ['華陵里里長 梁雅惠', *senders]
+
+    def _sender(self):
+        # 少數人發送大部分的訊息
+        return self.senders[min(int(self.random.paretovariate(0.6)) - 1, len(self.senders) - 1)]
+
+    def place(self):
+        if self.random.random() < 0.4:
+            road, low, high = self.random.choice(ROADS)
+            return f"{road}{self.random.uniform(low, high):.1f}K"
+        return self.random.choice(PLACE_NAMES)
+
+    def event_text(self):
+        keyword = self.random.choice(self.keywords)
+        self.stats['events'] += 1
+        if self.random.random() < self.place_rate:
+            self.stats['events_with_place'] += 1
+            return self.random.choice(EVENT_TEMPLATES_WITH_PLACE).format(place=self.place(), keyword=keyword)
+        return self.random.choice(EVENT_TEMPLATES).format(keyword=keyword)
+
+    def system_text(self):
+        name, other = self._sender(), self._sender()
+        choice = self.random.random()
+        if choice < 0.55:
+            return f"{name} unsent a message."
+        if choice < 0.7:
+            return f"⁨⁨{name}⁩⁩ joined the group."
+        if choice < 0.85:
+            return (f"⁨⁨{name}⁩⁩ invited ⁨⁨{other}⁩⁩ to the group. "
+                    f"Wait for them to join before chatting.")
+        if choice < 0.95:
+            return f"⁨⁨{name}⁩⁩ left the group."
+        return f"⁨⁨{name}⁩⁩ made an announcement."
+
+    def multiline_text(self):
+        """以引號包住的多行訊息，有時夾帶事件。"""
+        start = self.random.randrange(len(ANNOUNCEMENT_LINES) - 2)
+        lines = ANNOUNCEMENT_LINES[start:start + self.random.randint(2, 6)]
+        if self.random.random() < self.event_rate * 4:
+            lines = [*lines, self.event_text()]
+        return '"' + '\n'.join(lines) + '"'
+
+    def message(self):
+        """回傳 (發送者, 訊息)，系統訊息的發送者為空白。"""
+        choice = self.random.random()
+        if choice < SYSTEM_RATE:
+            return '', self.system_text()
+        choice -= SYSTEM_RATE
+        if choice < PHOTO_RATE:
+            return self._sender(), '[Photo]'
+        choice -= PHOTO_RATE
+        if choice < STICKER_RATE:
+            return self._sender(), '[Sticker]'
+        choice -= STICKER_RATE
+        if choice < OTHER_MEDIA_RATE:
+            return self._sender(), self.random.choice(OTHER_MEDIA)
+        choice -= OTHER_MEDIA_RATE
+        if choice < MULTILINE_RATE:
+            return self._sender(), self.multiline_text()
+        if self.random.random() < self.event_rate:
+            return self._sender(), self.event_text()
+        return self._sender(), self.random.choice(CHAT_PHRASES)
+
+    def day_lines(self, date, messages_per_day):
+        """一天的所有行：日期行與依時間排序的訊息。"""
+        count = max(1, round(self.random.expovariate(1 / messages_per_day)))
+        minutes = sorted(self.random.randrange(24 * 60) for _ in range(count))
+        self.stats['days'] += 1
+        self.stats['messages'] += count
+        yield f"{date:%Y/%m/%d}, {date:%a}"
+        for minute in minutes:
+            sender, text = self.message()
+            clock = datetime.time(minute // 60, minute % 60)
+            yield f"{clock:%I:%M %p}\t{sender}\t{text}"
+
+    def lines(self, days, messages_per_day, start=START_DATE, saved_on=None):
+        saved_on = saved_on or datetime.datetime.combine(start + datetime.timedelta(days=days), datetime.time(17, 53))
+        yield f"[LINE] Chat history in {GROUP_NAME}"
+        yield f"Saved on: {saved_on:%Y/%m/%d, %H:%M}"
+        for offset in range(days):
+            yield ''
+            yield from self.day_lines(start + datetime.timedelta(days=offset), messages_per_day)
+
+
+def write_export(path, scale=1, seed=0, event_rate=0.05, place_rate=0.7,
+                 taxonomy_path=os.path.join(ROOT_DIR, 'event_taxonomy.json')):
+    """寫入指定規模的聊天記錄匯出檔，回傳統計 (天數、訊息數、事件數、行數、位元組數)。"""
+    days, messages_per_day = scale_layout(scale)
+    generator = LineExportGenerator(load_keywords(taxonomy_path), seed, event_rate, place_rate)
+    with open(path, 'w', encoding='utf-8', newline='\n', buffering=1 << 20) as export_file:
+        for line in generator.lines(days, messages_per_day):
+            export_file.write(line + '\n')
+            generator.stats['lines'] += line.count('\n') + 1
+    return {**generator.stats, 'bytes': os.path.getsize(path)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="產生指定大小的 LINE 聊天記錄匯出檔")
+    parser.add_argument('-O', '--output', required=True, help="輸出的聊天記錄檔案")
+    parser.add_argument('--scale', type=float, default=1, help="相對於 chat_history.txt 的規模倍數")
+    parser.add_argument('--seed', type=int, default=0, help="亂數種子")
+    parser.add_argument('--event-rate', type=float, default=0.05, help="一般訊息中提到事件關鍵字的比例")
+    parser.add_argument('--place-rate', type=float, default=0.7, help="事件訊息中提到地名或道路里程的比例")
+    parser.add_argument('-T', '--taxonomy', default=os.path.join(ROOT_DIR, 'event_taxonomy.json'),
+                        help="事件分類檔 (提供事件關鍵字)")
+    args = parser.parse_args()
+
+    stats = write_export(args.output, args.scale, args.seed, args.event_rate, args.place_rate, args.taxonomy)
+    print(f"已寫入 {args.output}：{stats['days']:,} 天、{stats['messages']:,} 則訊息、{stats['lines']:,} 行、"
+          f"{stats['bytes'] / 1e6:.1f} MB；事件訊息 {stats['events']:,} 則 (提到地點 {stats['events_with_place']:,} 則)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+import io
+import mmap
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from stages import load_stage
+
+# 聊天記錄中的日期行 (例如：2024/11/08, Fri)；每個日期行都會重設解析狀態 (目前日期與未完成的訊息)，
+# 因此在日期行切開的各段可以各自解析，合併後與依序解析整個檔案相同
+DATE_HEADER_PATTERN = re.compile(rb'^\d{4}/\d{2}/\d{2},', re.MULTILINE)
+
+
+def plan_shards(path, shard_bytes):
+    """
+    將聊天記錄依日期行切成約 shard_bytes 大小的位元組範圍，回傳 [(起點, 終點), ...]。
+    以記憶體映射 (mmap) 從每個預定位置往後找下一個日期行，不需要讀取整個檔案。
+    """
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+    starts = [0]
+    with open(path, 'rb') as chat_file, mmap.mmap(chat_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        target = shard_bytes
+        while target < size:
+            # 從行中間開始搜尋時，^ 只會比對到換行之後的位置
+            header = DATE_HEADER_PATTERN.search(mapped, target)
+            if header is None:
+                break
+            starts.append(header.start())
+            target = header.start() + shard_bytes
+    return list(zip(starts, starts[1:] + [size]))
+
+
+def read_shard(path, start, end):
+    """讀取一段位元組範圍並逐行產出，換行的處理與以文字模式開啟檔案相同 (\\r\\n 與 \\r 皆視為換行)。"""
+    with open(path, 'rb') as chat_file, mmap.mmap(chat_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        text = mapped[start:end].decode('utf-8')
+    yield from io.StringIO(text, newline=None)
+
+
+def shard_events(path, start, end, taxonomy):
+    """
+    在子行程中解析一段聊天記錄，回傳 (事件字典, 行數)。
+    事件字典為一般的 dict (日期 -> 事件類型 -> 事件描述清單)，可以傳回主行程。
+    """
+    clean_stage = load_stage(1)
+    line_count = 0
+
+    def counted(lines):
+        nonlocal line_count
+        for line in lines:
+            line_count += 1
+            yield line
+
+    events_by_date = clean_stage.collect_events(
+        clean_stage.iter_events(counted(read_shard(path, start, end)), taxonomy))
+    return {date: dict(event_types) for date, event_types in events_by_date.items()}, line_count
+
+
+def iter_shard_events(paths, taxonomy, jobs, shard_bytes):
+    """
+    將多個聊天記錄檔案切段後交給 jobs 個行程解析，依檔案與位置的順序產出各段的 (事件字典, 行數)。
+    子行程只收到檔案路徑與位元組範圍，各自映射檔案讀取，不需要經由主行程複製內容。
+    """
+    shards = [(path, start, end) for path in paths for start, end in plan_shards(path, shard_bytes)]
+    if not shards:
+        return
+    with ProcessPoolExecutor(max_workers=min(jobs, len(shards))) as pool:
+        futures = [pool.submit(shard_events, path, start, end, taxonomy) for path, start, end in shards]
+        for future in futures:
+            yield future.result()
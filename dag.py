@@ -0,0 +1,96 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import NamedTuple
+
+
+class Node(NamedTuple):
+    """DAG 中的一個節點：名稱、執行的函式與相依的節點名稱。"""
+    name: str
+    func: object
+    deps: tuple
+
+
+class NodeTiming(NamedTuple):
+    """節點的開始與結束時間 (相對於整個 DAG 開始執行的秒數)。"""
+    start: float
+    end: float
+
+    @property
+    def elapsed(self):
+        return self.end - self.start
+
+
+class DagRunner:
+    """
+    在同一個行程中執行有相依關係的函式。
+    每個節點在相依的節點都完成後才開始，並以相依節點的回傳值 (依 deps 的順序) 作為參數，
+    沒有相依關係的分支會在執行緒池中同時執行，結果直接在記憶體中傳遞，不需要經過中間檔案。
+    """
+
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self.nodes = {}
+        self.results = {}
+        self.timings = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, func, deps=()):
+        """加入節點，相依的節點必須先加入，因此不會形成循環。"""
+        missing = [dep for dep in deps if dep not in self.nodes]
+        if missing:
+            raise ValueError(f"節點 {name} 相依的節點尚未加入：{', '.join(missing)}")
+        if name in self.nodes:
+            raise ValueError(f"節點名稱重複：{name}")
+        self.nodes[name] = Node(name, func, tuple(deps))
+        return name
+
+    def run(self):
+        """執行所有節點並回傳 {節點名稱: 回傳值}；任一節點失敗時，等待執行中的節點結束後拋出例外。"""
+        started = time.perf_counter()
+
+        def call(node):
+            node_start = time.perf_counter() - started
+            try:
+                return node.func(*(self.results[dep] for dep in node.deps))
+            finally:
+                with self._lock:
+                    self.timings[node.name] = NodeTiming(node_start, time.perf_counter() - started)
+
+        pending = dict(self.nodes)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                for name, node in list(pending.items()):
+                    if all(dep in self.results for dep in node.deps):
+                        running[executor.submit(call, node)] = name
+                        del pending[name]
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    error = future.exception()
+                    if error is not None:
+                        wait(running)
+                        raise error
+                    self.results[name] = future.result()
+        self.wall_time = time.perf_counter() - started
+        return self.results
+
+    def critical_path(self):
+        """回傳 (關鍵路徑的總秒數, [節點名稱, ...])：依各節點實際耗時計算最長的相依路徑。"""
+        longest = {}
+        for name, node in self.nodes.items():  # 加入順序即為拓撲順序
+            elapsed = self.timings[name].elapsed
+            best = max((longest[dep] for dep in node.deps), key=lambda path: path[0], default=(0.0, []))
+            longest[name] = (best[0] + elapsed, best[1] + [name])
+        return max(longest.values(), key=lambda path: path[0], default=(0.0, []))
+
+    def report(self):
+        """回傳各節點的開始時間與耗時、總耗時與關鍵路徑。"""
+        lines = [f"  {name:<24} 開始 {timing.start:7.2f} 秒，耗時 {timing.elapsed:7.2f} 秒"
+                 for name, timing in sorted(self.timings.items(), key=lambda item: item[1].start)]
+        total = sum(timing.elapsed for timing in self.timings.values())
+        critical_time, critical_nodes = self.critical_path()
+        lines.append(f"實際耗時 {self.wall_time:.2f} 秒 (各階段合計 {total:.2f} 秒)，"
+                     f"關鍵路徑 {critical_time:.2f} 秒：{' → '.join(critical_nodes)}")
+        return '\n'.join(lines)
@@ -0,0 +1,316 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from event_store import parse_event_dates
+from milepost import EARTH_RADIUS_METERS, MilepostLocator
+from place_names import normalize_place_name
+from stages import load_stage
+
+# 空間格網每一格的大小 (度)，約 1 公里
+GRID_CELL_DEGREES = 0.01
+
+# 查詢結果的欄位，半徑查詢另外加上與中心的距離
+RESULT_COLUMNS = ['日期', '事件類型', '地點', '額外說明', '地名', '建議地名', '緯度', '經度']
+DISTANCE_COLUMN = '距離(公里)'
+COUNT_COLUMNS = ['地名', '建議地名', '緯度', '經度', '事件數']
+
+KM_PER_DEGREE = np.pi / 180 * EARTH_RADIUS_METERS / 1000
+
+
+def parse_bound(value, upper=False):
+    """
+    將查詢的日期轉為時間。文字依寫到的精確度表示整段期間：'2023-06' 為整個六月，'2023' 為整年；
+    upper 為 True 時取期間的最後一刻，因此 end='2023-09' 包含九月的事件。
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        period = pd.Period(value.replace('/', '-'))
+        return period.end_time if upper else period.start_time
+    return pd.Timestamp(value)
+
+
+def haversine_km(latitudes, longitudes, latitude, longitude):
+    """多個點與一點之間的大圓距離 (公里)。"""
+    latitudes, longitudes = np.radians(latitudes), np.radians(longitudes)
+    latitude, longitude = np.radians(latitude), np.radians(longitude)
+    a = (np.sin((latitudes - latitude) / 2) ** 2
+         + np.cos(latitudes) * np.cos(latitude) * np.sin((longitudes - longitude) / 2) ** 2)
+    return 2 * EARTH_RADIUS_METERS / 1000 * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class EventIndex:
+    """
+    事件的時間與空間索引。每個事件的每個地點為一筆 (與 06 階段相同，'地點'欄位中以分號分隔的地點分別列出)。
+    所有筆依日期排序，日期範圍以二分搜尋取得連續的區段；有座標的筆另外依所在的格子 (GRID_CELL_DEGREES 度)
+    排序，範圍與半徑查詢只檢查與範圍重疊的格子中的筆。地點資料庫中沒有座標的地點只能以日期、事件類型與地名查詢；
+    日期無法辨識的事件只在沒有指定日期範圍時列出。
+    """
+
+    def __init__(self, entries, cell_degrees=GRID_CELL_DEGREES):
+        dates = parse_event_dates(entries['日期']).to_numpy(dtype='datetime64[ns]')
+        # 日期無法辨識 (NaT) 的筆排在最後
+        order = np.argsort(dates, kind='stable')
+        self.entries = entries.iloc[order].reset_index(drop=True)
+        self.dates = dates[order]
+        self.latitudes = pd.to_numeric(self.entries['緯度'], errors='coerce').to_numpy(dtype=float)
+        self.longitudes = pd.to_numeric(self.entries['經度'], errors='coerce').to_numpy(dtype=float)
+        self.event_types = pd.Categorical(self.entries['事件類型'])
+        self.names = pd.Categorical(self.entries['地名'])
+        # 不重複的地名先正規化，地名查詢時只需比對這些地名
+        self.normalized_names = [normalize_place_name(name) for name in self.names.categories]
+        # 每個地名第一筆的位置，依地點統計時取其建議地名與座標
+        self.first_rows = pd.Series(np.arange(len(self.entries))).groupby(self.names.codes).first().to_numpy()
+        self.dated = len(self.dates) - int(np.isnat(self.dates).sum())
+        self.cell_degrees = cell_degrees
+        self._build_grid()
+
+    @classmethod
+    def from_files(cls, event_file, database_file, milepost_locator=None, cell_degrees=GRID_CELL_DEGREES):
+        """由事件日誌 (CSV 或事件儲存檔 .parquet) 與地點資料庫建立索引，合併方式與 06 階段相同。"""
+        export_stage = load_stage(6)
+        events = export_stage.load_events(event_file)
+        place_data = export_stage.load_place_data(database_file)
+        entries = export_stage.join_places(events, place_data, milepost_locator, keep_unmatched=True)
+        return cls(entries, cell_degrees)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _build_grid(self):
+        """將有座標的筆依格子排序；每個格子的筆在 _cell_rows 中是連續的區段 (_cell_starts)。"""
+        located = np.flatnonzero(~np.isnan(self.latitudes) & ~np.isnan(self.longitudes))
+        cell_y = np.floor(self.latitudes[located] / self.cell_degrees).astype(np.int64)
+        cell_x = np.floor(self.longitudes[located] / self.cell_degrees).astype(np.int64)
+        order = np.lexsort((cell_x, cell_y))
+        self._cell_rows = located[order]
+        cell_y, cell_x = cell_y[order], cell_x[order]
+        boundaries = np.flatnonzero((np.diff(cell_y) != 0) | (np.diff(cell_x) != 0)) + 1
+        first = np.concatenate([[0], boundaries]).astype(np.int64) if len(located) else np.empty(0, np.int64)
+        self._cell_y = cell_y[first]
+        self._cell_x = cell_x[first]
+        self._cell_starts = np.append(first, len(located))
+
+    def _date_range(self, start, end):
+        """日期範圍內的筆在排序後的位置區段 [low, high)。"""
+        low, high = 0, len(self.dates)
+        start, end = parse_bound(start), parse_bound(end, upper=True)
+        if start is not None:
+            low = int(np.searchsorted(self.dates, np.datetime64(start, 'ns'), side='left'))
+        if end is not None:
+            high = int(np.searchsorted(self.dates, np.datetime64(end, 'ns'), side='right'))
+        if start is not None or end is not None:
+            # 指定日期範圍時不列出日期無法辨識的筆
+            high = min(high, self.dated)
+        return low, max(low, high)
+
+    def _bbox_rows(self, south, west, north, east):
+        """座標在範圍內的筆的位置 (依日期排序後的位置，未排序)。"""
+        cells = ((self._cell_y >= np.floor(south / self.cell_degrees))
+                 & (self._cell_y <= np.floor(north / self.cell_degrees))
+                 & (self._cell_x >= np.floor(west / self.cell_degrees))
+                 & (self._cell_x <= np.floor(east / self.cell_degrees)))
+        starts = self._cell_starts[:-1][cells]
+        lengths = self._cell_starts[1:][cells] - starts
+        total = int(lengths.sum())
+        if total == 0:
+            return np.empty(0, dtype=np.int64)
+        # 將多個連續區段展開為位置：每個區段的起點重複區段長度次，再加上區段內的偏移
+        offsets = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        rows = self._cell_rows[np.repeat(starts, lengths) + offsets]
+        latitudes, longitudes = self.latitudes[rows], self.longitudes[rows]
+        return rows[(latitudes >= south) & (latitudes <= north) & (longitudes >= west) & (longitudes <= east)]
+
+    def _radius_rows(self, latitude, longitude, radius_km):
+        """與中心距離在 radius_km 公里內的筆的位置與距離。"""
+        latitude_span = radius_km / KM_PER_DEGREE
+        longitude_span = latitude_span / max(np.cos(np.radians(latitude)), 1e-6)
+        rows = self._bbox_rows(latitude - latitude_span, longitude - longitude_span,
+                               latitude + latitude_span, longitude + longitude_span)
+        distances = haversine_km(self.latitudes[rows], self.longitudes[rows], latitude, longitude)
+        within = distances <= radius_km
+        return rows[within], distances[within]
+
+    def _matching_rows(self, start=None, end=None, event_types=None, place=None, bbox=None, center=None,
+                       radius_km=None):
+        """符合條件的筆的位置 (依日期排序)，以及半徑查詢時與中心的距離。"""
+        low, high = self._date_range(start, end)
+        distances = None
+        if center is not None:
+            if radius_km is None:
+                raise ValueError("半徑查詢需要指定 radius_km")
+            rows, distances = self._radius_rows(*center, radius_km)
+            if bbox is not None:
+                south, west, north, east = bbox
+                inside = ((self.latitudes[rows] >= south) & (self.latitudes[rows] <= north)
+                          & (self.longitudes[rows] >= west) & (self.longitudes[rows] <= east))
+                rows, distances = rows[inside], distances[inside]
+        elif bbox is not None:
+            rows = self._bbox_rows(*bbox)
+        else:
+            rows = np.arange(low, high)
+        if center is not None or bbox is not None:
+            in_range = (rows >= low) & (rows < high)
+            rows = rows[in_range]
+            order = np.argsort(rows, kind='stable')
+            rows = rows[order]
+            if distances is not None:
+                distances = distances[in_range][order]
+
+        keep = np.ones(len(rows), dtype=bool)
+        if event_types:
+            codes = self.event_types.categories.get_indexer(list(event_types))
+            keep &= np.isin(self.event_types.codes[rows], codes[codes >= 0])
+        if place:
+            # 以正規化後的地名比對 (全形半形、臺/台等寫法不同也能找到)，只需比對不重複的地名
+            key = normalize_place_name(place)
+            matches = [index for index, name in enumerate(self.normalized_names) if key in name]
+            keep &= np.isin(self.names.codes[rows], matches)
+        rows = rows[keep]
+        if distances is not None:
+            distances = distances[keep]
+        return rows, distances
+
+    def query(self, start=None, end=None, event_types=None, place=None, bbox=None, center=None, radius_km=None):
+        """
+        查詢事件，回傳依日期排序的表格 (RESULT_COLUMNS)。條件皆可省略，同時指定時須全部符合：
+        start、end 為日期範圍 (包含兩端，例如 '2023-06'、'2023-09')；event_types 為事件類型清單；
+        place 為地名中包含的文字 (例如 '台7線')；bbox 為 (南, 西, 北, 東) 的經緯度範圍；
+        center 與 radius_km 為 (緯度, 經度) 與半徑 (公里)，結果加上與中心的距離。
+        多地點的事件在每個符合的地點各列一次。
+        """
+        rows, distances = self._matching_rows(start, end, event_types, place, bbox, center, radius_km)
+        result = self.entries.iloc[rows][RESULT_COLUMNS].reset_index(drop=True)
+        if distances is not None:
+            result[DISTANCE_COLUMN] = distances.round(3)
+        return result
+
+    def count(self, **conditions):
+        """符合條件的筆數 (條件與 query 相同)，不需要建立結果表格。"""
+        return len(self._matching_rows(**conditions)[0])
+
+    def count_by_place(self, **conditions):
+        """依地點統計符合條件的事件數，依事件數由多到少排序 (條件與 query 相同)。"""
+        rows, _ = self._matching_rows(**conditions)
+        counts = np.bincount(self.names.codes[rows], minlength=len(self.names.categories))
+        present = np.flatnonzero(counts)
+        first = self.first_rows[present]
+        result = pd.DataFrame({
+            '地名': self.names.categories[present],
+            '建議地名': self.entries['建議地名'].to_numpy()[first],
+            '緯度': self.entries['緯度'].to_numpy()[first],
+            '經度': self.entries['經度'].to_numpy()[first],
+            '事件數': counts[present],
+        }, columns=COUNT_COLUMNS)
+        return result.sort_values(['事件數', '地名'], ascending=[False, True], kind='stable').reset_index(drop=True)
+
+    def place_location(self, name):
+        """取得地名的座標 (緯度, 經度)，先找完全相同的地名，再以正規化後的地名比對；找不到時回傳 None。"""
+        names = self.entries['地名'].to_numpy()
+        located = ~np.isnan(self.latitudes)
+        key = normalize_place_name(name)
+        similar = [other for other, normalized in zip(self.names.categories, self.normalized_names) if normalized == key]
+        for candidates in (names == name, np.isin(names, similar)):
+            rows = np.flatnonzero(candidates & located)
+            if len(rows):
+                return float(self.latitudes[rows[0]]), float(self.longitudes[rows[0]])
+        return None
+
+
+class CustomArgumentParser(argparse.ArgumentParser):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+    def print_help(self, file=None):
+        # 自訂顯示的幫助訊息
+        help_message = f"""使用方法: {self.prog} [-h] -I 輸入檔案 -D 地名數據庫檔案 [--start 開始日期] [--end 結束日期]
+                [--type 事件類型 ...] [--place 地名] [--bbox 南 西 北 東]
+                [--near 緯度 經度 | --near-place 地名] [--radius 公里] [--counts] [-O 輸出檔案] [--limit 列數]
+                [--mileposts 里程樁檔案 [--road 道路]]
+
+依日期、事件類型、地名與位置查詢事件日誌中的事件，不需要重新執行 06、07 階段
+
+選項:
+  -h, --help            顯示此幫助訊息並退出
+  -I INPUT, --input INPUT
+                        輸入檔案 (事件日誌 CSV 或事件儲存檔 .parquet)
+  -D DATABASE, --database DATABASE
+                        地名數據庫檔案
+  --start START         開始日期，包含當天 (例如 2023-06-01；2023-06 表示從六月開始)
+  --end END             結束日期，包含當天 (例如 2023-09-30；2023-09 表示到九月底)
+  --type TYPE [TYPE ...]
+                        事件類型 (例如 落石 坍方)
+  --place PLACE         地名中包含的文字 (例如 台7線)
+  --bbox SOUTH WEST NORTH EAST
+                        經緯度範圍 (南 西 北 東)
+  --near LATITUDE LONGITUDE
+                        半徑查詢的中心座標
+  --near-place NAME     半徑查詢的中心地名 (使用地名數據庫中的座標)
+  --radius RADIUS       半徑 (公里)，預設為 5
+  --counts              依地點統計事件數，不列出事件
+  -O OUTPUT, --output OUTPUT
+                        將結果存為 CSV 檔案，未指定時顯示於螢幕
+  --limit LIMIT         顯示於螢幕的最大列數，預設為 20
+  --mileposts MILEPOSTS
+                        道路折線與里程樁的 GeoJSON 檔案，資料庫中沒有的里程樁號 (例如「台7線24k」) 沿道路內插座標
+  --road ROAD           只寫樁號的地點 (例如「28.7K」) 所在的道路 (例如「台7線」)
+        """
+        print(help_message, file=file)
+
+
+def main(argv=None):
+    """主函數，負責解析命令行參數、建立索引並執行查詢"""
+    parser = CustomArgumentParser(description="查詢事件日誌中的事件")
+    parser.add_argument('-I', '--input', required=True, help="輸入檔案")
+    parser.add_argument('-D', '--database', required=True, help="地名數據庫檔案")
+    parser.add_argument('--start', help="開始日期")
+    parser.add_argument('--end', help="結束日期")
+    parser.add_argument('--type', nargs='+', dest='event_types', help="事件類型")
+    parser.add_argument('--place', help="地名中包含的文字")
+    parser.add_argument('--bbox', nargs=4, type=float, metavar=('SOUTH', 'WEST', 'NORTH', 'EAST'), help="經緯度範圍")
+    near = parser.add_mutually_exclusive_group()
+    near.add_argument('--near', nargs=2, type=float, metavar=('LATITUDE', 'LONGITUDE'), help="半徑查詢的中心座標")
+    near.add_argument('--near-place', help="半徑查詢的中心地名")
+    parser.add_argument('--radius', type=float, default=5.0, help="半徑 (公里)")
+    parser.add_argument('--counts', action='store_true', help="依地點統計事件數")
+    parser.add_argument('-O', '--output', help="輸出檔案")
+    parser.add_argument('--limit', type=int, default=20, help="顯示於螢幕的最大列數")
+    parser.add_argument('--mileposts', help="道路折線與里程樁的 GeoJSON 檔案")
+    parser.add_argument('--road', help="只寫樁號的地點所在的道路")
+
+    args = parser.parse_args(argv)
+    for option, value in (('--start', args.start), ('--end', args.end)):
+        try:
+            parse_bound(value)
+        except ValueError:
+            parser.error(f"{option} 的日期格式錯誤：{value} (例如 2023-06-01、2023-06 或 2023)")
+
+    started = time.perf_counter()
+    milepost_locator = MilepostLocator.from_geojson(args.mileposts, args.road) if args.mileposts else None
+    index = EventIndex.from_files(args.input, args.database, milepost_locator)
+    print(f"已建立索引：{len(index)} 筆事件地點，耗時 {time.perf_counter() - started:.2f} 秒")
+
+    center = tuple(args.near) if args.near else None
+    if args.near_place:
+        center = index.place_location(args.near_place)
+        if center is None:
+            parser.error(f"地名數據庫中沒有「{args.near_place}」的座標")
+    conditions = {'start': args.start, 'end': args.end, 'event_types': args.event_types, 'place': args.place,
+                  'bbox': args.bbox, 'center': center, 'radius_km': args.radius if center else None}
+
+    started = time.perf_counter()
+    result = index.count_by_place(**conditions) if args.counts else index.query(**conditions)
+    elapsed = time.perf_counter() - started
+    if args.output:
+        result.to_csv(args.output, index=False, encoding='utf-8')
+    else:
+        print(result.head(args.limit).to_string(index=False))
+    unit = '個地點' if args.counts else '筆'
+    print(f"查詢結果 {len(result)} {unit}，耗時 {elapsed * 1000:.1f} 毫秒" + (f"，已存至 {args.output}" if args.output else ''))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import copy
+import csv
+import datetime
+import json
+import re
+
+from prompt_builder import CSV_HEADER, normalize_date
+
+# 事件日誌的欄位，與 CSV 表頭的順序相同
+EVENT_FIELDS = CSV_HEADER.split(',')
+
+# 結構化輸出的 JSON schema：{"events": [{"日期": ..., "事件類型": ..., "地點": ..., "額外說明": ...}, ...]}
+EVENT_JSON_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "events": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {field: {"type": "string"} for field in EVENT_FIELDS},
+                "required": EVENT_FIELDS,
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["events"],
+    "additionalProperties": False,
+}
+
+# 附加在系統指令後的輸出格式說明，對話歷史中的範例也會改為相同的 JSON 格式
+STRUCTURED_INSTRUCTION = (
+    '\n輸出格式：以 JSON 輸出 {"events": [{"日期": "YYYY-MM-DD", "事件類型": "", "地點": "", "額外說明": ""}]}，'
+    '每個事件一個物件，多個地點或說明以分號分隔，不要輸出其他文字。\n')
+
+# 模型有時會將 JSON 包在 Markdown 程式碼區塊中，例如 ```json ... ```
+JSON_FENCE_PATTERN = re.compile(r'^\s*```(?:json)?\s*(.*?)\s*```\s*$', re.DOTALL)
+
+
+def structured_output_enabled(system_config):
+    """系統設定檔中的 structured_output 未指定時，預設使用供應商的結構化輸出模式。"""
+    return bool(system_config.get("structured_output", True))
+
+
+def openai_response_format():
+    """OpenAI 的 Structured Outputs (json_schema, strict)。"""
+    return {"type": "json_schema",
+            "json_schema": {"name": "event_log", "strict": True, "schema": EVENT_JSON_SCHEMA}}
+
+
+def google_response_schema():
+    """Gemini 的 response_schema 不支援 additionalProperties，其餘與 EVENT_JSON_SCHEMA 相同。"""
+    schema = copy.deepcopy(EVENT_JSON_SCHEMA)
+    del schema["additionalProperties"]
+    del schema["properties"]["events"]["items"]["additionalProperties"]
+    return schema
+
+
+def csv_fields(line):
+    """將一列 CSV 分為四個欄位，額外說明中未加引號的逗號併回同一欄；欄位不足時回傳 None。"""
+    fields = next(csv.reader([line]), [])
+    if len(fields) < len(EVENT_FIELDS):
+        return None
+    return fields[:3] + [','.join(fields[3:])]
+
+
+def rows_to_json(lines):
+    """將事件日誌的 CSV 資料列轉為結構化輸出的 JSON 文字，用於對話歷史中的範例。"""
+    events = [dict(zip(EVENT_FIELDS, fields)) for fields in map(csv_fields, lines) if fields is not None]
+    return json.dumps({"events": events}, ensure_ascii=False)
+
+
+def validate_event(fields, dates=None, event_types=None):
+    """
+    嚴格驗證一個事件的四個欄位，回傳 (資料列, 錯誤訊息)，兩者之一為 None。
+    - 每個欄位都必須是文字且不能換行 (否則寫入 CSV 後會變成多列)；
+    - 日期必須是存在的日期，統一為 YYYY-MM-DD，提供 dates 時必須是輸入摘要中的日期；
+    - 事件類型不能空白，提供 event_types 時必須是輸入摘要中的事件類型；
+    - 地點與額外說明可以空白。
+    """
+    if len(fields) != len(EVENT_FIELDS):
+        return None, f"欄位數 {len(fields)} 不是 {len(EVENT_FIELDS)}"
+    for field, value in zip(EVENT_FIELDS, fields):
+        if not isinstance(value, str):
+            return None, f"{field} 不是文字：{value!r}"
+        if '\n' in value or '\r' in value:
+            return None, f"{field} 包含換行：{value!r}"
+    event_date, event_type, location, additional_info = (value.strip() for value in fields)
+    normalized = normalize_date(event_date)
+    if normalized is None:
+        return None, f"日期格式不符：{event_date!r}"
+    try:
+        datetime.date.fromisoformat(normalized)
+    except ValueError:
+        return None, f"日期不存在：{event_date!r}"
+    if dates and normalized not in dates:
+        return None, f"日期 {normalized} 不在輸入的摘要中"
+    if not event_type:
+        return None, "事件類型空白"
+    if event_types and event_type not in event_types:
+        return None, f"事件類型 {event_type!r} 不在輸入的摘要中"
+    return [normalized, event_type, location, additional_info], None
+
+
+def parse_json_events(text, dates=None, event_types=None):
+    """
+    解析並驗證結構化輸出的回應，回傳 (資料列, 錯誤訊息)。
+    回應不是 {"events": [...]} 的 JSON 時沒有資料列；個別事件不符時只略過該事件並記錄錯誤。
+    """
+    match = JSON_FENCE_PATTERN.match(text)
+    try:
+        document = json.loads(match.group(1) if match else text)
+    except json.JSONDecodeError as error:
+        return [], [f"不是有效的 JSON：{error}"]
+    if not isinstance(document, dict) or set(document) != {"events"} or not isinstance(document["events"], list):
+        return [], ['回應的格式不是 {"events": [...]}']
+
+    rows, errors = [], []
+    for index, event in enumerate(document["events"]):
+        if not isinstance(event, dict) or set(event) != set(EVENT_FIELDS):
+            errors.append(f"第 {index + 1} 個事件的欄位不符：{event!r}")
+            continue
+        row, error = validate_event([event[field] for field in EVENT_FIELDS], dates, event_types)
+        if error:
+            errors.append(f"第 {index + 1} 個事件：{error}")
+        else:
+            rows.append(row)
+    return rows, errors
@@ -0,0 +1,122 @@
+import csv
+import os
+
+from lazy_modules import lazy_module, module_available
+
+# 只讀取 CSV 的路徑 (例如 04 階段) 不需要載入 pandas 與 pyarrow
+np = lazy_module('numpy')
+pd = lazy_module('pandas')
+if module_available('pyarrow'):
+    pa = lazy_module('pyarrow')
+    pc = lazy_module('pyarrow.compute')
+    pq = lazy_module('pyarrow.parquet')
+else:  # 未安裝 pyarrow 時不寫入儲存檔，各階段照常讀取 CSV
+    pa = pc = pq = None
+
+# 事件日誌的欄位
+EVENT_COLUMNS = ['日期', '事件類型', '地點', '額外說明']
+
+# 事件儲存檔的副檔名，各階段以副檔名判斷輸入是儲存檔還是 CSV
+EVENT_STORE_SUFFIX = '.parquet'
+
+# 儲存檔的中繼資料中記錄來源事件日誌的雜湊，用於判斷儲存檔是否為最新
+SOURCE_HASH_KEY = b'source_hash'
+
+
+def store_available():
+    """是否能讀寫事件儲存檔 (需要 pyarrow)。"""
+    return pa is not None
+
+
+def is_event_store(path):
+    return str(path).endswith(EVENT_STORE_SUFFIX)
+
+
+def parse_event_dates(dates):
+    """將日期文字 (2024-11-08 或 2024/11/08) 轉為日期時間，無法辨識的為 NaT。"""
+    return pd.to_datetime(dates.astype(str).str.replace('/', '-', regex=False), errors='coerce', format='%Y-%m-%d')
+
+
+def explode_places(locations):
+    """
+    將'地點'欄位以分號分割 (與 04 階段相同)，回傳以事件位置為索引、每個地點一列的地名；
+    同一事件中重複的地點只保留一次。只有包含分號的列需要展開，其餘的列直接去除空白。
+    """
+    multiple = locations.str.contains(';', regex=False)
+    exploded = locations[multiple].str.split(';').explode().str.strip()
+    exploded = exploded[~pd.MultiIndex.from_arrays([exploded.index, exploded.to_numpy()]).duplicated()]
+    names = pd.concat([locations[~multiple].str.strip(), exploded]).sort_index(kind='stable')
+    return names[names != '']
+
+
+def place_lists(locations):
+    """將'地點'欄位轉為地點清單 (Arrow list<string>)，內容與 explode_places 相同。"""
+    locations = pd.Series(locations, dtype=object).reset_index(drop=True)
+    names = explode_places(locations)
+    counts = np.bincount(names.index.to_numpy(), minlength=len(locations))
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int32)
+    return pa.ListArray.from_arrays(pa.array(offsets), pa.array(names.to_numpy(), type=pa.string()))
+
+
+def event_frame(rows):
+    """
+    將事件日誌的資料列 (CSV 文字，不含表頭) 轉為事件表格。欄位不足的資料列補上空白，
+    額外說明中未加引號的逗號之後的內容與 06 階段相同，不列入欄位。
+    """
+    records = [(fields + [''] * len(EVENT_COLUMNS))[:len(EVENT_COLUMNS)]
+               for fields in (next(csv.reader([row]), []) for row in rows)]
+    return pd.DataFrame(records, columns=EVENT_COLUMNS)
+
+
+def write_event_store(path, events, source_hash=None):
+    """
+    將事件表格寫入 Parquet 儲存檔：日期文字、日期值 (timestamp)、事件類型 (dictionary)、地點、
+    地點清單 (list<string>) 與額外說明。日期文字保留，06 階段的描述與輸出檔案的內容不變。
+    source_hash 記錄在中繼資料中，先寫入暫存檔再取代，讀取中的其他階段不會讀到不完整的檔案。
+    """
+    events = events[EVENT_COLUMNS].fillna('').astype(str)
+    table = pa.table({
+        '日期': pa.array(events['日期'], type=pa.string()),
+        '日期值': pa.array(parse_event_dates(events['日期'])),
+        '事件類型': pa.array(events['事件類型'], type=pa.string()).dictionary_encode(),
+        '地點': pa.array(events['地點'], type=pa.string()),
+        '地點清單': place_lists(events['地點']),
+        '額外說明': pa.array(events['額外說明'], type=pa.string()),
+    })
+    if source_hash is not None:
+        table = table.replace_schema_metadata({SOURCE_HASH_KEY: source_hash.encode()})
+    temporary_path = f"{path}.tmp"
+    pq.write_table(table, temporary_path, compression='zstd')
+    os.replace(temporary_path, path)
+
+
+def store_source_hash(path):
+    """讀取儲存檔中記錄的來源雜湊，無法讀取或沒有記錄時回傳 None。"""
+    if pa is None or not os.path.exists(path):
+        return None
+    value = (pq.read_schema(path).metadata or {}).get(SOURCE_HASH_KEY)
+    return value.decode() if value is not None else None
+
+
+def arrow_types(data_type):
+    """字串與清單欄位保留為 Arrow 陣列 (不轉換為 Python 物件)，其餘使用 pandas 原生的型別。"""
+    if pa.types.is_string(data_type) or pa.types.is_list(data_type):
+        return pd.ArrowDtype(data_type)
+    return None
+
+
+def read_event_store(path, columns=None):
+    """
+    以記憶體映射讀取事件儲存檔，回傳 DataFrame。事件類型為 category，日期值為 datetime64；
+    字串與地點清單欄位直接使用 Arrow 的緩衝區，不需要逐列建立 Python 字串。
+    """
+    table = pq.read_table(path, columns=columns, memory_map=True)
+    return table.to_pandas(types_mapper=arrow_types)
+
+
+def place_list_entries(place_list_column):
+    """將地點清單欄位 (read_event_store 讀入的 Arrow 清單) 展開，回傳以列位置為索引的地名，與 explode_places 相同。"""
+    lists = pa.array(place_list_column.array)
+    positions = pc.list_parent_indices(lists).to_numpy()
+    names = pc.list_flatten(lists).to_numpy(zero_copy_only=False)
+    return pd.Series(names, index=positions.astype(np.int64), dtype=object)
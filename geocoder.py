@@ -0,0 +1,218 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import NamedTuple
+
+from rate_limit import RateLimiter
+
+
+class GeocodeResult(NamedTuple):
+    """一次地點查詢的結果；查無建議地名時 suggestion 為 None，查無座標時經緯度為 None。"""
+    query: str
+    suggestion: object
+    latitude: object
+    longitude: object
+
+
+def normalize_query(query):
+    """將查詢字串的空白統一，前綴與地名之間多餘的空白不會造成重複查詢。"""
+    return ' '.join(query.split())
+
+
+class NegativeCache:
+    """
+    以 SQLite 記錄查無建議地名的查詢字串。
+    這些查詢不會寫入地點資料庫，若不另外記錄，每次執行都會再查詢一次；
+    保存期限 (ttl_days) 內不再查詢，過期後重新查詢，以便 Google Maps 新增地點後能查到。
+    """
+
+    def __init__(self, path, ttl_days=30):
+        self.path = path
+        self.ttl_seconds = ttl_days * 24 * 60 * 60
+        self._lock = threading.Lock()
+        # 查詢在多個執行緒中完成，因此共用連線並以鎖保護
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS negative_results (
+                query TEXT PRIMARY KEY,
+                checked_at REAL NOT NULL
+            )
+        """)
+        self._connection.commit()
+
+    def __contains__(self, query):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT checked_at FROM negative_results WHERE query = ?", (query,)).fetchone()
+        return row is not None and time.time() - row[0] <= self.ttl_seconds
+
+    def add(self, query):
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO negative_results (query, checked_at) VALUES (?, ?)",
+                (query, time.time()))
+            self._connection.commit()
+
+    def close(self):
+        """移除過期的記錄並關閉資料庫連線。"""
+        with self._lock:
+            self._connection.execute("DELETE FROM negative_results WHERE checked_at < ?",
+                                     (time.time() - self.ttl_seconds,))
+            self._connection.commit()
+            self._connection.close()
+
+
+class Geocoder:
+    """
+    同時查詢多個地點的建議地名與座標 (Google Place Autocomplete 加上 Geocoding)。
+
+    - 以有上限的執行緒池同時查詢，並以權杖桶限制每秒的 API 呼叫次數。
+    - 相同的查詢字串 (正規化後) 只會查詢一次，查詢中或已完成的查詢都會共用同一個結果。
+    - 查無建議地名的查詢記錄在 NegativeCache，保存期限內不再查詢。
+    - 統計實際的 API 呼叫次數與快取、合併查詢所節省的次數。
+    """
+
+    def __init__(self, client, max_workers=4, queries_per_second=10, negative_cache=None):
+        self.client = client
+        self.negative_cache = negative_cache
+        # 額度上限為 1，呼叫平均分散，任一秒內都不會超過每秒的上限
+        self.rate_limiter = (RateLimiter(requests_per_minute=queries_per_second * 60, burst=1)
+                             if queries_per_second else None)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+        self._futures = {}
+        self._calls_by_query = {}
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.api_calls = 0
+        self.coalesced = []
+        self.negative_hits = 0
+        self.not_found = 0
+        # 各 API (places_autocomplete、geocode) 每次呼叫的延遲 (秒)，不含速率限制的等待
+        self.latencies = {}
+
+    def _call(self, query, method, *args):
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        with self._lock:
+            self.api_calls += 1
+            self._calls_by_query[query] = self._calls_by_query.get(query, 0) + 1
+        start = time.perf_counter()
+        try:
+            return getattr(self.client, method)(*args)
+        finally:
+            with self._lock:
+                self.latencies.setdefault(method, []).append(time.perf_counter() - start)
+
+    def _resolve(self, query):
+        suggestions = self._call(query, 'places_autocomplete', query)
+        if not suggestions:
+            with self._lock:
+                self.not_found += 1
+            if self.negative_cache is not None:
+                self.negative_cache.add(query)
+            return GeocodeResult(query, None, None, None)
+
+        suggestion = suggestions[0]['description']
+        geocode_result = self._call(query, 'geocode', suggestion)
+        if geocode_result:
+            location = geocode_result[0]['geometry']['location']
+            return GeocodeResult(query, suggestion, location['lat'], location['lng'])
+        return GeocodeResult(query, suggestion, None, None)
+
+    def submit(self, query):
+        """送出查詢並回傳 Future，相同的查詢字串共用同一個 Future。"""
+        query = normalize_query(query)
+        with self._lock:
+            self.lookups += 1
+            future = self._futures.get(query)
+            if future is not None:
+                self.coalesced.append(query)
+                return future
+            if self.negative_cache is not None and query in self.negative_cache:
+                self.negative_hits += 1
+                future = Future()
+                future.set_result(GeocodeResult(query, None, None, None))
+            else:
+                future = self._executor.submit(self._resolve, query)
+            self._futures[query] = future
+            return future
+
+    def geocode(self, query):
+        """查詢單一地點，等待結果。"""
+        return self.submit(query).result()
+
+    def geocode_many(self, queries):
+        """同時查詢多個地點，回傳 {查詢字串: GeocodeResult}。"""
+        futures = {query: self.submit(query) for query in queries}
+        return {query: future.result() for query, future in futures.items()}
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        if self.negative_cache is not None:
+            self.negative_cache.close()
+
+    def calls_saved(self):
+        """合併查詢與查無結果快取所節省的 API 呼叫次數 (查無結果只需一次呼叫)。"""
+        with self._lock:
+            return (sum(self._calls_by_query.get(query, 0) for query in self.coalesced)
+                    + self.negative_hits)
+
+    def report(self):
+        """回傳本次執行的查詢統計。"""
+        return (f"地點查詢 {self.lookups} 次：API 呼叫 {self.api_calls} 次，查無建議地名 {self.not_found} 次；"
+                f"合併重複查詢 {len(self.coalesced)} 次、查無結果快取命中 {self.negative_hits} 次，"
+                f"節省 {self.calls_saved()} 次 API 呼叫")
+
+
+class FakeMapsClient:
+    """
+    不連線的 googlemaps.Client 替身，用於離線測試同時查詢、合併查詢與速率限制。
+    每次呼叫等待 latency 秒；依查詢字串的雜湊決定是否查無結果 (比例為 miss_rate)，座標也由雜湊產生。
+    記錄呼叫次數、呼叫時間與同時進行的最大呼叫數。
+    """
+
+    def __init__(self, key=None, latency=0.05, miss_rate=0.0):
+        self.latency = latency
+        self.miss_rate = miss_rate
+        self.calls = 0
+        self.call_times = []
+        self.max_concurrent = 0
+        self._running = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _digest(text):
+        return int(hashlib.sha256(text.encode('utf-8')).hexdigest(), 16)
+
+    def _enter(self):
+        with self._lock:
+            self.calls += 1
+            self.call_times.append(time.monotonic())
+            self._running += 1
+            self.max_concurrent = max(self.max_concurrent, self._running)
+
+    def _leave(self):
+        with self._lock:
+            self._running -= 1
+
+    def places_autocomplete(self, query):
+        self._enter()
+        try:
+            time.sleep(self.latency)
+            if self._digest(query) % 1000 < self.miss_rate * 1000:
+                return []
+            return [{'description': f"{query}(建議)"}]
+        finally:
+            self._leave()
+
+    def geocode(self, place_name):
+        self._enter()
+        try:
+            time.sleep(self.latency)
+            digest = self._digest(place_name)
+            return [{'geometry': {'location': {'lat': round(24.6 + digest % 1000 / 10000, 4),
+                                               'lng': round(121.4 + digest // 1000 % 1000 / 10000, 4)}}}]
+        finally:
+            self._leave()
@@ -0,0 +1,46 @@
+import importlib
+import importlib.util
+
+
+class LazyModule:
+    """
+    延遲載入的模組：建立時不執行 import，第一次存取屬性時才載入。
+    各階段在模組層級以 `pd = lazy_module('pandas')` 取代 `import pandas as pd`，
+    程式碼照常使用 pd.read_csv 等名稱；只執行 --help 或不需要該模組的路徑時就不會載入。
+    載入後的模組與一般 import 相同，存放在 sys.modules 中。
+    """
+
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        module = self.__dict__['_module']
+        if module is None:
+            module = importlib.import_module(self.__dict__['_name'])
+            self.__dict__['_module'] = module
+        return module
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+    def __setattr__(self, attribute, value):
+        setattr(self._load(), attribute, value)
+
+    def __repr__(self):
+        state = 'loaded' if self.__dict__['_module'] is not None else 'not loaded'
+        return f"<lazy module {self.__dict__['_name']!r} ({state})>"
+
+
+def lazy_module(name):
+    """回傳延遲載入的模組。"""
+    return LazyModule(name)
+
+
+def module_available(name):
+    """模組是否已安裝 (不載入模組，只尋找模組的位置)。"""
+    try:
+        return importlib.util.find_spec(name) is not None
+    except ModuleNotFoundError:
+        # 上層套件不存在，例如 google.generativeai 的 google
+        return False
@@ -0,0 +1,261 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+
+# OpenAI Batch API 的端點與批次狀態
+BATCH_ENDPOINT = "/v1/chat/completions"
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def make_custom_id(index, body):
+    """
+    批次中每個請求的識別碼，包含批次序號與完整請求內容 (模型、系統指令、對話歷史、輸入與生成設定) 的雜湊，
+    任何一項改變時識別碼也會改變，因此不會沿用以舊設定送出的批次。
+    """
+    serialized = json.dumps(body, ensure_ascii=False, sort_keys=True)
+    digest = hashlib.sha256(serialized.encode("utf-8")).hexdigest()[:12]
+    return f"chunk-{index:05d}-{digest}"
+
+
+def build_batch_lines(provider, requests):
+    """
+    將 [(輸入文字, 對話歷史), ...] 轉為 OpenAI Batch API 的 JSONL 請求。
+    回傳 [(custom_id, 請求物件), ...]。
+    """
+    lines = []
+    for index, (message, history) in enumerate(requests):
+        body = provider.build_request_body(message, history)
+        custom_id = make_custom_id(index, body)
+        lines.append((custom_id, {
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": BATCH_ENDPOINT,
+            "body": body,
+        }))
+    return lines
+
+
+def write_batch_file(path, lines):
+    """將批次請求寫成 JSONL 檔案。"""
+    with open(path, "w", encoding="utf-8") as batch_file:
+        for _, request in lines:
+            batch_file.write(json.dumps(request, ensure_ascii=False) + "\n")
+
+
+def parse_batch_output(content):
+    """
+    解析批次輸出的 JSONL，回傳 ({custom_id: 回應文字}, {custom_id: 錯誤訊息})。
+    """
+    results, errors = {}, {}
+    for line in content.splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        custom_id = record.get("custom_id")
+        response = record.get("response") or {}
+        if record.get("error") or response.get("status_code") != 200:
+            errors[custom_id] = record.get("error") or response.get("body")
+            continue
+        results[custom_id] = response["body"]["choices"][0]["message"]["content"]
+    return results, errors
+
+
+class OpenAIBatchBackend:
+    """OpenAI Batch API：上傳 JSONL、建立批次、查詢狀態與下載結果。"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def upload(self, path):
+        with open(path, "rb") as batch_file:
+            return self.client.files.create(file=batch_file, purpose="batch").id
+
+    def create(self, file_id):
+        return self.client.batches.create(
+            input_file_id=file_id, endpoint=BATCH_ENDPOINT, completion_window="24h").id
+
+    def retrieve(self, batch_id):
+        batch = self.client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        return {
+            "status": batch.status,
+            "output_file_id": batch.output_file_id,
+            "error_file_id": batch.error_file_id,
+            "completed": counts.completed if counts else 0,
+            "failed": counts.failed if counts else 0,
+            "total": counts.total if counts else 0,
+        }
+
+    def download(self, file_id):
+        return self.client.files.content(file_id).text
+
+
+class LocalBatchBackend:
+    """
+    在本機檔案系統模擬 Batch API 的替身，介面與 OpenAIBatchBackend 相同。
+    上傳的檔案與批次狀態都存放在 root 目錄下，因此可以跨行程模擬中斷後繼續查詢。
+    批次在查詢 polls_to_complete 次後完成，由 responder(請求內容) 產生每個請求的回應文字；
+    responder 拋出錯誤的請求寫入錯誤檔，與 OpenAI 相同，全部失敗時批次仍為 completed 但沒有結果檔。
+    """
+
+    def __init__(self, root, responder, polls_to_complete=2):
+        self.root = root
+        self.responder = responder
+        self.polls_to_complete = polls_to_complete
+        os.makedirs(os.path.join(root, "files"), exist_ok=True)
+        os.makedirs(os.path.join(root, "batches"), exist_ok=True)
+
+    def _file_path(self, file_id):
+        return os.path.join(self.root, "files", f"{file_id}.jsonl")
+
+    def _batch_path(self, batch_id):
+        return os.path.join(self.root, "batches", f"{batch_id}.json")
+
+    def upload(self, path):
+        file_id = f"file-{uuid.uuid4().hex[:16]}"
+        shutil.copyfile(path, self._file_path(file_id))
+        return file_id
+
+    def create(self, file_id):
+        batch_id = f"batch-{uuid.uuid4().hex[:16]}"
+        with open(self._file_path(file_id), "r", encoding="utf-8") as input_file:
+            total = sum(1 for line in input_file if line.strip())
+        self._save_batch(batch_id, {
+            "status": "validating", "input_file_id": file_id, "polls": 0,
+            "output_file_id": None, "error_file_id": None,
+            "completed": 0, "failed": 0, "total": total,
+        })
+        return batch_id
+
+    def _save_batch(self, batch_id, batch):
+        with open(self._batch_path(batch_id), "w", encoding="utf-8") as batch_file:
+            json.dump(batch, batch_file)
+
+    def retrieve(self, batch_id):
+        with open(self._batch_path(batch_id), "r", encoding="utf-8") as batch_file:
+            batch = json.load(batch_file)
+        if batch["status"] not in TERMINAL_STATUSES:
+            batch["polls"] += 1
+            if batch["polls"] >= self.polls_to_complete:
+                self._run(batch)
+            else:
+                batch["status"] = "in_progress"
+            self._save_batch(batch_id, batch)
+        return {key: batch[key] for key in
+                ("status", "output_file_id", "error_file_id", "completed", "failed", "total")}
+
+    def _run(self, batch):
+        """處理批次中的每個請求，並以 Batch API 的輸出格式寫入結果檔與錯誤檔 (沒有內容的檔案不會建立)。"""
+        outputs, errors = [], []
+        with open(self._file_path(batch["input_file_id"]), "r", encoding="utf-8") as input_file:
+            for line in input_file:
+                if not line.strip():
+                    continue
+                request = json.loads(line)
+                record = {"id": f"batch_req_{uuid.uuid4().hex[:16]}", "custom_id": request["custom_id"]}
+                try:
+                    content = self.responder(request["body"])
+                except Exception as error:
+                    errors.append({**record, "response": {"status_code": 500, "body": {
+                        "error": {"message": str(error), "type": type(error).__name__}}}, "error": None})
+                    batch["failed"] += 1
+                    continue
+                outputs.append({**record, "response": {"status_code": 200, "body": {
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content}}],
+                }}, "error": None})
+                batch["completed"] += 1
+        batch["status"] = "completed"
+        batch["output_file_id"] = self._write_records(outputs)
+        batch["error_file_id"] = self._write_records(errors)
+
+    def _write_records(self, records):
+        if not records:
+            return None
+        file_id = f"file-{uuid.uuid4().hex[:16]}"
+        with open(self._file_path(file_id), "w", encoding="utf-8") as records_file:
+            for record in records:
+                records_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return file_id
+
+    def download(self, file_id):
+        with open(self._file_path(file_id), "r", encoding="utf-8") as output_file:
+            return output_file.read()
+
+
+def load_state(state_path):
+    """讀取批次狀態檔，不存在時回傳 None。"""
+    try:
+        with open(state_path, "r", encoding="utf-8") as state_file:
+            return json.load(state_file)
+    except FileNotFoundError:
+        return None
+
+
+def save_state(state_path, state):
+    """寫入批次狀態檔，先寫入暫存檔再取代，避免中斷時留下不完整的檔案。"""
+    temporary_path = state_path + ".tmp"
+    with open(temporary_path, "w", encoding="utf-8") as state_file:
+        json.dump(state, state_file, ensure_ascii=False, indent=2)
+    os.replace(temporary_path, state_path)
+
+
+def run_batch(backend, lines, state_path, poll_interval=60, sleep=time.sleep):
+    """
+    送出批次並等待完成，回傳 ({custom_id: 回應文字}, {custom_id: 錯誤訊息})。
+
+    狀態 (上傳的檔案、批次識別碼、目前狀態與各請求的 custom_id) 記錄在 state_path，
+    程式中斷後以相同的請求重新執行時，會繼續查詢原本的批次而不會重複送出。
+    custom_id 包含完整請求內容的雜湊，模型或提示詞改變時不會沿用舊的批次；
+    批次結束 (取得結果或失敗) 後即移除狀態檔，之後重新執行一定會送出新的批次。
+    所有請求都失敗時，批次的狀態仍為 completed 但沒有結果檔，此時回傳空的結果與錯誤檔中的錯誤。
+    """
+    custom_ids = [custom_id for custom_id, _ in lines]
+    state = load_state(state_path)
+    if state and state.get("custom_ids") != custom_ids:
+        print("請求內容 (輸入、模型或提示詞) 已改變，捨棄先前的批次狀態並重新送出")
+        state = None
+
+    if state is None:
+        batch_path = os.path.splitext(state_path)[0] + ".jsonl"
+        write_batch_file(batch_path, lines)
+        file_id = backend.upload(batch_path)
+        batch_id = backend.create(file_id)
+        state = {"custom_ids": custom_ids, "input_file": batch_path,
+                 "file_id": file_id, "batch_id": batch_id, "status": "validating"}
+        save_state(state_path, state)
+        print(f"已送出批次 {batch_id}，共 {len(lines)} 個請求")
+    else:
+        print(f"繼續查詢批次 {state['batch_id']} (上次狀態：{state['status']})")
+
+    while True:
+        batch = backend.retrieve(state["batch_id"])
+        state.update(status=batch["status"], output_file_id=batch["output_file_id"],
+                     error_file_id=batch["error_file_id"])
+        save_state(state_path, state)
+        if batch["status"] in TERMINAL_STATUSES:
+            break
+        print(f"批次狀態：{batch['status']} ({batch['completed']}/{batch['total']})，"
+              f"{poll_interval} 秒後再次查詢")
+        sleep(poll_interval)
+
+    if batch["status"] != "completed":
+        discard_state(state_path, state)
+        raise RuntimeError(f"批次 {state['batch_id']} 未完成，狀態為 {batch['status']}")
+
+    results, errors = {}, {}
+    if batch["output_file_id"]:
+        results, errors = parse_batch_output(backend.download(batch["output_file_id"]))
+    if batch["error_file_id"]:
+        errors.update(parse_batch_output(backend.download(batch["error_file_id"]))[1])
+    discard_state(state_path, state)
+    return results, errors
+
+
+def discard_state(state_path, state):
+    """批次結束後移除狀態檔與送出的 JSONL，避免之後的執行沿用已經用過的結果。"""
+    for path in (state_path, state.get("input_file")):
+        if path and os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,163 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+
+class ResponseCache:
+    """
+    以 SQLite 儲存大語言模型回應的本機快取。
+    鍵值是請求內容 (供應商、模型、系統指令、對話歷史、生成設定與輸入) 的雜湊，
+    因此只要任何一項改變就會重新呼叫 API，內容相同的批次則直接使用快取。
+    """
+
+    def __init__(self, path, max_bytes=256 * 1024 * 1024, max_age_days=30):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_days * 24 * 60 * 60
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # 分批模式會在多個執行緒中讀寫快取，因此共用連線並以鎖保護
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._connection.commit()
+        self.evict()
+
+    @staticmethod
+    def make_key(provider, model, system_instruction, history, generation_config, message):
+        """計算請求內容的 SHA-256 雜湊，作為快取的鍵值。"""
+        payload = json.dumps({
+            "provider": provider,
+            "model": model,
+            "system_instruction": system_instruction,
+            "history": history,
+            "generation_config": generation_config,
+            "message": message,
+        }, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """取得快取的回應，若不存在或已過期則回傳 None。"""
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.max_age_seconds:
+                self.misses += 1
+                return None
+            self._connection.execute(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._connection.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, response):
+        """儲存回應；沒有回應 (None) 時不儲存。"""
+        if response is None:
+            return
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, response, len(response.encode("utf-8")), now, now))
+            self._connection.commit()
+
+    def evict(self):
+        """
+        移除超過保存期限的回應，若總大小仍超過上限，再依最近使用時間由舊到新移除。
+        回傳移除的筆數。
+        """
+        with self._lock:
+            cursor = self._connection.execute(
+                "DELETE FROM responses WHERE created_at < ?",
+                (time.time() - self.max_age_seconds,))
+            removed = cursor.rowcount
+
+            total_size = self._connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total_size > self.max_bytes:
+                rows = self._connection.execute(
+                    "SELECT key, size FROM responses ORDER BY accessed_at").fetchall()
+                stale_keys = []
+                for key, size in rows:
+                    if total_size <= self.max_bytes:
+                        break
+                    stale_keys.append((key,))
+                    total_size -= size
+                self._connection.executemany("DELETE FROM responses WHERE key = ?", stale_keys)
+                removed += len(stale_keys)
+
+            self._connection.commit()
+            return removed
+
+    def close(self):
+        """整理快取大小並關閉資料庫連線。"""
+        self.evict()
+        self._connection.close()
+
+    def summary(self):
+        """回傳本次執行的快取命中統計。"""
+        total = self.hits + self.misses
+        hit_rate = self.hits / total * 100 if total else 0
+        return f"快取命中 {self.hits} 次，未命中 {self.misses} 次 (命中率 {hit_rate:.1f}%)"
+
+
+def with_cache(send, cache, **key_parts):
+    """
+    包裝送出訊息的函式：先查詢快取，未命中時才呼叫 API 並將回應存入快取。
+    key_parts 為快取鍵值中除了輸入文字與對話歷史以外的部分 (供應商、模型、系統指令等)。
+    """
+    def cached_send(message, history):
+        key = cache.make_key(message=message, history=history, **key_parts)
+        response = cache.get(key)
+        if response is None:
+            response = send(message, history)
+            cache.put(key, response)
+        return response
+
+    return cached_send
+
+
+
+def with_cache_stream(stream, cache, **key_parts):
+    """
+    包裝串流送出的函式：快取命中時一次產出完整回應，
+    未命中時逐段產出 API 的回應，並在完整收到後存入快取。
+    """
+    def cached_stream(message, history):
+        key = cache.make_key(message=message, history=history, **key_parts)
+        response = cache.get(key)
+        if response is not None:
+            yield response
+            return
+        parts = []
+        for delta in stream(message, history):
+            parts.append(delta)
+            yield delta
+        cache.put(key, ''.join(parts))
+
+    return cached_stream
+
+
+def with_cache_refresh(send, cache, **key_parts):
+    """
+    包裝送出訊息的函式：不查詢快取，一律呼叫 API，並以新的回應取代快取中的回應。
+    用於重新請求驗證失敗的批次，避免再次取得快取中格式不符的回應。
+    """
+    def refreshed_send(message, history):
+        response = send(message, history)
+        cache.put(cache.make_key(message=message, history=history, **key_parts), response)
+        return response
+
+    return refreshed_send
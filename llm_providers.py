@@ -0,0 +1,442 @@
+import abc
+import random
+import threading
+import time
+from typing import NamedTuple
+
+from event_schema import google_response_schema, openai_response_format, rows_to_json, structured_output_enabled
+from lazy_modules import lazy_module
+from metrics import percentile
+from prompt_builder import CSV_HEADER, estimate_tokens, message_text
+from rate_limit import RateLimiter
+
+# 供應商的 SDK 載入很慢，只在建立該供應商時才載入，不會同時載入兩個 SDK
+genai = lazy_module('google.generativeai')
+openai = lazy_module('openai')
+
+# 這些錯誤代表暫時性的問題 (速率限制、逾時、伺服器忙碌)，稍後重試通常就會成功
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_ERROR_NAMES = {
+    'RateLimitError', 'APITimeoutError', 'APIConnectionError', 'InternalServerError',
+    'ResourceExhausted', 'ServiceUnavailable', 'DeadlineExceeded', 'TooManyRequests',
+    'GatewayTimeout',
+}
+
+# 每個供應商共用的用戶端，避免每個請求重新建立連線
+_client_lock = threading.Lock()
+_openai_clients = {}
+_google_configured_keys = set()
+
+
+class Completion(NamedTuple):
+    """一次模型呼叫的結果與用量。"""
+    text: str
+    input_tokens: int
+    output_tokens: int
+    latency: float
+
+
+def is_retryable(error):
+    """判斷錯誤是否為暫時性的，值得重試。"""
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    status_code = getattr(error, 'status_code', None) or getattr(error, 'code', None)
+    if isinstance(status_code, int) and status_code in RETRYABLE_STATUS_CODES:
+        return True
+    return type(error).__name__ in RETRYABLE_ERROR_NAMES
+
+
+def backoff_delay(attempt, base_delay=1.0, max_delay=60.0):
+    """第 attempt 次重試前的等待秒數：指數退避加上完整抖動 (full jitter)。"""
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+class Provider(abc.ABC):
+    """
+    大語言模型供應商的共同介面。
+    子類別只需實作 _request()；速率限制、重試與用量統計由此類別統一處理。
+    """
+
+    name = None
+
+    def __init__(self, model_name, system_config, rate_limiter=None, max_retries=None,
+                 base_delay=1.0, max_delay=60.0, sleep=time.sleep):
+        self.model_name = model_name
+        self.system_config = system_config
+        self.system_instruction = system_config.get("instruction", "")
+        # 使用供應商的結構化輸出 (JSON schema)，回應為 {"events": [...]} 而不是 CSV 表格
+        self.structured = structured_output_enabled(system_config)
+        self.generation_config = self.build_generation_config(system_config)
+        self.rate_limiter = rate_limiter or RateLimiter(
+            system_config.get("requests_per_minute"), system_config.get("tokens_per_minute"))
+        self.max_retries = max_retries if max_retries is not None else system_config.get("max_retries", 5)
+        self.timeout = system_config.get("timeout", 600)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._sleep = sleep
+        self._stats_lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.latencies = []
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.rate_limit_wait = 0.0
+
+    @staticmethod
+    def build_generation_config(system_config):
+        """從系統設定檔取出模型的生成設定。"""
+        return {}
+
+    @abc.abstractmethod
+    def _request(self, message, history):
+        """送出一次請求並回傳 Completion，由子類別實作；API 未回報用量時 token 數為 0。"""
+
+    def build_request_body(self, message, history):
+        """Batch API 中單一請求的內容 (Chat Completions 格式)，不支援批次的供應商會拋出錯誤。"""
+        raise NotImplementedError(f"{self.name} 不支援 Batch API")
+
+    def estimate_request_tokens(self, message, history):
+        """估計請求的輸入 token 數，用於速率限制。"""
+        return (estimate_tokens(self.system_instruction) + estimate_tokens(message)
+                + sum(estimate_tokens(message_text(item)) for item in history))
+
+    @abc.abstractmethod
+    def _stream(self, message, history, usage):
+        """逐段產出回應文字，並在 usage 中填入 input_tokens 與 output_tokens，由子類別實作。"""
+
+    def _wait_for_rate_limit(self, estimated_tokens):
+        waited = self.rate_limiter.acquire(estimated_tokens)
+        with self._stats_lock:
+            self.rate_limit_wait += waited
+
+    def _retry_or_raise(self, error, attempt):
+        """暫時性錯誤且未超過重試次數時等待後回傳，否則記錄失敗並重新拋出錯誤。"""
+        if attempt >= self.max_retries or not is_retryable(error):
+            with self._stats_lock:
+                self.failures += 1
+            raise error
+        delay = backoff_delay(attempt, self.base_delay, self.max_delay)
+        with self._stats_lock:
+            self.retries += 1
+        print(f"{self.name} 請求失敗 ({type(error).__name__})，{delay:.1f} 秒後第 {attempt + 1} 次重試")
+        self._sleep(delay)
+
+    def _record(self, completion, estimated_tokens):
+        """依實際用量修正速率限制的額度並累計統計。"""
+        self.rate_limiter.consume(
+            completion.input_tokens + completion.output_tokens
+            - self.rate_limiter.charged_tokens(estimated_tokens))
+        with self._stats_lock:
+            self.calls += 1
+            self.latencies.append(completion.latency)
+            self.input_tokens += completion.input_tokens
+            self.output_tokens += completion.output_tokens
+
+    def complete(self, message, history):
+        """依速率限制送出請求，遇到暫時性錯誤時以指數退避重試，回傳 Completion。"""
+        estimated_tokens = self.estimate_request_tokens(message, history)
+        attempt = 0
+        while True:
+            self._wait_for_rate_limit(estimated_tokens)
+            try:
+                completion = self._request(message, history)
+            except Exception as error:
+                self._retry_or_raise(error, attempt)
+                attempt += 1
+                continue
+            # API 未回報用量時以估計值計算，否則速率限制會退回整個預估額度
+            completion = completion._replace(
+                input_tokens=completion.input_tokens or estimated_tokens,
+                output_tokens=completion.output_tokens or estimate_tokens(completion.text or ''))
+            self._record(completion, estimated_tokens)
+            return completion
+
+    def stream(self, message, history):
+        """
+        以串流方式送出請求，逐段產出回應文字。
+        只有在尚未收到任何文字前發生暫時性錯誤才會重試，避免重複產出已送出的內容。
+        """
+        estimated_tokens = self.estimate_request_tokens(message, history)
+        attempt = 0
+        while True:
+            self._wait_for_rate_limit(estimated_tokens)
+            start = time.perf_counter()
+            usage = {}
+            parts = []
+            try:
+                for delta in self._stream(message, history, usage):
+                    parts.append(delta)
+                    yield delta
+            except Exception as error:
+                if parts:
+                    with self._stats_lock:
+                        self.failures += 1
+                    raise
+                self._retry_or_raise(error, attempt)
+                attempt += 1
+                continue
+            text = ''.join(parts)
+            self._record(Completion(text,
+                                    usage.get('input_tokens') or estimated_tokens,
+                                    usage.get('output_tokens') or estimate_tokens(text),
+                                    time.perf_counter() - start), estimated_tokens)
+            return
+
+    def send(self, message, history):
+        """送出請求並只回傳文字，與 02 階段的送出函式介面相同。"""
+        return self.complete(message, history).text
+
+    def report(self):
+        """回傳本次執行的呼叫次數、延遲與 token 用量統計。"""
+        return (f"{self.name} 呼叫 {self.calls} 次 (重試 {self.retries} 次，失敗 {self.failures} 次)，"
+                f"延遲 p50 {percentile(self.latencies, 0.5):.2f}s / p90 {percentile(self.latencies, 0.9):.2f}s"
+                f" / p99 {percentile(self.latencies, 0.99):.2f}s，"
+                f"token 輸入 {self.input_tokens} / 輸出 {self.output_tokens}，"
+                f"速率限制等待 {self.rate_limit_wait:.1f}s")
+
+
+class GoogleProvider(Provider):
+    """Google Gemini，透過 google.generativeai 的全域用戶端送出請求。"""
+
+    name = 'google'
+
+    def __init__(self, api_key, model_name, system_config, **kwargs):
+        super().__init__(model_name, system_config, **kwargs)
+        with _client_lock:
+            if api_key not in _google_configured_keys:
+                genai.configure(api_key=api_key)
+                _google_configured_keys.add(api_key)
+        self.model = genai.GenerativeModel(
+            model_name=model_name,
+            generation_config=self.generation_config,
+            system_instruction=self.system_instruction,
+        )
+
+    @staticmethod
+    def build_generation_config(system_config):
+        generation_config = {
+            "temperature": system_config.get("temperature", 1),
+            "top_p": system_config.get("top_p", 0.95),
+            "top_k": system_config.get("top_k", 64),
+            "max_output_tokens": system_config.get("max_output_tokens", 8192),
+            "response_mime_type": system_config.get("response_mime_type", "text/plain")
+        }
+        if structured_output_enabled(system_config):
+            generation_config["response_mime_type"] = "application/json"
+            generation_config["response_schema"] = google_response_schema()
+        return generation_config
+
+    def _request(self, message, history):
+        start = time.perf_counter()
+        # 開始對話
+        chat_session = self.model.start_chat(history=history)
+
+        # 送出訊息並取得回應
+        response = chat_session.send_message({
+            "role": "user",
+            "parts": [message]
+        }, request_options={"timeout": self.timeout})
+        usage = response.usage_metadata
+        try:
+            text = response.text
+        except ValueError:
+            # 回應被安全設定擋下時沒有內容，回傳空白的回應，由驗證記為錯誤並重新請求該批次
+            print(f"{self.name} 回應沒有內容 (可能被安全設定擋下)：{getattr(response, 'prompt_feedback', '')}")
+            text = ''
+        return Completion(text,
+                          getattr(usage, 'prompt_token_count', 0) or 0,
+                          getattr(usage, 'candidates_token_count', 0) or 0,
+                          time.perf_counter() - start)
+
+    def _stream(self, message, history, usage):
+        chat_session = self.model.start_chat(history=history)
+        response = chat_session.send_message({
+            "role": "user",
+            "parts": [message]
+        }, stream=True, request_options={"timeout": self.timeout})
+        for chunk in response:
+            try:
+                text = chunk.text if chunk.parts else ''
+            except ValueError:
+                # 與非串流相同：被安全設定擋下或沒有內容的片段略過，缺少的內容由驗證記為錯誤並重新請求該批次
+                print(f"{self.name} 串流片段沒有內容 (可能被安全設定擋下)：{getattr(chunk, 'prompt_feedback', '')}")
+                continue
+            if text:
+                yield text
+        metadata = response.usage_metadata
+        usage['input_tokens'] = getattr(metadata, 'prompt_token_count', 0) or 0
+        usage['output_tokens'] = getattr(metadata, 'candidates_token_count', 0) or 0
+
+
+def get_openai_client(api_key, timeout=600):
+    """取得共用的 OpenAI 用戶端，同一組金鑰共用一個 HTTP 連線池。"""
+    with _client_lock:
+        client = _openai_clients.get(api_key)
+        if client is None:
+            # 重試改由 Provider 統一處理，避免與 SDK 內建的重試疊加
+            client = openai.OpenAI(api_key=api_key, timeout=timeout, max_retries=0)
+            _openai_clients[api_key] = client
+        return client
+
+
+class OpenAIProvider(Provider):
+    """OpenAI Chat Completions，同一組金鑰的請求共用 HTTP 連線池。"""
+
+    name = 'openai'
+
+    def __init__(self, api_key, model_name, system_config, **kwargs):
+        super().__init__(model_name, system_config, **kwargs)
+        self.client = get_openai_client(api_key, self.timeout)
+
+    @staticmethod
+    def build_generation_config(system_config):
+        generation_config = {
+            "temperature": system_config.get("temperature", 1),
+            "top_p": system_config.get("top_p", 0.95),
+            "top_k": system_config.get("top_k", 64),
+            "max_output_tokens": system_config.get("max_output_tokens", 8192),
+            "response_mime_type": system_config.get("response_mime_type", "text/plain"),
+            "frequency_penalty": system_config.get("frequency_penalty", 0),
+            "presence_penalty": system_config.get("presence_penalty", 0),
+            "response_format": system_config.get("response_format", {"type": "text"})
+        }
+        if structured_output_enabled(system_config):
+            generation_config["response_format"] = openai_response_format()
+        return generation_config
+
+    def build_messages(self, message, history):
+        """組合系統指令、對話歷史與輸入成 Chat Completions 的訊息串列。"""
+        return [{"role": "system", "content": self.system_instruction}
+                ] + history + [{"role": "user", "content": message}]
+
+    def build_request_body(self, message, history):
+        return {
+            "model": self.model_name,
+            "messages": self.build_messages(message, history),
+            "temperature": self.generation_config["temperature"],
+            "max_tokens": self.generation_config["max_output_tokens"],
+            "top_p": self.generation_config["top_p"],
+            "frequency_penalty": self.generation_config["frequency_penalty"],
+            "presence_penalty": self.generation_config["presence_penalty"],
+            "response_format": self.generation_config["response_format"]
+        }
+
+    def _request(self, message, history):
+        start = time.perf_counter()
+        # 開始對話
+        response = self.client.chat.completions.create(**self.build_request_body(message, history))
+        usage = response.usage
+        reply = response.choices[0].message
+        text = reply.content
+        if text is None:
+            # 結構化輸出時模型拒絕回應，content 為 None 並在 refusal 說明原因；回傳空白的回應，由驗證記為錯誤並重新請求該批次
+            print(f"{self.name} 模型拒絕回應：{getattr(reply, 'refusal', None) or '(沒有說明)'}")
+            text = ''
+        return Completion(text,
+                          usage.prompt_tokens if usage else 0,
+                          usage.completion_tokens if usage else 0,
+                          time.perf_counter() - start)
+
+    def _stream(self, message, history, usage):
+        response = self.client.chat.completions.create(
+            **self.build_request_body(message, history),
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        for chunk in response:
+            # 最後一個片段只包含用量，沒有 choices
+            if chunk.usage:
+                usage['input_tokens'] = chunk.usage.prompt_tokens
+                usage['output_tokens'] = chunk.usage.completion_tokens
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+class FakeRateLimitError(Exception):
+    """假供應商模擬的 429 錯誤。"""
+    status_code = 429
+
+
+class FakeProvider(Provider):
+    """
+    不連線的假供應商，實作相同介面，用於離線測試速率限制、重試與同時請求。
+    延遲為固定延遲加上與 token 數成正比的時間，並可依比例隨機回傳 429 錯誤。
+    回應將每行摘要轉為一列 CSV (地點與說明為空白)；使用結構化輸出時轉為相同內容的 JSON。
+    """
+
+    name = 'fake'
+
+    def __init__(self, model_name='fake', system_config=None, base_latency=0.2,
+                 seconds_per_1k_tokens=0.1, failure_rate=0.0, seed=None, **kwargs):
+        super().__init__(model_name, system_config or {}, **kwargs)
+        self.base_latency = base_latency
+        self.seconds_per_1k_tokens = seconds_per_1k_tokens
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+
+    def build_request_body(self, message, history):
+        return {"model": self.model_name,
+                "messages": history + [{"role": "user", "content": message}]}
+
+    def respond_to_body(self, body):
+        """依 Batch API 請求內容中最後一則使用者訊息產生回應文字。"""
+        return self.response_text(body["messages"][-1]["content"])
+
+    def response_text(self, message):
+        """依輸出模式產生回應：CSV 表格，或結構化輸出的 JSON。"""
+        text = self.respond(message)
+        if self.structured:
+            return rows_to_json([line for line in text.splitlines() if line != CSV_HEADER])
+        return text
+
+    def respond(self, message):
+        """依摘要產生回應文字。"""
+        rows = []
+        for line in message.splitlines():
+            fields = line.split('，')
+            if len(fields) >= 2:
+                rows.append(f"{fields[0].replace('/', '-')},{fields[1]},,")
+        return '\n'.join([CSV_HEADER, *rows])
+
+    def _fail_randomly(self):
+        with self._random_lock:
+            failed = self._random.random() < self.failure_rate
+        if failed:
+            time.sleep(self.base_latency / 2)
+            raise FakeRateLimitError("模擬的速率限制 (429)")
+
+    def _request(self, message, history):
+        start = time.perf_counter()
+        input_tokens = self.estimate_request_tokens(message, history)
+        self._fail_randomly()
+        text = self.response_text(message)
+        output_tokens = estimate_tokens(text)
+        time.sleep(self.base_latency + (input_tokens + output_tokens) / 1000 * self.seconds_per_1k_tokens)
+        return Completion(text, input_tokens, output_tokens, time.perf_counter() - start)
+
+    def _stream(self, message, history, usage):
+        input_tokens = self.estimate_request_tokens(message, history)
+        self._fail_randomly()
+        text = self.response_text(message)
+        usage['input_tokens'] = input_tokens
+        usage['output_tokens'] = estimate_tokens(text)
+        # 第一段回應前等待固定延遲，之後依輸出長度平均分段送出
+        time.sleep(self.base_latency)
+        pieces = [text[index:index + 16] for index in range(0, len(text), 16)]
+        piece_delay = (input_tokens + usage['output_tokens']) / 1000 * self.seconds_per_1k_tokens
+        for piece in pieces:
+            time.sleep(piece_delay / len(pieces))
+            yield piece
+
+
+def create_provider(provider, api_key, model_name, system_config, **kwargs):
+    """依名稱建立供應商實例。"""
+    if provider == 'google':
+        return GoogleProvider(api_key, model_name, system_config, **kwargs)
+    if provider == 'openai':
+        return OpenAIProvider(api_key, model_name, system_config, **kwargs)
+    if provider == 'fake':
+        return FakeProvider(model_name, system_config, **kwargs)
+    raise ValueError(f"不支援的 API 供應商：{provider}")
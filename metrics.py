@@ -0,0 +1,308 @@
+import contextlib
+import cProfile
+import datetime
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+
+# 各階段共用的命令列選項，說明文字附加在各階段自訂的幫助訊息中
+METRICS_USAGE = "[--metrics 統計檔案] [--prometheus 統計檔案] [--profile 分析檔案]"
+METRICS_HELP = """  --metrics METRICS     將執行統計 (耗時、CPU 時間、峰值記憶體、資料列數、token 用量、API 延遲百分位數、
+                        快取命中率) 以 JSON lines 附加至檔案，每次執行一行
+  --prometheus PROMETHEUS
+                        將執行統計以 Prometheus 文字格式寫入檔案 (覆寫，可由 node_exporter 的 textfile collector 讀取)
+  --profile PROFILE     以 cProfile 分析主執行緒，將結果寫入檔案 (python -m pstats 檔案) 並顯示耗時最多的函數"""
+
+# Prometheus 指標名稱的前綴
+PROMETHEUS_PREFIX = 'event_pipeline'
+# 回報的延遲百分位數
+LATENCY_QUANTILES = (0.5, 0.9, 0.99)
+# --profile 顯示的函數數
+PROFILE_TOP_FUNCTIONS = 20
+
+
+def add_metrics_arguments(parser):
+    """加入 --metrics、--prometheus 與 --profile 選項。"""
+    parser.add_argument('--metrics', help="執行統計的 JSON lines 檔案 (附加)")
+    parser.add_argument('--prometheus', help="執行統計的 Prometheus 文字格式檔案 (覆寫)")
+    parser.add_argument('--profile', help="cProfile 分析結果檔案")
+
+
+def percentile(values, fraction):
+    """回傳排序後數值的百分位數 (最近排名法)。"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))
+    return ordered[index]
+
+
+def peak_rss_bytes():
+    """
+    程序的峰值記憶體 (位元組)。Linux 讀取 /proc/self/status 的 VmHWM，
+    其他系統使用 resource.getrusage (macOS 的單位是位元組，其餘為 KB)；都無法取得時回傳 None。
+    """
+    try:
+        with open('/proc/self/status', 'r', encoding='ascii') as status_file:
+            for line in status_file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class StageMetrics:
+    """
+    一個階段一次執行的統計：耗時、CPU 時間、峰值記憶體、輸入與輸出的資料列數、
+    token 用量、各 API 每次呼叫的延遲、各快取的命中與未命中次數，以及其他計數。
+    建立時開始計時，finish() 時結束；可以在多個執行緒中同時記錄。
+    measure_process 為 False 時 (管線中同時執行的節點) 不記錄 CPU 時間與峰值記憶體，這兩者是整個程序共用的。
+    """
+
+    def __init__(self, stage, measure_process=True):
+        self.stage = stage
+        self.measure_process = measure_process
+        self.started_at = datetime.datetime.now().astimezone()
+        self.status = 'ok'
+        self.rows_in = None
+        self.rows_out = None
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.latencies = {}
+        self.caches = {}
+        self.counters = {}
+        self.wall_seconds = None
+        self.cpu_seconds = None
+        self.peak_rss_bytes = None
+        self._lock = threading.Lock()
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+
+    def add_rows(self, rows_in=0, rows_out=0):
+        """累計輸入與輸出的資料列數。"""
+        with self._lock:
+            if rows_in:
+                self.rows_in = (self.rows_in or 0) + rows_in
+            if rows_out:
+                self.rows_out = (self.rows_out or 0) + rows_out
+
+    def counted(self, rows):
+        """逐列產出 rows 並累計為輸入的資料列數，用於以串流方式讀取的輸入。"""
+        count = 0
+        try:
+            for row in rows:
+                count += 1
+                yield row
+        finally:
+            self.add_rows(rows_in=count)
+
+    def add_tokens(self, input_tokens, output_tokens):
+        with self._lock:
+            self.input_tokens += input_tokens
+            self.output_tokens += output_tokens
+
+    def add_latencies(self, api, latencies):
+        """記錄 API 每次呼叫的延遲 (秒)。"""
+        with self._lock:
+            self.latencies.setdefault(api, []).extend(latencies)
+
+    def add_cache(self, name, hits, misses):
+        with self._lock:
+            previous_hits, previous_misses = self.caches.get(name, (0, 0))
+            self.caches[name] = (previous_hits + hits, previous_misses + misses)
+
+    def add_count(self, name, value):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def record_provider(self, provider):
+        """記錄大語言模型供應商 (llm_providers.Provider) 的 token 用量、延遲、重試與速率限制等待。"""
+        self.add_tokens(provider.input_tokens, provider.output_tokens)
+        self.add_latencies(f"llm_{provider.name}", provider.latencies)
+        self.add_count('llm_calls', provider.calls)
+        self.add_count('llm_retries', provider.retries)
+        self.add_count('llm_failures', provider.failures)
+        self.add_count('rate_limit_wait_seconds', round(provider.rate_limit_wait, 3))
+
+    def record_response_cache(self, cache):
+        """記錄回應快取 (llm_cache.ResponseCache) 的命中次數。"""
+        self.add_cache('llm_response', cache.hits, cache.misses)
+
+    def record_geocoder(self, geocoder):
+        """記錄地點查詢 (geocoder.Geocoder) 各 API 的延遲、查無結果快取與合併查詢。"""
+        for method, latencies in geocoder.latencies.items():
+            self.add_latencies(f"maps_{method}", latencies)
+        self.add_count('maps_api_calls', geocoder.api_calls)
+        resolved = geocoder.lookups - len(geocoder.coalesced) - geocoder.negative_hits
+        self.add_cache('geocode_negative', geocoder.negative_hits, resolved)
+        self.add_cache('geocode_in_flight', len(geocoder.coalesced), geocoder.lookups - len(geocoder.coalesced))
+
+    def finish(self, status=None):
+        """結束計時並記錄 CPU 時間與峰值記憶體，回傳自身。"""
+        self.wall_seconds = time.perf_counter() - self._wall_start
+        if self.measure_process:
+            self.cpu_seconds = time.process_time() - self._cpu_start
+            self.peak_rss_bytes = peak_rss_bytes()
+        if status:
+            self.status = status
+        return self
+
+    def to_dict(self):
+        """轉為可寫入 JSON 的字典。"""
+        with self._lock:
+            apis = {api: {'calls': len(latencies),
+                          'total_seconds': round(sum(latencies), 6),
+                          **{f"p{int(quantile * 100)}": round(percentile(latencies, quantile), 6)
+                             for quantile in LATENCY_QUANTILES},
+                          'max': round(max(latencies, default=0.0), 6)}
+                    for api, latencies in self.latencies.items()}
+            caches = {name: {'hits': hits, 'misses': misses,
+                             'hit_rate': round(hits / (hits + misses), 4) if hits + misses else None}
+                      for name, (hits, misses) in self.caches.items()}
+            return {
+                'stage': self.stage,
+                'status': self.status,
+                'started_at': self.started_at.isoformat(timespec='seconds'),
+                'wall_seconds': round(self.wall_seconds, 6) if self.wall_seconds is not None else None,
+                'cpu_seconds': round(self.cpu_seconds, 6) if self.cpu_seconds is not None else None,
+                'peak_rss_bytes': self.peak_rss_bytes,
+                'rows_in': self.rows_in,
+                'rows_out': self.rows_out,
+                'input_tokens': self.input_tokens,
+                'output_tokens': self.output_tokens,
+                'apis': apis,
+                'caches': caches,
+                'counters': dict(self.counters),
+            }
+
+
+def append_jsonl(path, records):
+    """將統計附加至 JSON lines 檔案，每筆一行。"""
+    with open(path, 'a', encoding='utf-8') as metrics_file:
+        for record in records:
+            metrics_file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+def _labels(**labels):
+    """Prometheus 的標籤，值中的反斜線、引號與換行需要跳脫。"""
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in labels.items()) + '}'
+
+
+def prometheus_text(records):
+    """
+    將一或多筆統計 (StageMetrics.to_dict()) 轉為 Prometheus 文字格式。
+    每個指標只有一組 HELP 與 TYPE，各階段以 stage 標籤區分；延遲以 summary 表示。
+    """
+    families = {}
+
+    def sample(metric, kind, description, value, suffix='', **labels):
+        if value is None:
+            return
+        family = families.setdefault(metric, (kind, description, []))
+        family[2].append(f"{PROMETHEUS_PREFIX}_{metric}{suffix}{_labels(**labels)} {value}")
+
+    for record in records:
+        stage = record['stage']
+        sample('last_run_timestamp_seconds', 'gauge', '最後一次執行的開始時間',
+               int(datetime.datetime.fromisoformat(record['started_at']).timestamp()), stage=stage)
+        sample('success', 'gauge', '最後一次執行是否成功', int(record['status'] == 'ok'), stage=stage)
+        sample('wall_seconds', 'gauge', '耗時 (秒)', record['wall_seconds'], stage=stage)
+        sample('cpu_seconds', 'gauge', 'CPU 時間 (秒)', record['cpu_seconds'], stage=stage)
+        sample('peak_rss_bytes', 'gauge', '峰值記憶體 (位元組)', record['peak_rss_bytes'], stage=stage)
+        for direction in ('in', 'out'):
+            sample('rows', 'gauge', '輸入與輸出的資料列數', record[f"rows_{direction}"],
+                   stage=stage, direction=direction)
+        for direction in ('input', 'output'):
+            sample('llm_tokens', 'gauge', '大語言模型的 token 用量', record[f"{direction}_tokens"],
+                   stage=stage, direction=direction)
+        for api, summary in record['apis'].items():
+            for quantile in LATENCY_QUANTILES:
+                sample('api_latency_seconds', 'summary', 'API 每次呼叫的延遲 (秒)',
+                       summary[f"p{int(quantile * 100)}"], stage=stage, api=api, quantile=quantile)
+            sample('api_latency_seconds', 'summary', 'API 每次呼叫的延遲 (秒)', summary['total_seconds'],
+                   '_sum', stage=stage, api=api)
+            sample('api_latency_seconds', 'summary', 'API 每次呼叫的延遲 (秒)', summary['calls'],
+                   '_count', stage=stage, api=api)
+        for cache, summary in record['caches'].items():
+            for result, key in (('hit', 'hits'), ('miss', 'misses')):
+                sample('cache_lookups', 'gauge', '快取查詢次數', summary[key], stage=stage, cache=cache, result=result)
+            sample('cache_hit_ratio', 'gauge', '快取命中率', summary['hit_rate'], stage=stage, cache=cache)
+        for name, value in record['counters'].items():
+            sample('count', 'gauge', '其他計數 (API 呼叫、重試等)', value, stage=stage, name=name)
+
+    lines = []
+    for name, (kind, description, samples) in families.items():
+        lines.append(f"# HELP {PROMETHEUS_PREFIX}_{name} {description}")
+        lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name} {kind}")
+        lines.extend(samples)
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus(path, records):
+    """寫入 Prometheus 文字格式；先寫入暫存檔再取代，讀取端不會讀到寫到一半的檔案。"""
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'w', encoding='utf-8') as prometheus_file:
+        prometheus_file.write(prometheus_text(records))
+    os.replace(temporary_path, path)
+
+
+def write_profile(profilers, path, top=PROFILE_TOP_FUNCTIONS):
+    """合併一或多個 cProfile 的結果並儲存，顯示累計耗時最多的函數。"""
+    stats = pstats.Stats(profilers[0], stream=io.StringIO())
+    for profiler in profilers[1:]:
+        stats.add(profiler)
+    stats.dump_stats(path)
+    report = io.StringIO()
+    stats.stream = report
+    stats.sort_stats('cumulative').print_stats(top)
+    print(f"效能分析結果已儲存到 {path}，累計耗時最多的 {top} 個函數：")
+    print(report.getvalue().strip())
+
+
+def write_metrics(args, records):
+    """依 --metrics 與 --prometheus 寫入統計。"""
+    if args.metrics:
+        append_jsonl(args.metrics, records)
+    if args.prometheus:
+        write_prometheus(args.prometheus, records)
+
+
+@contextlib.contextmanager
+def stage_metrics(stage, args, metrics=None):
+    """
+    記錄一個階段的執行統計，結束時依 --metrics、--prometheus 與 --profile 寫入檔案。
+    管線中直接呼叫階段時傳入 metrics (由管線統一寫入)，此時只回傳該物件，不另外計時或寫入。
+    """
+    if metrics is not None:
+        yield metrics
+        return
+    metrics = StageMetrics(stage)
+    profiler = None
+    if args.profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    status = 'ok'
+    try:
+        yield metrics
+    except BaseException:
+        status = 'error'
+        raise
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        metrics.finish(status)
+        write_metrics(args, [metrics.to_dict()])
+        if profiler is not None:
+            write_profile([profiler], args.profile)
@@ -0,0 +1,193 @@
+import json
+import re
+
+from lazy_modules import lazy_module
+from place_names import km_markers, normalize_place_name
+
+np = lazy_module('numpy')
+
+# 正規化後地名中的道路編號：台7線、台7甲線、縣道118線、國道3號；只寫「7線」時視為台線
+ROAD_PATTERN = re.compile(r'(台|省道|縣道|鄉道|國道)?(\d+[甲乙丙丁]?)(線|號)')
+
+# 經緯度換算為公尺的地球半徑，道路長度只有數十公里，以等距圓柱投影計算距離已足夠精確
+EARTH_RADIUS_METERS = 6_371_000
+
+
+def road_key(name):
+    """將道路名稱正規化 (臺7線、台 7 線、省道7線 -> 台7線)，無法辨識時回傳 None。"""
+    match = ROAD_PATTERN.search(normalize_place_name(name))
+    if match is None:
+        return None
+    prefix, number, suffix = match.groups()
+    if prefix in (None, '省道'):
+        prefix = '台'
+    return f"{prefix}{number}{suffix}"
+
+
+def parse_marker(name):
+    """
+    解析地名中的里程樁號，回傳 (道路, 公里數)；沒有道路編號時道路為 None。
+    「24k~25k」這類路段以中點表示；沒有樁號或樁號多於兩個時回傳 None。
+    """
+    key = normalize_place_name(name)
+    markers = km_markers(key)
+    if not markers or len(markers) > 2:
+        return None
+    km = sum(float(marker[:-1]) for marker in markers) / len(markers)
+    # 道路編號在樁號之前，避免將「24k」中的數字誤認為道路
+    road_text = key[:key.index(markers[0])]
+    return (road_key(road_text) if road_text else None), km
+
+
+def to_meters(longitudes, latitudes, reference_latitude):
+    """以等距圓柱投影將經緯度換算為平面上的公尺座標。"""
+    scale = np.pi / 180 * EARTH_RADIUS_METERS
+    return np.column_stack([longitudes * scale * np.cos(np.radians(reference_latitude)),
+                            latitudes * scale])
+
+
+class Road:
+    """
+    一條道路的折線與里程樁。chainage 為折線上各頂點距起點的累計距離 (公尺)。
+    有兩個以上的里程樁時，公里數先依樁號內插為折線上的距離 (樁距不必剛好是 1 公里)；
+    否則以 start_km 為起點，公里數直接換算為距離。
+    """
+
+    def __init__(self, name, coordinates, start_km=0.0):
+        self.name = name
+        coordinates = np.asarray(coordinates, dtype=float)
+        self.longitudes = coordinates[:, 0]
+        self.latitudes = coordinates[:, 1]
+        self.reference_latitude = float(self.latitudes.mean())
+        self.points = to_meters(self.longitudes, self.latitudes, self.reference_latitude)
+        segment_lengths = np.hypot(*np.diff(self.points, axis=0).T)
+        self.chainage = np.concatenate([[0.0], np.cumsum(segment_lengths)])
+        self.start_km = start_km
+        self.post_km = np.empty(0)
+        self.post_chainage = np.empty(0)
+
+    @property
+    def length(self):
+        return self.chainage[-1]
+
+    def project(self, longitudes, latitudes):
+        """將多個點投影到折線上最近的位置，回傳其距起點的距離 (公尺)。"""
+        points = to_meters(np.asarray(longitudes, dtype=float), np.asarray(latitudes, dtype=float),
+                           self.reference_latitude)
+        starts, ends = self.points[:-1], self.points[1:]
+        directions = ends - starts
+        squared_lengths = np.where((directions ** 2).sum(axis=1) > 0, (directions ** 2).sum(axis=1), 1.0)
+        # 每個點對每一段的投影位置 (0 ~ 1)，陣列大小為 點數 x 段數
+        offsets = points[:, None, :] - starts[None, :, :]
+        ratios = np.clip((offsets * directions[None, :, :]).sum(axis=2) / squared_lengths, 0.0, 1.0)
+        nearest = starts[None, :, :] + ratios[..., None] * directions[None, :, :]
+        segments = ((points[:, None, :] - nearest) ** 2).sum(axis=2).argmin(axis=1)
+        rows = np.arange(len(points))
+        return self.chainage[segments] + ratios[rows, segments] * np.diff(self.chainage)[segments]
+
+    def set_posts(self, kms, longitudes, latitudes):
+        """設定里程樁 (公里數與座標)，樁的位置投影到折線上。"""
+        order = np.argsort(kms)
+        self.post_km = np.asarray(kms, dtype=float)[order]
+        self.post_chainage = self.project(np.asarray(longitudes)[order], np.asarray(latitudes)[order])
+
+    def locate(self, kms):
+        """將多個公里數內插為 (緯度陣列, 經度陣列)，超出里程樁或折線範圍的為 NaN，不外插。"""
+        kms = np.asarray(kms, dtype=float)
+        if len(self.post_km) >= 2:
+            distances = np.interp(kms, self.post_km, self.post_chainage, left=np.nan, right=np.nan)
+        else:
+            distances = (kms - self.start_km) * 1000
+            distances[(distances < 0) | (distances > self.length)] = np.nan
+        latitudes = np.interp(distances, self.chainage, self.latitudes)
+        longitudes = np.interp(distances, self.chainage, self.longitudes)
+        missing = np.isnan(distances)
+        latitudes[missing] = np.nan
+        longitudes[missing] = np.nan
+        return latitudes, longitudes
+
+
+class MilepostLocator:
+    """
+    離線的里程樁號定位：由本機的 GeoJSON 檔案載入道路折線與里程樁，
+    將「台7線24k」、「28.7K」這類地名沿著道路內插出座標，不需要呼叫地圖 API。
+
+    GeoJSON 中的 LineString (或依序相接的 MultiLineString) 為道路，properties 需有 road (例如「台7線」)，
+    可選 start_km (折線起點的公里數，預設 0)；Point 為里程樁，properties 需有 road 與 km。
+    只寫樁號的地名 (例如「28.7K」) 使用 default_road；未指定且檔案中只有一條道路時使用該道路。
+    """
+
+    def __init__(self, roads, default_road=None):
+        self.roads = {road.name: road for road in roads}
+        if default_road is not None:
+            default_road = road_key(default_road)
+        elif len(self.roads) == 1:
+            default_road = next(iter(self.roads))
+        self.default_road = default_road
+
+    @classmethod
+    def from_geojson(cls, path, default_road=None):
+        with open(path, 'r', encoding='utf-8') as geojson_file:
+            features = json.load(geojson_file).get('features', [])
+        lines, posts = {}, {}
+        for feature in features:
+            geometry = feature.get('geometry') or {}
+            properties = feature.get('properties') or {}
+            name = road_key(str(properties.get('road', '')))
+            if name is None:
+                continue
+            if geometry.get('type') == 'LineString':
+                parts = [geometry['coordinates']]
+            elif geometry.get('type') == 'MultiLineString':
+                parts = geometry['coordinates']
+            elif geometry.get('type') == 'Point' and properties.get('km') is not None:
+                posts.setdefault(name, []).append((float(properties['km']), *geometry['coordinates'][:2]))
+                continue
+            else:
+                continue
+            coordinates, start_km = lines.setdefault(name, ([], float(properties.get('start_km', 0))))
+            for part in parts:
+                # 相接的折線共用端點，只保留一次
+                coordinates.extend(part[1:] if coordinates and coordinates[-1] == part[0] else part)
+
+        roads = []
+        for name, (coordinates, start_km) in lines.items():
+            road = Road(name, [point[:2] for point in coordinates], start_km)
+            if len(posts.get(name, [])) >= 2:
+                kms, longitudes, latitudes = zip(*posts[name])
+                road.set_posts(kms, longitudes, latitudes)
+            roads.append(road)
+        return cls(roads, default_road)
+
+    def locate_many(self, names):
+        """
+        將多個地名定位，回傳 {地名: (道路, 公里數, 緯度, 經度)}；
+        沒有里程樁號、道路不在檔案中或超出範圍的地名不列入。同一道路的樁號一次內插。
+        """
+        by_road = {}
+        for name in dict.fromkeys(names):
+            marker = parse_marker(name)
+            if marker is None:
+                continue
+            road, km = marker
+            road = road or self.default_road
+            if road in self.roads:
+                by_road.setdefault(road, []).append((name, km))
+
+        located = {}
+        for road, markers in by_road.items():
+            kms = [km for _, km in markers]
+            latitudes, longitudes = self.roads[road].locate(kms)
+            for (name, km), latitude, longitude in zip(markers, latitudes, longitudes):
+                if not np.isnan(latitude):
+                    located[name] = (road, km, round(float(latitude), 6), round(float(longitude), 6))
+        return located
+
+    def locate(self, name):
+        """定位單一地名，回傳 (道路, 公里數, 緯度, 經度)，無法定位時回傳 None。"""
+        return self.locate_many([name]).get(name)
+
+
+def describe_marker(road, km):
+    """以內插定位的地點在地點數據庫中的建議地名，例如「台7線 24.5K (里程內插)」。"""
+    return f"{road} {km:g}K (里程內插)"
@@ -0,0 +1,583 @@
+import argparse
+import cProfile
+import csv
+import hashlib
+import json
+import os
+import re
+import threading
+from typing import NamedTuple
+
+# 管線不需要互動視窗，03 階段的 plt.show() 在非互動後端下不會阻塞
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
+import pandas as pd  # noqa: E402
+
+from dag import DagRunner  # noqa: E402
+from event_store import event_frame, store_available, store_source_hash, write_event_store  # noqa: E402
+from llm_batch import load_state, save_state  # noqa: E402
+from metrics import (METRICS_HELP, METRICS_USAGE, StageMetrics, add_metrics_arguments, write_metrics,  # noqa: E402
+                     write_profile)
+from milepost import MilepostLocator  # noqa: E402
+from prompt_builder import CSV_HEADER, normalize_date  # noqa: E402
+from rule_extractor import Gazetteer  # noqa: E402
+from stages import load_stage  # noqa: E402
+
+# 各階段的輸出檔案，與 run_all.sh 原本使用的檔名相同
+SUMMARY_FILE = 'output_summary.txt'
+EVENT_LOG_FILE = 'event_log.txt'
+# 事件日誌的欄式儲存檔 (Parquet)，供單獨執行的 03、04、06 階段讀取，需要 pyarrow
+EVENT_STORE_FILE = 'event_log.parquet'
+CHART_FILE = 'chart.png'
+UNIQUE_PLACES_FILE = 'unique_places.csv'
+UPDATED_PLACES_FILE = 'updated_places.csv'
+PLACE_DB_FILE = 'place_db.csv'
+MATCHED_EVENTS_FILE = 'output_matched_events.csv'
+EVENT_MAP_FILE = 'event_map.html'
+
+# 聊天記錄中的日期行 (例如：2024/11/08, Fri)，以位元組比對以便記錄檔案位置
+DATE_HEADER_PATTERN = re.compile(rb'^(\d{4}/\d{2}/\d{2}),')
+
+
+class CustomArgumentParser(argparse.ArgumentParser):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+    def print_help(self, file=None):
+        # 自訂顯示的幫助訊息
+        help_message = f"""使用方法: {self.prog} [-h] -K 金鑰 -L 大語言模型 -P API供應商{{google或openai}} [-I 聊天記錄] [-T 事件分類檔] [-S 系統設定檔] [-H 對話記錄檔案] [-M 地圖金鑰] [-R 地名查詢前綴] [--mileposts 里程樁檔案 [--road 道路]] [--state 狀態檔] [--full] [--workers 同時執行的階段數] {METRICS_USAGE} [02 階段的其他選項 ...]
+
+依序執行 01 ~ 07 階段，每個階段記錄已處理到的位置 (最後日期與內容雜湊)，只處理新增的部分並合併至既有的輸出
+
+選項:
+  -h, --help            顯示此幫助訊息並退出
+  -I INPUT, --input INPUT
+                        聊天記錄檔案 (預設 chat_history.txt)
+  -T TAXONOMY, --taxonomy TAXONOMY
+                        事件分類檔 (預設 event_taxonomy.json)
+  -K KEY, --key KEY     大語言模型的 API 金鑰
+  -L LLM, --llm LLM     大語言模型的名稱 (例如 'gemini-1.5-pro' 或 'gpt-4o')
+  -P {{google,openai}}, --provider {{google,openai}}
+                        選擇使用的 API 供應商 ('google' 或 'openai')
+  -S SYSTEM, --system SYSTEM
+                        系統設定檔 (預設 system_config_供應商.json)
+  -H HISTORY, --history HISTORY
+                        對話記錄檔案 (預設 history_供應商.json)
+  -M MAP_KEY, --map-key MAP_KEY
+                        Google Maps API 金鑰，未提供時略過 05 階段的地點查詢
+  -R REGION, --region REGION
+                        地名查詢前綴
+  --mileposts MILEPOSTS
+                        道路折線與里程樁的 GeoJSON 檔案，里程樁號 (例如「台7線24k」) 沿道路內插座標，不呼叫地圖 API
+  --road ROAD           只寫樁號的地點 (例如「28.7K」) 所在的道路 (例如「台7線」)
+  --state STATE         管線狀態檔 (預設 pipeline_state.json)
+  --full                忽略已記錄的進度，所有階段重新處理全部資料
+  --workers WORKERS     同時執行的階段數 (預設 4)，03 與 04 ~ 07 只依賴事件日誌，會同時執行
+{METRICS_HELP}
+                        管線中每個階段各記錄一筆 (不含 CPU 時間與峰值記憶體)，最後一筆為整個管線；
+                        --profile 分析各階段的執行緒，並改為一次只執行一個階段
+
+其餘選項會直接傳給 02 階段，例如 -C 4000 -F 8 --stream；--rules 先以規則處理格式固定的摘要行
+(地名數據庫新增地名後，02 階段會重新處理全部日期)
+        """
+        print(help_message, file=file)
+
+
+def text_digest(parts):
+    """計算一串文字的 SHA-256 雜湊。"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+
+def file_digest(path):
+    """計算檔案內容的 SHA-256 雜湊，檔案不存在時回傳 None。"""
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def prefix_digest(path, length):
+    """計算檔案前 length 個位元組的雜湊物件，檔案長度不足時回傳 None。"""
+    digest = hashlib.sha256()
+    remaining = length
+    with open(path, 'rb') as file:
+        while remaining > 0:
+            block = file.read(min(remaining, 1024 * 1024))
+            if not block:
+                return None
+            digest.update(block)
+            remaining -= len(block)
+    return digest
+
+
+def group_by_day(records, date_of):
+    """
+    將依序排列的資料 (摘要行或事件列) 依日期分組，回傳 [(YYYY-MM-DD, [資料, ...]), ...]。
+    無法辨識日期的資料歸入前一組，因此分組後依位置切分時不會遺失。
+    """
+    days = []
+    for record in records:
+        date = normalize_date(date_of(record))
+        if days and (date is None or days[-1][0] == date):
+            days[-1][1].append(record)
+        else:
+            days.append((date or '', [record]))
+    return days
+
+
+def day_digest(days):
+    """計算多個日期分組的內容雜湊。"""
+    return text_digest(f"{date}\t{record}" for date, records in days for record in records)
+
+
+def make_watermark(days):
+    """
+    記錄已處理到的位置：處理過的日期數、最後日期，以及全部內容與最後一天以前內容的雜湊。
+    聊天記錄每天都會追加，最後一天的內容在下次匯出時可能增加，因此另外保留不含最後一天的雜湊。
+    """
+    return {
+        'days': len(days),
+        'last_date': days[-1][0] if days else None,
+        'through_hash': day_digest(days),
+        'settled_hash': day_digest(days[:-1]),
+    }
+
+
+def plan_delta(days, watermark):
+    """
+    比對進度記錄，回傳需要重新處理的第一個日期分組的索引。
+    已處理的部分完全相同時只處理新的日期；只有最後一天改變時從最後一天開始；其餘情況全部重新處理。
+    """
+    if not watermark or len(days) < watermark['days']:
+        return 0
+    count = watermark['days']
+    if day_digest(days[:count]) == watermark['through_hash']:
+        return count
+    if count > 0 and day_digest(days[:count - 1]) == watermark['settled_hash']:
+        return count - 1
+    return 0
+
+
+def cut_before(records, start_date, date_of):
+    """保留第一筆日期不早於 start_date 的資料之前的所有資料，其後的部分將由本次的結果取代。"""
+    if start_date is None:
+        return list(records)
+    for index, record in enumerate(records):
+        date = normalize_date(date_of(record))
+        if date is not None and date >= start_date:
+            return records[:index]
+    return list(records)
+
+
+def read_lines(path):
+    """讀取檔案中的非空白行，檔案不存在時回傳空串列。"""
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as file:
+        return [line for line in file.read().splitlines() if line.strip()]
+
+
+def write_lines(path, lines, header=None):
+    """寫入多行文字，先寫入暫存檔再取代，避免中斷時留下不完整的輸出。"""
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'w', encoding='utf-8', newline='') as file:
+        file.write('\n'.join([header, *lines] if header is not None else lines))
+        if header is not None:
+            file.write('\n')
+    os.replace(temporary_path, path)
+
+
+def summary_date(line):
+    return line.split('，', 1)[0]
+
+
+def csv_date(line):
+    return line.split(',', 1)[0]
+
+
+def matched_event_date(event):
+    # 06 階段的描述欄位格式為「日期_事件類型_地點_額外說明」
+    return event['description'].split('_', 1)[0]
+
+
+class EventTable(NamedTuple):
+    """解析一次後在各階段之間傳遞的事件日誌：原始資料列、依日期的分組與 DataFrame。"""
+    rows: list
+    days: list
+    frame: pd.DataFrame
+
+    def delta_records(self, start):
+        """回傳第 start 個日期分組之後的事件 (DataFrame)，供 04 ~ 06 階段處理。"""
+        count = sum(len(records) for _, records in self.days[start:])
+        return self.frame.iloc[len(self.rows) - count:]
+
+
+class Pipeline:
+    """
+    增量執行 01 ~ 07 階段。每個階段記錄自己輸入的進度與雜湊，只處理新增或改變的日期，
+    再將結果合併至既有的輸出；輸入完全沒有改變的階段直接略過。
+    各階段是 DAG 的節點，只依賴事件日誌的 03 與 04 ~ 07 兩個分支同時執行，
+    解析過的表格直接在記憶體中傳給下一個階段，輸出檔案仍照常寫入。
+    """
+
+    def __init__(self, args, extract_argv, state_path, full=False, max_workers=4, profile=False):
+        self.args = args
+        self.extract_argv = extract_argv
+        self.state_path = state_path
+        self.state = {} if full else (load_state(state_path) or {})
+        self.max_workers = max_workers
+        self._state_lock = threading.Lock()
+        # 各節點的執行統計與效能分析 (cProfile 只分析啟用它的執行緒，因此在節點的執行緒中啟用)
+        self.profile = profile
+        self.node_metrics = {}
+        self.profilers = []
+        self.milepost_locator = None
+        self.milepost_hash = None
+        if args.mileposts:
+            self.milepost_locator = MilepostLocator.from_geojson(args.mileposts, args.road)
+            self.milepost_hash = text_digest([file_digest(args.mileposts), args.road or ''])
+
+    def save(self, stage, **values):
+        with self._state_lock:
+            self.state[stage] = values
+            save_state(self.state_path, self.state)
+
+    def build_graph(self):
+        graph = DagRunner(self.max_workers)
+        graph.add('01 清理聊天記錄', self.metered('01', self.clean))
+        graph.add('02 提取事件', self.metered('02', self.extract), ['01 清理聊天記錄'])
+        graph.add('解析事件日誌', self.metered('parse', self.load_events), ['02 提取事件'])
+        graph.add('03 繪製趨勢圖', self.metered('03', self.chart), ['解析事件日誌'])
+        graph.add('04-05 地點識別與座標查詢', self.metered('04-05', self.places), ['解析事件日誌'])
+        graph.add('06 匯出事件地點', self.metered('06', self.export),
+                  ['解析事件日誌', '04-05 地點識別與座標查詢'])
+        graph.add('07 輸出事件地圖', self.metered('07', self.render_map), ['06 匯出事件地點'])
+        return graph
+
+    def metered(self, stage, func):
+        """包裝節點的函式：記錄該節點的執行統計 (傳入 metrics 參數)，需要時在節點的執行緒中進行效能分析。"""
+        def run(*results):
+            metrics = self.node_metrics[stage] = StageMetrics(stage, measure_process=False)
+            profiler = cProfile.Profile() if self.profile else None
+            status = 'ok'
+            try:
+                if profiler is not None:
+                    profiler.enable()
+                return func(*results, metrics=metrics)
+            except BaseException:
+                status = 'error'
+                raise
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+                    with self._state_lock:
+                        self.profilers.append(profiler)
+                metrics.finish(status)
+        return run
+
+    def run(self):
+        graph = self.build_graph()
+        graph.run()
+        print("管線完成，各階段耗時：")
+        print(graph.report())
+        return graph
+
+    def log(self, stage, message):
+        print(f"[{stage}] {message}")
+
+    def clean(self, metrics):
+        """
+        01 階段：聊天記錄只會在檔尾追加，因此記錄最後一個日期行的檔案位置與之前內容的雜湊。
+        之前的內容未改變時，直接從該日期行開始解析，並取代摘要中該日期以後的部分。
+        回傳摘要的各行，未改變時回傳 None。
+        """
+        clean_stage = load_stage(1)
+        chat_path = self.args.input
+        taxonomy_path = self.args.taxonomy if os.path.exists(self.args.taxonomy) else None
+        taxonomy = clean_stage.load_taxonomy(taxonomy_path) if taxonomy_path else clean_stage.DEFAULT_TAXONOMY
+        config_hash = text_digest([json.dumps(taxonomy, ensure_ascii=False, sort_keys=True)])
+
+        watermark = self.state.get('clean')
+        offset, digest = 0, hashlib.sha256()
+        if (watermark and watermark['config_hash'] == config_hash and os.path.exists(SUMMARY_FILE)
+                and os.path.getsize(chat_path) >= watermark['offset']):
+            previous = prefix_digest(chat_path, watermark['offset'])
+            if previous is not None and previous.hexdigest() == watermark['prefix_hash']:
+                if file_digest(chat_path) == watermark['input_hash']:
+                    self.log('01', "聊天記錄未改變，略過")
+                    return None
+                offset, digest = watermark['offset'], previous
+
+        # 逐行解析新增的部分，同時記錄最後一個日期行的位置與其之前內容的雜湊
+        last_header = {'offset': offset, 'digest': digest.copy()}
+
+        def delta_lines(file):
+            position = offset
+            for raw_line in file:
+                if DATE_HEADER_PATTERN.match(raw_line):
+                    last_header.update(offset=position, digest=digest.copy())
+                digest.update(raw_line)
+                position += len(raw_line)
+                yield raw_line.decode('utf-8')
+
+        with open(chat_path, 'rb') as chat_file:
+            chat_file.seek(offset)
+            events_by_date = clean_stage.collect_events(
+                clean_stage.iter_events(metrics.counted(delta_lines(chat_file)), taxonomy))
+        new_lines = [line for line in clean_stage.format_event_summary(events_by_date).splitlines() if line]
+        metrics.add_rows(rows_out=len(new_lines))
+
+        # offset 指向的日期行會重新解析，因此摘要中從該日期開始的部分由本次結果取代
+        start_date = None
+        if offset:
+            with open(chat_path, 'rb') as chat_file:
+                chat_file.seek(offset)
+                start_date = normalize_date(
+                    DATE_HEADER_PATTERN.match(chat_file.readline()).group(1).decode())
+        kept = cut_before(read_lines(SUMMARY_FILE), start_date, summary_date) if offset else []
+        write_lines(SUMMARY_FILE, kept + new_lines)
+
+        self.save('clean', offset=last_header['offset'], prefix_hash=last_header['digest'].hexdigest(),
+                  input_hash=digest.hexdigest(), config_hash=config_hash)
+        mode = f"從 {start_date} 開始增量處理" if offset else "完整處理"
+        self.log('01', f"{mode}，保留 {len(kept)} 行，新增 {len(new_lines)} 行摘要")
+        return kept + new_lines
+
+    def rule_argv(self):
+        """使用 --rules 時，規則與 01 階段使用相同的事件分類檔。"""
+        return ['--taxonomy', self.args.taxonomy] if '--rules' in self.extract_argv else []
+
+    def rule_config(self):
+        """
+        使用 --rules 時 02 階段的結果也取決於地名數據庫中的地名 (05 階段會持續新增)，
+        因此將地名集合的雜湊列入 02 階段的設定：地名改變後重新處理全部日期，增量結果才會與完整處理相同。
+        """
+        if '--rules' not in self.extract_argv:
+            return []
+        option_parser = argparse.ArgumentParser(add_help=False)
+        option_parser.add_argument('--place-db', default=PLACE_DB_FILE)
+        place_db = option_parser.parse_known_args(self.extract_argv)[0].place_db
+        return [*self.rule_argv(), Gazetteer.from_place_db(place_db).digest()]
+
+    def extract(self, summary_lines, metrics):
+        """
+        02 階段：只將新增或改變的日期送給大語言模型，並取代事件日誌中這些日期以後的資料列。
+        回傳事件日誌的資料列，未改變時回傳 None。
+        """
+        args = self.args
+        with open(args.system, 'rb') as system_file, open(args.history, 'rb') as history_file:
+            config_hash = text_digest([args.provider, args.llm, *self.extract_argv, *self.rule_config(),
+                                       hashlib.sha256(system_file.read()).hexdigest(),
+                                       hashlib.sha256(history_file.read()).hexdigest()])
+        if summary_lines is None:
+            summary_lines = read_lines(SUMMARY_FILE)
+        days = group_by_day(summary_lines, summary_date)
+        watermark = self.state.get('extract')
+        if not (watermark and watermark['config_hash'] == config_hash and os.path.exists(EVENT_LOG_FILE)):
+            watermark = None
+        start = plan_delta(days, watermark)
+        if watermark and start == len(days) == watermark['days']:
+            self.log('02', "事件摘要未改變，略過")
+            return None
+
+        delta = days[start:]
+        kept = cut_before(parse_event_rows(EVENT_LOG_FILE), delta[0][0] if delta else None, csv_date) \
+            if start else []
+        new_rows = []
+        if delta:
+            # 輸出檔名固定，--stream --resume 與 --batch 的進度檔在中斷後重新執行時仍然有效
+            delta_input = EVENT_LOG_FILE + '.delta-input'
+            delta_output = EVENT_LOG_FILE + '.delta'
+            write_lines(delta_input, [record for _, records in delta for record in records])
+            load_stage(2).main(['-K', args.key, '-L', args.llm, '-S', args.system, '-H', args.history,
+                                '-I', delta_input, '-O', delta_output, '-P', args.provider,
+                                *self.extract_argv, *self.rule_argv()], metrics=metrics)
+            new_rows = parse_event_rows(delta_output)
+            os.remove(delta_input)
+            os.remove(delta_output)
+        write_lines(EVENT_LOG_FILE, kept + new_rows, header=CSV_HEADER)
+
+        self.save('extract', config_hash=config_hash, **make_watermark(days))
+        self.log('02', f"送出 {len(delta)}/{len(days)} 天，保留 {len(kept)} 列，新增 {len(new_rows)} 列")
+        return kept + new_rows
+
+    def load_events(self, rows, metrics):
+        """將事件日誌解析一次，之後的階段共用同一個表格，不再各自讀取與解析檔案。"""
+        if rows is None:
+            rows = parse_event_rows(EVENT_LOG_FILE)
+        frame = event_frame(rows)
+        metrics.add_rows(rows_in=len(rows), rows_out=len(frame))
+        if store_available():
+            # 事件日誌改變時重新寫入儲存檔，單獨執行的階段不需要再解析 CSV
+            source_hash = file_digest(EVENT_LOG_FILE)
+            if source_hash is not None and store_source_hash(EVENT_STORE_FILE) != source_hash:
+                write_event_store(EVENT_STORE_FILE, frame, source_hash)
+                self.log('02', f"已寫入 {EVENT_STORE_FILE} ({len(frame)} 列)")
+        return EventTable(rows, group_by_day(rows, csv_date), frame)
+
+    def chart(self, events, metrics):
+        """03 階段：趨勢圖涵蓋全部日期，事件日誌改變時重新繪製 (不需要呼叫 API)。"""
+        input_hash = file_digest(EVENT_LOG_FILE)
+        watermark = self.state.get('chart')
+        if watermark and watermark['input_hash'] == input_hash and os.path.exists(CHART_FILE):
+            self.log('03', "事件日誌未改變，略過")
+            return
+        load_stage(3).plot_event_data(events.frame, CHART_FILE, "事件發生頻率", metrics=metrics)
+        self.save('chart', input_hash=input_hash)
+        self.log('03', f"已重新繪製 {CHART_FILE}")
+
+    def places(self, events, metrics):
+        """04、05 階段：只找出新事件中的地點，已在地點資料庫中的地名不會再呼叫 API。"""
+        days = events.days
+        config_hash = text_digest([self.args.region])
+        watermark = self.state.get('places')
+        if not (watermark and watermark['config_hash'] == config_hash
+                and watermark.get('milepost_hash') == self.milepost_hash):
+            watermark = None
+        start = plan_delta(days, watermark)
+        if watermark and start == len(days) == watermark['days']:
+            self.log('04-05', "事件日誌未改變，略過")
+            return
+        if not self.args.map_key:
+            # 不記錄進度，提供金鑰後會再處理這些日期
+            self.log('04-05', "未提供地圖 API 金鑰，略過座標查詢")
+            return
+
+        delta = events.delta_records(start)
+        locations_stage = load_stage(4)
+        unique_places = locations_stage.collect_unique_places(delta['地點'])
+        locations_stage.save_unique_places(UNIQUE_PLACES_FILE, unique_places)
+        if unique_places:
+            load_stage(5).update_places(self.args.map_key, pd.DataFrame({'地名': unique_places}),
+                                        UPDATED_PLACES_FILE, self.args.region, PLACE_DB_FILE,
+                                        milepost_locator=self.milepost_locator, metrics=metrics)
+
+        self.save('places', config_hash=config_hash, milepost_hash=self.milepost_hash, **make_watermark(days))
+        self.log('04-05', f"處理 {len(days) - start}/{len(days)} 天的 {len(delta)} 列，"
+                          f"新事件中有 {len(unique_places)} 個地點")
+
+    def export(self, events, _places, metrics):
+        """
+        06 階段：只匯出新日期的事件。地點資料庫或里程樁檔案改變時 (例如新地點補上了舊事件的座標)，
+        已匯出的事件可能受影響，因此全部重新匯出；這只是本機的比對，不會呼叫 API。
+        回傳全部匯出的事件，未改變時回傳 None。
+        """
+        if not os.path.exists(PLACE_DB_FILE) and self.milepost_locator is None:
+            self.log('06', f"找不到 {PLACE_DB_FILE}，略過")
+            return None
+        days = events.days
+        place_db_hash = file_digest(PLACE_DB_FILE)
+        watermark = self.state.get('export')
+        if not (watermark and watermark['place_db_hash'] == place_db_hash
+                and watermark.get('milepost_hash') == self.milepost_hash
+                and os.path.exists(MATCHED_EVENTS_FILE)):
+            watermark = None
+        start = plan_delta(days, watermark)
+        if watermark and start == len(days) == watermark['days']:
+            self.log('06', "事件日誌與地點資料庫未改變，略過")
+            return None
+
+        export_stage = load_stage(6)
+        delta = days[start:]
+        kept = []
+        if start:
+            with open(MATCHED_EVENTS_FILE, 'r', encoding='utf-8', newline='') as matched_file:
+                kept = cut_before(list(csv.DictReader(matched_file)), delta[0][0] if delta else None,
+                                  matched_event_date)
+        place_data = (export_stage.load_place_data(PLACE_DB_FILE) if os.path.exists(PLACE_DB_FILE)
+                      else pd.DataFrame(columns=export_stage.PLACE_COLUMNS))
+        matched = export_stage.join_places(events.delta_records(start), place_data, self.milepost_locator)
+        exported = pd.concat([pd.DataFrame(kept, columns=export_stage.OUTPUT_COLUMNS),
+                              export_stage.format_events(matched)], ignore_index=True)
+        export_stage.save_to_csv(MATCHED_EVENTS_FILE, exported)
+        metrics.add_rows(rows_in=len(events.delta_records(start)), rows_out=len(matched))
+
+        self.save('export', place_db_hash=place_db_hash, milepost_hash=self.milepost_hash,
+                  **make_watermark(days))
+        self.log('06', f"匯出 {len(delta)}/{len(days)} 天，保留 {len(kept)} 列，新增 {len(matched)} 列 "
+                       f"(其中 {export_stage.count_recovered(matched)} 列來自多地點的'地點'欄位)")
+        return exported
+
+    def render_map(self, matched_events, metrics):
+        """07 階段：地圖由全部事件地點產生，匯出的事件改變時重新輸出。"""
+        if not os.path.exists(MATCHED_EVENTS_FILE):
+            self.log('07', f"找不到 {MATCHED_EVENTS_FILE}，略過")
+            return
+        input_hash = file_digest(MATCHED_EVENTS_FILE)
+        watermark = self.state.get('map')
+        if watermark and watermark['input_hash'] == input_hash and os.path.exists(EVENT_MAP_FILE):
+            self.log('07', "匯出的事件未改變，略過")
+            return
+        if matched_events is None:
+            frame = pd.read_csv(MATCHED_EVENTS_FILE)
+        else:
+            # 與讀取 CSV 檔案相同，經緯度轉為數值，空白為 NaN
+            frame = pd.DataFrame(matched_events, columns=['name', 'longitude', 'latitude', 'description'])
+            for column in ('longitude', 'latitude'):
+                frame[column] = pd.to_numeric(frame[column], errors='coerce')
+        load_stage(7).build_event_map(frame).save(EVENT_MAP_FILE)
+        metrics.add_rows(rows_in=len(frame))
+        metrics.add_count('map_files', 1)
+        self.save('map', input_hash=input_hash)
+        self.log('07', f"已重新輸出 {EVENT_MAP_FILE}")
+
+
+def parse_event_rows(path):
+    """讀取事件日誌的資料列 (不含表頭)，略過程式碼區塊標記與空行。"""
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as file:
+        return load_stage(2).parse_csv_rows(file.read())
+
+
+def main(argv=None):
+    # 使用 CustomArgumentParser 處理命令列參數，未定義的選項傳給 02 階段
+    parser = CustomArgumentParser(description="增量執行事件處理管線")
+    parser.add_argument('-I', '--input', default='chat_history.txt', help="聊天記錄檔案")
+    parser.add_argument('-T', '--taxonomy', default='event_taxonomy.json', help="事件分類檔 (JSON 格式)")
+    parser.add_argument('-K', '--key', required=True, help="大語言模型的 API 金鑰")
+    parser.add_argument('-L', '--llm', required=True,
+                        help="大語言模型的名稱 (例如 'gemini-1.5-pro' 或 'gpt-4o')")
+    parser.add_argument('-P', '--provider', required=True, choices=['google', 'openai'],
+                        help="選擇使用的 API 供應商 ('google' 或 'openai')")
+    parser.add_argument('-S', '--system', help="系統設定檔 (預設 system_config_供應商.json)")
+    parser.add_argument('-H', '--history', help="對話記錄檔案 (預設 history_供應商.json)")
+    parser.add_argument('-M', '--map-key', help="Google Maps API 金鑰")
+    parser.add_argument('-R', '--region', default='', help="地名查詢前綴")
+    parser.add_argument('--mileposts', help="道路折線與里程樁的 GeoJSON 檔案")
+    parser.add_argument('--road', help="只寫樁號的地點所在的道路")
+    parser.add_argument('--state', default='pipeline_state.json', help="管線狀態檔")
+    parser.add_argument('--full', action='store_true', help="忽略已記錄的進度，重新處理全部資料")
+    parser.add_argument('--workers', type=int, default=4, help="同時執行的階段數")
+    add_metrics_arguments(parser)
+
+    args, extract_argv = parser.parse_known_args(argv)
+    args.system = args.system or f"system_config_{args.provider}.json"
+    args.history = args.history or f"history_{args.provider}.json"
+
+    # 效能分析時一次只執行一個階段，各階段的分析結果互不干擾
+    pipeline = Pipeline(args, extract_argv, args.state, full=args.full,
+                        max_workers=1 if args.profile else args.workers, profile=bool(args.profile))
+    total = StageMetrics('pipeline')
+    status = 'ok'
+    try:
+        return pipeline.run()
+    except BaseException:
+        status = 'error'
+        raise
+    finally:
+        total.finish(status)
+        write_metrics(args, [metrics.to_dict() for metrics in pipeline.node_metrics.values()] + [total.to_dict()])
+        if pipeline.profilers:
+            write_profile(pipeline.profilers, args.profile)
+
+
+if __name__ == "__main__":
+    main()
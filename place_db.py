@@ -0,0 +1,70 @@
+import csv
+import os
+
+# 地點資料庫 (place_db.csv) 的欄位，以 '|' 分隔
+PLACE_DB_COLUMNS = ['地名', '搜尋關鍵地名', '建議地名', '緯度', '經度']
+PLACE_DB_DELIMITER = '|'
+
+
+class PlaceDatabase:
+    """
+    以地名為索引的地點資料庫。
+    載入時將檔案讀入以地名為鍵值的字典，查詢為 O(1)；新增的地點只附加在檔尾，不會重寫整個檔案。
+    檔案格式與原本相同 ('|' 分隔的 CSV)，06 階段與既有的資料庫檔案都不需要修改。
+    同一地名出現多次時以第一筆為準，與原本取第一筆符合資料的行為相同。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._records = {}
+        self._pending = []
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8', newline='') as db_file:
+                for row in csv.DictReader(db_file, delimiter=PLACE_DB_DELIMITER):
+                    self._records.setdefault(row['地名'], row)
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, name):
+        return name in self._records
+
+    def get(self, name):
+        """取得地名的資料 (以欄位名稱為鍵值的字典)，不存在時回傳 None。"""
+        return self._records.get(name)
+
+    def records(self):
+        """依載入與新增的順序回傳所有地點資料。"""
+        return list(self._records.values())
+
+    def add(self, record):
+        """新增地點資料，已存在的地名不會被取代；呼叫 flush() 後才會寫入檔案。"""
+        name = record['地名']
+        if name in self._records:
+            return False
+        record = {column: record.get(column, '') for column in PLACE_DB_COLUMNS}
+        self._records[name] = record
+        self._pending.append(record)
+        return True
+
+    def flush(self):
+        """將新增的地點附加至檔尾，檔案不存在或為空時先寫入表頭。回傳寫入的筆數。"""
+        if not self._pending:
+            return 0
+        new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        missing_newline = False
+        if not new_file:
+            with open(self.path, 'rb') as db_file:
+                db_file.seek(-1, os.SEEK_END)
+                missing_newline = db_file.read(1) not in (b'\n', b'\r')
+        with open(self.path, 'a', encoding='utf-8', newline='') as db_file:
+            if missing_newline:
+                db_file.write('\n')
+            writer = csv.DictWriter(db_file, fieldnames=PLACE_DB_COLUMNS,
+                                    delimiter=PLACE_DB_DELIMITER, lineterminator='\n')
+            if new_file:
+                writer.writeheader()
+            writer.writerows(self._pending)
+        written = len(self._pending)
+        self._pending = []
+        return written
@@ -0,0 +1,112 @@
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from decimal import Decimal
+
+# 里程樁號：37.7K、37.7 公里、37K+700 (37 公里加 700 公尺)，正規化後皆為 37.7k
+KM_PLUS_PATTERN = re.compile(r'(\d+)k\+(\d{1,3})(?!\d)')
+KM_PATTERN = re.compile(r'(\d+(?:\.\d+)?)(?:km|k|公里)')
+CANONICAL_KM_PATTERN = re.compile(r'\d+(?:\.\d+)?k')
+NUMBER_PATTERN = re.compile(r'\d+(?:\.\d+)?')
+
+# 常見的異體字，統一為較常用的寫法
+VARIANT_CHARACTERS = str.maketrans({'臺': '台'})
+
+# 不影響地名的字元：空白與常見的分隔符號
+IGNORED_CHARACTERS = re.compile(r'[\s·・,、]+')
+
+
+def format_km(value):
+    """將公里數格式化為最短的寫法 (37.70 -> 37.7，37.0 -> 37)。"""
+    text = format(Decimal(value), 'f')
+    if '.' in text:
+        text = text.rstrip('0').rstrip('.')
+    return f"{text}k"
+
+
+def normalize_place_name(name):
+    """
+    將地名正規化，拼寫不同但指同一地點的寫法會得到相同的結果：
+    Unicode NFKC (全形英數轉半形)、大小寫統一、移除空白與分隔符號、異體字統一、里程樁號統一為 37.7k。
+    """
+    text = unicodedata.normalize('NFKC', str(name)).casefold()
+    text = IGNORED_CHARACTERS.sub('', text).translate(VARIANT_CHARACTERS)
+    text = KM_PLUS_PATTERN.sub(
+        lambda match: format_km(Decimal(match.group(1)) + Decimal(match.group(2)) / 1000), text)
+    return KM_PATTERN.sub(lambda match: format_km(match.group(1)), text)
+
+
+def km_markers(key):
+    """正規化地名中的里程樁號。"""
+    return CANONICAL_KM_PATTERN.findall(key)
+
+
+def name_ngrams(key, size=2):
+    """正規化地名的字元 n-gram 集合，地名多為短的中文字串，預設使用二元組。"""
+    if len(key) <= size:
+        return {key}
+    return {key[index:index + size] for index in range(len(key) - size + 1)}
+
+
+class PlaceNameIndex:
+    """
+    地名的相似度索引，用於在呼叫 API 前找出已查過的同一地點。依序嘗試：
+
+    1. 正規化後完全相同 (例如「台7線 37.7K」與「臺7線37.7k」)。
+    2. 只有里程樁號 (例如「37.7K」)，而已知地名中只有一條道路有這個樁號。
+    3. 字元二元組的 Dice 相似度不低於 threshold，且地名中的數字完全相同，
+       避免「37.7k」與「37.8k」這類只差在數字的不同地點被視為同一地點。
+    """
+
+    def __init__(self, names=(), threshold=0.85):
+        self.threshold = threshold
+        self._names = {}
+        self._ngrams = {}
+        self._by_marker = defaultdict(set)
+        self._by_ngram = defaultdict(set)
+        for name in names:
+            self.add(name)
+
+    def __len__(self):
+        return len(self._names)
+
+    def add(self, name):
+        """加入地名，正規化後相同的地名只保留第一個。"""
+        key = normalize_place_name(name)
+        if not key or key in self._names:
+            return
+        self._names[key] = name
+        self._ngrams[key] = name_ngrams(key)
+        for marker in km_markers(key):
+            self._by_marker[marker].add(key)
+        for ngram in self._ngrams[key]:
+            self._by_ngram[ngram].add(key)
+
+    def lookup(self, name):
+        """回傳 (已知地名, 比對方式)，找不到時回傳 (None, None)。比對方式為 'normalized'、'km' 或 'similar'。"""
+        key = normalize_place_name(name)
+        if not key:
+            return None, None
+        if key in self._names:
+            return self._names[key], 'normalized'
+
+        markers = km_markers(key)
+        if markers and ''.join(markers) == key:
+            candidates = set.intersection(*(self._by_marker.get(marker, set()) for marker in markers))
+            if len(candidates) == 1:
+                return self._names[candidates.pop()], 'km'
+            return None, None
+
+        if self.threshold >= 1:
+            return None, None
+        ngrams = name_ngrams(key)
+        numbers = NUMBER_PATTERN.findall(key)
+        shared = Counter(candidate for ngram in ngrams for candidate in self._by_ngram.get(ngram, ()))
+        best, best_score = None, 0.0
+        for candidate, count in shared.items():
+            score = 2 * count / (len(ngrams) + len(self._ngrams[candidate]))
+            if score >= self.threshold and score > best_score and NUMBER_PATTERN.findall(candidate) == numbers:
+                best, best_score = candidate, score
+        if best is None:
+            return None, None
+        return self._names[best], 'similar'
@@ -0,0 +1,225 @@
+import re
+from typing import NamedTuple
+
+# 事件日誌 (CSV) 的表頭
+CSV_HEADER = "日期,事件類型,地點,額外說明"
+
+# 中日韓文字大約一字一個 token，其餘字元 (英數、標點) 大約四個字元一個 token
+CJK_PATTERN = re.compile(r'[\u3000-\u9fff\uf900-\ufaff\uff00-\uffef]')
+
+# 摘要中的日期可能是 2023/05/29 或 05/29/2023，事件日誌中則是 2023-05-29
+DATE_PATTERNS = (
+    (re.compile(r'^(\d{4})[/-](\d{2})[/-](\d{2})$'), (1, 2, 3)),
+    (re.compile(r'^(\d{2})/(\d{2})/(\d{4})$'), (3, 1, 2)),
+)
+
+# 系統指令中的範例段落，從「範例：」到「請根據以上要求」之前
+INSTRUCTION_EXAMPLE_PATTERN = re.compile(r'範例：.*?(?=請根據以上要求)', re.DOTALL)
+
+
+def estimate_tokens(text):
+    """粗略估計文字的 token 數量，用於分批與提示詞成本的估算。"""
+    cjk_count = len(CJK_PATTERN.findall(text))
+    return cjk_count + (len(text) - cjk_count + 3) // 4
+
+
+def normalize_date(text):
+    """將各種日期寫法統一為 YYYY-MM-DD，無法辨識時回傳 None。"""
+    text = text.strip()
+    for pattern, (year, month, day) in DATE_PATTERNS:
+        match = pattern.match(text)
+        if match:
+            return f"{match.group(year)}-{match.group(month)}-{match.group(day)}"
+    return None
+
+
+def strip_instruction_example(instruction):
+    """移除系統指令中的完整範例，範例改由對話歷史提供，避免每次請求重複送出。"""
+    return INSTRUCTION_EXAMPLE_PATTERN.sub('', instruction)
+
+
+def message_text(message):
+    """取出對話歷史中一則訊息的文字，支援 Google (parts) 與 OpenAI (content) 兩種格式。"""
+    if 'parts' in message:
+        return '\n'.join(part if isinstance(part, str) else part.get('text', '')
+                         for part in message['parts'])
+    content = message.get('content', '')
+    if isinstance(content, str):
+        return content
+    return '\n'.join(item.get('text', '') for item in content if item.get('type') == 'text')
+
+
+def make_message(provider, role, text):
+    """依 API 供應商的格式建立一則對話歷史訊息。"""
+    if provider == 'google':
+        return {"role": 'model' if role == 'assistant' else role, "parts": [text]}
+    return {"role": role, "content": [{"type": "text", "text": text}]}
+
+
+class FewShotExample(NamedTuple):
+    """從對話歷史中拆出的單日範例：該日期的摘要輸入與對應的表格輸出。"""
+    date: str
+    event_types: frozenset
+    input_text: str
+    output_rows: tuple
+
+
+def summary_event_types(text):
+    """取出摘要中出現的事件類型 (每行第二個欄位)。"""
+    event_types = set()
+    for line in text.splitlines():
+        fields = line.split('，')
+        if len(fields) >= 2 and fields[1].strip():
+            event_types.add(fields[1].strip())
+    return event_types
+
+
+def split_history_examples(history):
+    """
+    將對話歷史中的每一組 (使用者輸入, 模型輸出) 依日期拆成單日範例。
+    歷史中的範例通常涵蓋數百天，拆開後即可只挑選與目前批次相關的日期。
+    """
+    examples = []
+    for user_message, model_message in zip(history[::2], history[1::2]):
+        input_lines = {}
+        for line in message_text(user_message).splitlines():
+            date = normalize_date(line.split('，', 1)[0])
+            if date:
+                input_lines.setdefault(date, []).append(line)
+
+        output_rows = {}
+        for row in message_text(model_message).splitlines():
+            date = normalize_date(row.split(',', 1)[0])
+            if date:
+                output_rows.setdefault(date, []).append(row)
+
+        for date, lines in input_lines.items():
+            input_text = '\n'.join(lines)
+            examples.append(FewShotExample(
+                date=date,
+                event_types=frozenset(summary_event_types(input_text)),
+                input_text=input_text,
+                output_rows=tuple(output_rows.get(date, ())),
+            ))
+    return examples
+
+
+def character_bigrams(text):
+    """文字的字元二元組集合，用於估計中文文字的相似度。"""
+    text = re.sub(r'\s+', '', text)
+    return {text[index:index + 2] for index in range(len(text) - 1)}
+
+
+class PromptBuilder:
+    """
+    依批次內容組合精簡的對話歷史。
+
+    - 先挑出一組固定的「共用範例」涵蓋所有事件類型，放在每個請求的最前面，
+      讓系統指令加上共用範例成為固定的前綴，供應商端的提示詞快取才能生效。
+    - 再為每個批次挑選最相似的單日範例，確保批次中出現的每一種事件類型都至少有一個範例。
+    - 可選擇移除系統指令中重複的完整範例。
+    - format_output 將範例的輸出資料列轉為回應文字 (例如結構化輸出的 JSON)，預設為 CSV 表格。
+    - 統計每個請求實際送出與完整送出時的 token 數量，以計算節省的成本。
+    """
+
+    def __init__(self, history, provider, system_instruction='', max_examples=8,
+                 compact_instruction=False, format_output=None):
+        self.provider = provider
+        self.max_examples = max_examples
+        self.format_output = format_output or (lambda rows: '\n'.join([CSV_HEADER, *rows]))
+        self.system_instruction = (strip_instruction_example(system_instruction)
+                                   if compact_instruction else system_instruction)
+        self.examples = split_history_examples(history)
+        self.history = history if format_output is None else self.reformat_history(history)
+        self._bigrams = [character_bigrams(example.input_text) for example in self.examples]
+
+        # 每種事件類型取第一個範例作為共用前綴，順序固定以維持前綴一致
+        pinned = {}
+        for index, example in enumerate(self.examples):
+            for event_type in sorted(example.event_types):
+                pinned.setdefault(event_type, index)
+        self.pinned = sorted(set(pinned.values()))
+
+        self.original_instruction_tokens = estimate_tokens(system_instruction)
+        self.instruction_tokens = estimate_tokens(self.system_instruction)
+        self.full_history_tokens = sum(estimate_tokens(message_text(message)) for message in self.history)
+        self.requests = 0
+        self.input_tokens = 0
+        self.sent_history_tokens = 0
+
+    def select_examples(self, chunk):
+        """
+        挑選與批次最相關的範例索引 (不含共用範例)，最多 max_examples 個。
+        先確保批次中每種事件類型都有範例，再依字元二元組的相似度補滿。
+        """
+        chunk_bigrams = character_bigrams(chunk)
+        candidates = [index for index in range(len(self.examples)) if index not in self.pinned]
+
+        def similarity(index):
+            example_bigrams = self._bigrams[index]
+            union = len(chunk_bigrams | example_bigrams)
+            return len(chunk_bigrams & example_bigrams) / union if union else 0
+
+        ranked = sorted(candidates, key=lambda index: (-similarity(index), index))
+        selected = []
+        covered = set().union(*(self.examples[index].event_types for index in self.pinned))
+        for event_type in sorted(summary_event_types(chunk) - covered):
+            for index in ranked:
+                if event_type in self.examples[index].event_types:
+                    selected.append(index)
+                    covered |= self.examples[index].event_types
+                    break
+        for index in ranked:
+            if len(selected) >= self.max_examples:
+                break
+            if index not in selected:
+                selected.append(index)
+        # 依原始順序排列，相同的挑選結果就會產生相同的對話歷史
+        return sorted(selected)
+
+    def reformat_history(self, history):
+        """將完整對話歷史中模型的回應 (CSV 表格) 以 format_output 轉換，使用者的輸入不變。"""
+        reformatted = []
+        for message in history:
+            if message.get('role') in ('assistant', 'model'):
+                rows = [row for row in message_text(message).splitlines() if row.strip() and row != CSV_HEADER]
+                message = make_message(self.provider, 'assistant', self.format_output(rows))
+            reformatted.append(message)
+        return reformatted
+
+    def covered_event_types(self, indices):
+        """回傳共用範例加上指定範例所涵蓋的事件類型。"""
+        return set().union(*(self.examples[index].event_types
+                             for index in [*self.pinned, *indices]))
+
+    def build_history(self, indices):
+        """將範例組成對話歷史：共用範例在前，批次專屬的範例在後，每個範例為一組問答。"""
+        history = []
+        for index in [*self.pinned, *indices]:
+            example = self.examples[index]
+            history.append(make_message(self.provider, 'user', example.input_text))
+            history.append(make_message(self.provider, 'assistant', self.format_output(example.output_rows)))
+        return history
+
+    def history_for(self, chunk):
+        """回傳批次使用的對話歷史，並累計 token 統計。max_examples 為 0 時使用完整的對話歷史。"""
+        if self.max_examples > 0:
+            history = self.build_history(self.select_examples(chunk))
+        else:
+            history = self.history
+        self.requests += 1
+        self.input_tokens += estimate_tokens(chunk)
+        self.sent_history_tokens += sum(estimate_tokens(message_text(message)) for message in history)
+        return history
+
+    def report(self):
+        """回傳本次執行的提示詞 token 統計。"""
+        full = (self.requests * (self.original_instruction_tokens + self.full_history_tokens)
+                + self.input_tokens)
+        sent = self.requests * self.instruction_tokens + self.sent_history_tokens + self.input_tokens
+        saved = full - sent
+        ratio = saved / full * 100 if full else 0
+        return (f"提示詞 token 估計：系統指令 {self.instruction_tokens}/請求 "
+                f"(原始 {self.original_instruction_tokens})，"
+                f"完整對話歷史 {self.full_history_tokens}/請求，輸入共 {self.input_tokens}；"
+                f"{self.requests} 個請求實際送出 {sent}，完整送出需 {full}，節省 {saved} ({ratio:.1f}%)")
@@ -0,0 +1,73 @@
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    以權杖桶 (token bucket) 同時限制每分鐘請求數與每分鐘 token 數。
+    桶子以固定速率補充，請求前先取得額度，不足時等待到額度足夠為止。
+    burst 為請求額度的上限 (預設為一分鐘的請求數)，以每秒請求數限制時可設為較小的值以避免瞬間爆量。
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, start_full=True,
+                 clock=time.monotonic, sleep=time.sleep, burst=None):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.burst = burst or requests_per_minute
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        # 桶子一開始是滿的，允許第一分鐘的請求立即送出；start_full=False 則從穩定速率開始
+        self._request_allowance = float(self.burst or 0) if start_full else 0.0
+        self._token_allowance = float(tokens_per_minute or 0) if start_full else 0.0
+        self._updated_at = clock()
+
+    def _refill(self):
+        now = self._clock()
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        if self.requests_per_minute:
+            self._request_allowance = min(
+                self.burst,
+                self._request_allowance + elapsed * self.requests_per_minute / 60)
+        if self.tokens_per_minute:
+            self._token_allowance = min(
+                self.tokens_per_minute,
+                self._token_allowance + elapsed * self.tokens_per_minute / 60)
+
+    def charged_tokens(self, tokens):
+        """
+        回傳請求 tokens 個 token 時實際從桶子扣除的額度：單一請求超過每分鐘上限時，最多等到桶子全滿，
+        因此只扣除一整桶。請求完成後以 consume 補扣差額時，必須以此數值 (而非原本的估計) 計算。
+        """
+        if self.tokens_per_minute:
+            return min(tokens, self.tokens_per_minute)
+        return tokens
+
+    def acquire(self, tokens=0):
+        """取得一次請求與 tokens 個 token 的額度，必要時等待。回傳等待的秒數。"""
+        tokens = self.charged_tokens(tokens)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                wait = 0.0
+                if self.requests_per_minute and self._request_allowance < 1:
+                    wait = max(wait, (1 - self._request_allowance) * 60 / self.requests_per_minute)
+                if self.tokens_per_minute and self._token_allowance < tokens:
+                    wait = max(wait, (tokens - self._token_allowance) * 60 / self.tokens_per_minute)
+                if wait <= 0:
+                    if self.requests_per_minute:
+                        self._request_allowance -= 1
+                    if self.tokens_per_minute:
+                        self._token_allowance -= tokens
+                    return waited
+            self._sleep(wait)
+            waited += wait
+
+    def consume(self, tokens):
+        """請求完成後依實際用量補扣 token 額度 (可為負數以歸還多扣的額度)，不會等待。"""
+        if self.tokens_per_minute and tokens:
+            with self._lock:
+                self._refill()
+                self._token_allowance = min(self.tokens_per_minute, self._token_allowance - tokens)
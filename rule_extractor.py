@@ -0,0 +1,180 @@
+import hashlib
+import json
+import os
+import re
+
+from place_db import PlaceDatabase
+from place_names import normalize_place_name
+from prompt_builder import normalize_date
+
+# 事件摘要每行的格式為「日期，事件類型，訊息1；訊息2；...」
+FIELD_SEPARATOR = '，'
+SEGMENT_SEPARATOR = '；'
+
+# 不影響判斷的裝飾：引號、表情符號與 LINE 的表情文字，例如 (moon smile)
+DECORATION_PATTERN = re.compile('["\u200d\ufe0f\u2600-\u27bf\U0001f000-\U0001faff]|\\([a-z][a-z ]*\\)')
+EDGE_PATTERN = re.compile(r'^[\s，,。.!！~～、…⋯]+|[\s，,。.!！~～、…⋯]+$')
+# 結尾的客套話與提醒，例如「，謝謝」「麻煩您了」「請用路人注意安全」
+POLITE_PATTERN = re.compile(r'(?:[\s，,、]*(?:謝謝(?:你|您|妳)?|感謝|(?:再)?麻煩(?:你|您|妳)?了?|勞煩您了'
+                            r'|請(?:用路人)?(?:注意安全|小心行駛|小心)))+$')
+# 事件回報機器人的訊息，例如「謝謝分享「落石」事件 🙏 已回報事件地圖： ...」
+BOT_MESSAGE_PATTERN = re.compile(r'^謝謝分享「[^」]*」事件')
+ACKNOWLEDGEMENTS = {'收到', '了解', '好的', '+1'}
+
+# 地點與關鍵字之間的連接詞 (「光華也停電」)、關鍵字之後的語助詞 (「楓墅停電了～」)
+CONNECTORS = r'(?:也|又|都|還在|這裡|這邊|剛剛|剛|目前|好像|有)*'
+PARTICLES = r'(?:了|中|囉|喔|哦|嘍|唷|餒|啦|\+1)*'
+# 處理狀態，與對話歷史中的範例相同寫入額外說明，例如「台7線37.7K落石已排除」
+STATUS = r'已(?:經)?(?:立即)?(?:排除|清除|清理)(?:完成|完畢)?'
+
+# 正規化後只有道路編號與里程樁號的地名，例如 台7線37.7k、桃116線6.5k
+MILEPOST_PLACE_PATTERN = re.compile(r'^(?:台|省道|縣道|鄉道|桃)?\d+[甲乙丙丁]?線\d+(?:\.\d+)?k$')
+
+
+def load_taxonomy(path):
+    """讀取事件分類檔 (事件類型 -> 同義詞)，檔案不存在時回傳空的分類 (只以事件類型本身為關鍵字)。"""
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as taxonomy_file:
+        return json.load(taxonomy_file)
+
+
+class Gazetteer:
+    """
+    已知地名的集合，以正規化後的地名比對 (「臺7線 37.7K」與「台7線37.7k」視為相同)。
+    通常由地名數據庫 (05 階段查詢過的地名) 建立，資料庫愈完整，規則能處理的摘要愈多。
+    """
+
+    def __init__(self, names=()):
+        self._keys = {normalize_place_name(name) for name in names if name and name.strip()}
+
+    @classmethod
+    def from_place_db(cls, path):
+        """由地名數據庫的地名建立，檔案不存在時為空的集合。"""
+        return cls(record['地名'] for record in PlaceDatabase(path).records())
+
+    def __len__(self):
+        return len(self._keys)
+
+    def digest(self):
+        """地名集合的雜湊，與地名的順序及座標無關，只有地名增減時才會改變。"""
+        return hashlib.sha256('\n'.join(sorted(self._keys)).encode('utf-8')).hexdigest()
+
+    def __contains__(self, name):
+        return normalize_place_name(name) in self._keys
+
+
+class RuleExtractor:
+    """
+    以規則處理格式固定的摘要行，不需要送給大語言模型。一行摘要只有在每則訊息都屬於下列兩種之一時才由規則處理：
+
+    - 沒有地點的訊息：只有關鍵字 (「停電了」)、事件回報機器人的訊息、「收到」等回應；
+    - 「地點 + 關鍵字 + 處理狀態」：地點必須是已知地名或道路里程 (例如「楓墅停電了～」「台7線37.7K落石已排除」)。
+
+    產生的資料列與對話歷史中的範例相同：每行摘要一列，地點不重複並以分號分隔，處理狀態寫入額外說明；
+    全部都是沒有地點的訊息時依系統指令不產生資料列。其他摘要行 (提問、公告、未知的地名等) 仍交給大語言模型。
+    """
+
+    def __init__(self, gazetteer, taxonomy=None):
+        self.gazetteer = gazetteer
+        self.taxonomy = taxonomy or {}
+        self._patterns = {}
+
+    def patterns(self, event_type):
+        """
+        事件類型的 (只有關鍵字的訊息, 地點 + 關鍵字的訊息) 表達式，依事件類型快取。
+        後者也接受關鍵字在前的寫法，例如「停電了，比該路」。
+        """
+        if event_type not in self._patterns:
+            keywords = sorted({event_type, *self.taxonomy.get(event_type, [])}, key=len, reverse=True)
+            keyword = '(?:' + '|'.join(map(re.escape, keywords)) + ')'
+            self._patterns[event_type] = (
+                re.compile(rf'^(?:又|大)?{keyword}{PARTICLES}$'),
+                re.compile(rf'^(?:(?P<place>.+?){CONNECTORS}{keyword}{PARTICLES}(?P<status>{STATUS})?{PARTICLES}'
+                           rf'|{keyword}{PARTICLES}[，,、]?(?P<trailing_place>[^，,、]+))$'))
+        return self._patterns[event_type]
+
+    def known_place(self, place):
+        return place in self.gazetteer or MILEPOST_PLACE_PATTERN.match(normalize_place_name(place)) is not None
+
+    def parse_segment(self, segment, event_type):
+        """
+        解析一則訊息，回傳 (地點, 處理狀態)；沒有地點的訊息回傳 ('', '')，無法以規則判斷時回傳 None。
+        """
+        text = EDGE_PATTERN.sub('', DECORATION_PATTERN.sub('', segment))
+        text = EDGE_PATTERN.sub('', POLITE_PATTERN.sub('', text))
+        noise_pattern, event_pattern = self.patterns(event_type)
+        if not text or text in ACKNOWLEDGEMENTS or BOT_MESSAGE_PATTERN.match(text) or noise_pattern.match(text):
+            return '', ''
+        match = event_pattern.match(text)
+        if match is None:
+            return None
+        place = match.group('place') or match.group('trailing_place')
+        if not self.known_place(place):
+            return None
+        return place, match.group('status') or ''
+
+    def extract_line(self, line):
+        """
+        處理一行摘要，回傳資料列的清單 (沒有地點時為空的清單)；需要交給大語言模型時回傳 None。
+        """
+        fields = line.split(FIELD_SEPARATOR, 2)
+        if len(fields) != 3:
+            return None
+        date, event_type = normalize_date(fields[0]), fields[1].strip()
+        if date is None or not event_type:
+            return None
+        places, statuses = {}, {}
+        for segment in fields[2].split(SEGMENT_SEPARATOR):
+            parsed = self.parse_segment(segment, event_type)
+            if parsed is None:
+                return None
+            place, status = parsed
+            if place:
+                places[place] = None
+            if status:
+                statuses[status] = None
+        if not places:
+            return []
+        return [[date, event_type, ';'.join(places), ';'.join(statuses)]]
+
+    def split(self, summary):
+        """
+        將事件摘要分為規則處理的資料列與需要交給大語言模型的摘要。
+        回傳 (資料列, 剩下的摘要文字, 統計)；統計包含摘要行數、規則處理的行數與其中產生資料列的行數。
+        """
+        rows, remaining = [], []
+        stats = {'lines': 0, 'bypassed': 0, 'with_rows': 0}
+        for line in summary.splitlines():
+            if not line.strip():
+                continue
+            stats['lines'] += 1
+            line_rows = self.extract_line(line)
+            if line_rows is None:
+                remaining.append(line)
+                continue
+            stats['bypassed'] += 1
+            stats['with_rows'] += bool(line_rows)
+            rows.extend(line_rows)
+        return rows, '\n'.join(remaining), stats
+
+
+def bypass_report(stats):
+    lines, bypassed = stats['lines'], stats['bypassed']
+    rate = bypassed / lines * 100 if lines else 0.0
+    return (f"規則處理 {bypassed}/{lines} 行摘要 ({rate:.1f}%)，不需送給大語言模型："
+            f"{stats['with_rows']} 行產生資料列，{bypassed - stats['with_rows']} 行沒有地點")
+
+
+def merge_rows(summary, *row_lists):
+    """
+    依摘要行的順序合併規則與大語言模型產生的資料列 (以日期與事件類型對應摘要行)，
+    對應不到摘要行的資料列排在最後，同一摘要行的資料列保持原本的順序。
+    """
+    order = {}
+    for line in summary.splitlines():
+        fields = line.split(FIELD_SEPARATOR, 2)
+        if len(fields) >= 2:
+            order.setdefault((normalize_date(fields[0]), fields[1].strip()), len(order))
+    rows = [row for row_list in row_lists for row in row_list]
+    return sorted(rows, key=lambda row: order.get((row[0], row[1]), len(order)))
@@ -0,0 +1,216 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import runpy
+import secrets
+import sys
+import time
+import traceback
+from multiprocessing.connection import Client, Listener
+
+from lazy_modules import module_available
+from stages import ROOT_DIR, load_stage, stage_path
+
+# 常駐程序的位址與驗證金鑰 (每次啟動隨機產生)，只有能讀取此檔案的使用者可以送出工作
+WORKER_INFO_FILE = os.path.join(ROOT_DIR, '.stage_worker.json')
+WORKER_HOST = '127.0.0.1'
+
+# 常駐程序啟動時預先載入的模組，各階段延遲載入的套件在第一個工作前就已載入；未安裝的套件略過
+PRELOAD_MODULES = [
+    'numpy', 'pandas', 'pyarrow', 'pyarrow.compute', 'pyarrow.parquet',
+    'matplotlib', 'matplotlib.pyplot', 'matplotlib.dates', 'folium', 'folium.plugins',
+    'googlemaps', 'openai', 'google.generativeai',
+]
+STAGE_NUMBERS = range(1, 8)
+
+
+def preload(modules=PRELOAD_MODULES):
+    """載入各階段與其使用的套件，回傳 (載入的套件數, 耗時)。"""
+    import importlib
+
+    started = time.perf_counter()
+    # 常駐程序沒有顯示器，與管線相同使用不需要顯示器的後端
+    os.environ.setdefault('MPLBACKEND', 'Agg')
+    loaded = 0
+    for name in modules:
+        if module_available(name):
+            importlib.import_module(name)
+            loaded += 1
+    for number in STAGE_NUMBERS:
+        load_stage(number)
+    return loaded, time.perf_counter() - started
+
+
+def run_stage(number, argv, cwd=None):
+    """
+    在目前的程序中以命令列的方式執行階段腳本 (與 python 0X_*.py ... 相同)，回傳執行結果。
+    腳本本身每次重新執行，已載入的套件與共用模組沿用 sys.modules 中的模組。
+    工作目錄、sys.argv 與標準輸出是整個程序共用的，因此一次只執行一個工作。
+    """
+    path = stage_path(number)
+    output = io.StringIO()
+    code = 0
+    started = time.perf_counter()
+    previous_cwd, previous_argv = os.getcwd(), sys.argv
+    try:
+        os.chdir(cwd or previous_cwd)
+        sys.argv = [path, *argv]
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+            try:
+                runpy.run_path(path, run_name='__main__')
+            except SystemExit as exit_request:
+                # argparse 的錯誤與 sys.exit() 的結束碼與直接執行腳本時相同
+                if isinstance(exit_request.code, int) or exit_request.code is None:
+                    code = exit_request.code or 0
+                else:
+                    print(exit_request.code, file=sys.stderr)
+                    code = 1
+            except Exception:
+                traceback.print_exc()
+                code = 1
+    finally:
+        os.chdir(previous_cwd)
+        sys.argv = previous_argv
+    return {'code': code, 'output': output.getvalue(), 'elapsed': time.perf_counter() - started}
+
+
+def write_worker_info(path, address, authkey):
+    """記錄位址與金鑰，檔案只有擁有者可以讀取。"""
+    temporary_path = path + '.tmp'
+    descriptor = os.open(temporary_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(descriptor, 'w', encoding='utf-8') as info_file:
+        json.dump({'host': address[0], 'port': address[1], 'authkey': authkey.hex(), 'pid': os.getpid()}, info_file)
+    os.replace(temporary_path, path)
+
+
+def read_worker_info(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as info_file:
+            return json.load(info_file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def serve(info_path=WORKER_INFO_FILE, port=0, preload_modules=True):
+    """啟動常駐程序：預先載入模組後，在本機的連接埠上依序執行收到的工作，直到收到 stop。"""
+    if preload_modules:
+        loaded, elapsed = preload()
+        print(f"已預先載入 {loaded} 個套件與 {len(STAGE_NUMBERS)} 個階段，耗時 {elapsed:.2f} 秒")
+    authkey = secrets.token_bytes(32)
+    with Listener((WORKER_HOST, port), authkey=authkey) as listener:
+        write_worker_info(info_path, listener.address, authkey)
+        print(f"常駐程序已啟動 ({listener.address[0]}:{listener.address[1]}，pid {os.getpid()})", flush=True)
+        try:
+            while True:
+                try:
+                    connection = listener.accept()
+                except (OSError, EOFError) as error:
+                    # 驗證失敗或連線中斷的用戶端不影響常駐程序
+                    print(f"略過無法驗證的連線：{error}", flush=True)
+                    continue
+                with connection:
+                    try:
+                        request = connection.recv()
+                    except (EOFError, OSError) as error:
+                        # 用戶端連線後未送出工作就中斷 (例如按下 Ctrl+C)，不影響常駐程序
+                        print(f"用戶端在送出工作前中斷連線：{error!r}", flush=True)
+                        continue
+                    if request.get('command') == 'stop':
+                        with contextlib.suppress(EOFError, OSError):
+                            connection.send({'code': 0, 'output': '常駐程序已停止\n', 'elapsed': 0.0})
+                        break
+                    result = run_stage(request['stage'], request['argv'], request.get('cwd'))
+                    print(f"{int(request['stage']):02d} 階段 {' '.join(request['argv'])}：結束碼 {result['code']}，"
+                          f"{result['elapsed']:.2f} 秒", flush=True)
+                    try:
+                        connection.send(result)
+                    except (EOFError, OSError) as error:
+                        # 工作執行期間用戶端已中斷，結果無法傳回，繼續等待下一個工作
+                        print(f"用戶端已中斷連線，無法傳回結果：{error!r}", flush=True)
+        finally:
+            if os.path.exists(info_path):
+                os.remove(info_path)
+
+
+def submit(request, info_path=WORKER_INFO_FILE):
+    """將工作送給常駐程序並等待結果；沒有執行中的常駐程序時回傳 None。"""
+    info = read_worker_info(info_path)
+    if info is None:
+        return None
+    try:
+        connection = Client((info['host'], info['port']), authkey=bytes.fromhex(info['authkey']))
+    except OSError:
+        return None
+    with connection:
+        connection.send(request)
+        return connection.recv()
+
+
+class CustomArgumentParser(argparse.ArgumentParser):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+    def print_help(self, file=None):
+        # 自訂顯示的幫助訊息
+        help_message = f"""使用方法: {self.prog} [-h] serve [--port 連接埠] [--no-preload] [--info-file 檔案]
+          {self.prog} run [--info-file 檔案] 階段編號 [階段的選項 ...]
+          {self.prog} stop [--info-file 檔案]
+
+常駐程序：預先載入各階段使用的套件 (pandas、matplotlib、folium、googlemaps、LLM SDK 等)，
+在本機的連接埠上接收並依序執行階段工作，省去每次啟動 Python 與載入套件的時間。
+更新程式碼或套件後請重新啟動常駐程序。
+
+指令:
+  serve                 啟動常駐程序 (在前景執行，以 stop 或 Ctrl+C 結束)
+  run 階段編號 [選項 ...]
+                        將工作送給常駐程序，選項與直接執行該階段腳本時相同，例如
+                        {self.prog} run 03 -I event_log.txt -O chart.png
+                        沒有執行中的常駐程序時直接在目前的程序中執行
+  stop                  停止常駐程序
+
+選項:
+  -h, --help            顯示此幫助訊息並退出
+  --port PORT           serve 使用的連接埠 (預設 0 表示自動選擇)
+  --no-preload          serve 時不預先載入套件
+  --info-file INFO_FILE
+                        記錄常駐程序位址與金鑰的檔案 (預設為專案目錄中的 .stage_worker.json)
+        """
+        print(help_message, file=file)
+
+
+def main(argv=None):
+    """主函數，負責解析命令行參數並啟動、使用或停止常駐程序"""
+    parser = CustomArgumentParser(description="常駐程序")
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve_parser = commands.add_parser('serve', help="啟動常駐程序")
+    serve_parser.add_argument('--port', type=int, default=0, help="serve 使用的連接埠")
+    serve_parser.add_argument('--no-preload', action='store_true', help="serve 時不預先載入套件")
+    run_parser = commands.add_parser('run', help="將工作送給常駐程序")
+    stop_parser = commands.add_parser('stop', help="停止常駐程序")
+    for command_parser in (serve_parser, run_parser, stop_parser):
+        command_parser.add_argument('--info-file', default=WORKER_INFO_FILE, help="記錄常駐程序位址與金鑰的檔案")
+    # 階段編號之後的參數原樣傳給階段腳本
+    run_parser.add_argument('stage', type=int, choices=STAGE_NUMBERS, help="階段編號")
+    run_parser.add_argument('stage_args', nargs=argparse.REMAINDER, help="階段的選項")
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        serve(args.info_file, args.port, not args.no_preload)
+        return 0
+    if args.command == 'stop':
+        result = submit({'command': 'stop'}, args.info_file)
+        print(result['output'] if result else "沒有執行中的常駐程序", end='' if result else '\n')
+        return 0
+    request = {'command': 'run', 'stage': args.stage, 'argv': args.stage_args, 'cwd': os.getcwd()}
+    result = submit(request, args.info_file)
+    if result is None:
+        result = run_stage(args.stage, args.stage_args)
+    print(result['output'], end='')
+    return result['code']
+
+
+if __name__ == "__main__":
+    sys.exit(main())
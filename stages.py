@@ -0,0 +1,41 @@
+import glob
+import importlib.util
+import os
+import sys
+import threading
+
+# 專案根目錄，各階段腳本 (01_*.py ~ 07_*.py) 皆位於此處
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 管線會在多個執行緒中同時載入不同的階段
+_load_lock = threading.RLock()
+
+
+def stage_path(number):
+    """依階段編號 (例如 1 或 '01') 找出對應的腳本路徑。"""
+    pattern = os.path.join(ROOT_DIR, f"{int(number):02d}_*.py")
+    matches = sorted(glob.glob(pattern))
+    if not matches:
+        raise FileNotFoundError(f"找不到第 {number} 階段的腳本：{pattern}")
+    return matches[0]
+
+
+def load_stage(number):
+    """
+    載入階段腳本作為模組。
+    腳本檔名以數字開頭，無法直接 import，因此透過 importlib 依路徑載入，並快取於 sys.modules。
+    """
+    module_name = f"stage_{int(number):02d}"
+    with _load_lock:
+        if module_name in sys.modules:
+            return sys.modules[module_name]
+
+        spec = importlib.util.spec_from_file_location(module_name, stage_path(number))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        try:
+            spec.loader.exec_module(module)
+        except BaseException:
+            del sys.modules[module_name]
+            raise
+        return module